@@ -69,6 +69,12 @@ resource "aws_iam_role_policy" "lambda_s3" {
           "arn:aws:s3:::rag-web-ia-gen",
           "arn:aws:s3:::rag-web-ia-gen/*"
         ]
+      },
+      {
+        # Compactación de los deltas de la caché de embeddings (cache.S3CacheBackend)
+        Effect   = "Allow"
+        Action   = ["s3:DeleteObject"]
+        Resource = ["${aws_s3_bucket.documents.arn}/artifacts/*"]
       }
     ]
   })
@@ -85,7 +91,8 @@ resource "aws_iam_role_policy" "lambda_bedrock" {
       {
         Effect = "Allow"
         Action = [
-          "bedrock:InvokeModel"
+          "bedrock:InvokeModel",
+          "bedrock:InvokeModelWithResponseStream"
         ]
         Resource = ["arn:aws:bedrock:${var.aws_region}::foundation-model/${var.bedrock_model_id}",
         "arn:aws:bedrock:${var.aws_region}::foundation-model/${var.claude_model_id}"
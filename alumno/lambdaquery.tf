@@ -76,3 +76,70 @@ resource "aws_lambda_function_url" "consulta" {
     max_age       = 86400
   }
 }
+
+# Lambda de consulta en streaming: misma imagen de código, servida por Lambda Web
+# Adapter (run.sh → stream_server.py) para que la Function URL entregue cada
+# línea NDJSON de query.stream_events según se genera (el runtime gestionado no
+# hace response streaming con un handler Python)
+resource "aws_lambda_function" "consulta_stream" {
+  filename         = data.archive_file.lambda_zip.output_path
+  function_name    = "lambda-query-stream-${var.alumno_id}"
+  role             = aws_iam_role.lambda.arn
+  handler          = "run.sh"
+  source_code_hash = data.archive_file.lambda_zip.output_base64sha256
+  runtime          = var.lambda_runtime_query
+  timeout          = var.lambda_timeout
+  memory_size      = var.lambda_memory
+
+  layers = [
+    local.aws_sdk_pandas_layer_arn,
+    local.lambda_web_adapter_layer_arn
+  ]
+
+  vpc_config {
+    subnet_ids         = var.private_subnet_ids
+    security_group_ids = [var.lambda_security_group_id]
+  }
+
+  environment {
+    variables = {
+      STUDENT_ID              = var.alumno_id
+      S3_BUCKET               = aws_s3_bucket.documents.id
+      OPENSEARCH_ENDPOINT     = var.opensearch_endpoint
+      OPENSEARCH_INDEX        = "rag-${var.alumno_id}"
+      BEDROCK_MODEL_ID        = var.bedrock_model_id
+      AWS_LAMBDA_EXEC_WRAPPER = "/opt/bootstrap"
+      AWS_LWA_INVOKE_MODE     = "response_stream"
+      PORT                    = "8080"
+    }
+  }
+
+  tags = {
+    Name      = "rag-query-stream-${var.alumno_id}"
+    AlumnoID = var.alumno_id
+  }
+}
+
+resource "aws_cloudwatch_log_group" "lambda_query_stream" {
+  name              = "/aws/lambda/lambda-query-stream-${var.alumno_id}"
+  retention_in_days = 7
+
+  tags = {
+    Name      = "rag-query-stream-${var.alumno_id}-logs"
+    AlumnoID = var.alumno_id
+  }
+}
+
+# Function URL en modo RESPONSE_STREAM (API Gateway REST no reenvía respuestas en streaming)
+resource "aws_lambda_function_url" "consulta_stream" {
+  function_name      = aws_lambda_function.consulta_stream.function_name
+  authorization_type = "AWS_IAM"
+  invoke_mode        = "RESPONSE_STREAM"
+
+  cors {
+    allow_origins = ["*"]
+    allow_methods = ["POST"]
+    allow_headers = ["content-type"]
+    max_age       = 86400
+  }
+}
@@ -5,6 +5,10 @@ locals {
   # ARN del AWS SDK for pandas (antes AWS Data Wrangler)
   # Para Python 3.11 en us-east-1
   aws_sdk_pandas_layer_arn = "arn:aws:lambda:us-east-1:336392948345:layer:AWSSDKPandas-Python311:23"
+
+  # Lambda Web Adapter (x86_64): response streaming para lambda-query-stream
+  # Referencia: https://github.com/awslabs/aws-lambda-web-adapter
+  lambda_web_adapter_layer_arn = "arn:aws:lambda:${var.aws_region}:753240598075:layer:LambdaAdapterLayerX86:24"
 }
 
 # Crear el ZIP del Lambda Layer (solo opensearch-py y requests-aws4auth)
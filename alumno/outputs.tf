@@ -45,6 +45,11 @@ output "lambda_query_function_url" {
   value       = aws_lambda_function_url.consulta.function_url
 }
 
+output "lambda_query_stream_function_url" {
+  description = "URL de la consulta en streaming (NDJSON, invoke_mode RESPONSE_STREAM)"
+  value       = aws_lambda_function_url.consulta_stream.function_url
+}
+
 output "api_gateway_url" {
   description = "URL del API Gateway para consultas"
   value       = "${aws_api_gateway_stage.query_stage.invoke_url}/query"
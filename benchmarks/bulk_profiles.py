@@ -0,0 +1,129 @@
+"""
+Benchmark de perfiles de carga HNSW (m / ef_construction)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Para cada perfil y codificación (KNN_VECTOR_ENCODING) crea un índice temporal
+con build_index_body del indexer, carga N vectores con streaming_bulk (sin
+refresh ni réplicas), finaliza la carga (refresh + force-merge) y mide:
+    - docs/s de la carga y segundos de force-merge
+    - recall@k del kNN frente a la búsqueda exacta (numpy, distancia l2)
+    - latencia p50/p95 de las queries kNN
+
+Requiere un dominio OpenSearch real (mismas variables de entorno que el Lambda).
+
+Uso:
+    python benchmarks/bulk_profiles.py --docs 5000 --queries 100 --k 15 \\
+        --profiles 8:64,16:100,16:256,32:256 --encodings float,fp16,byte [--vectors embeddings.npy]
+
+EMBEDDING_NORMALIZE, KNN_SPACE_TYPE y KNN_BYTE_SCALE se toman del entorno, como en el indexer.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+import indexer  # noqa: E402
+from opensearchpy.helpers import streaming_bulk  # noqa: E402
+
+
+def load_vectors(path: str, docs: int, queries: int, dimension: int, seed: int):
+    """Vectores reales (.npy) o sintéticos normalizados; las queries son vectores perturbados del corpus."""
+    rng = np.random.default_rng(seed)
+    if path:
+        corpus = np.load(path).astype(np.float32)[:docs]
+    else:
+        corpus = rng.standard_normal((docs, dimension)).astype(np.float32)
+        corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    picks = rng.choice(len(corpus), size=queries, replace=False)
+    noise = rng.standard_normal((queries, corpus.shape[1])).astype(np.float32) * 0.05
+    return corpus, corpus[picks] + noise
+
+
+def exact_neighbours(corpus: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    """Top-k exacto por distancia l2 (mismo espacio que el mapping)."""
+    distances = (
+        (query_vectors ** 2).sum(axis=1, keepdims=True)
+        - 2 * query_vectors @ corpus.T
+        + (corpus ** 2).sum(axis=1)
+    )
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+def run_profile(client, m: int, ef_construction: int, corpus, query_vectors, truth, k: int, encoding: str = 'float'):
+    index_name = f"{indexer.OPENSEARCH_INDEX or 'bench'}-bench-m{m}-efc{ef_construction}-{encoding}"
+    if client.indices.exists(index=index_name):
+        client.indices.delete(index=index_name)
+    client.indices.create(index=index_name, body=indexer.build_index_body(
+        bulk_load=True, m=m, ef_construction=ef_construction, encoding=encoding))
+
+    actions = (
+        {"_index": index_name, "_id": str(i),
+         "_source": {"embedding": indexer.knn_value(vector, encoding), "original_row_index": i}}
+        for i, vector in enumerate(corpus)
+    )
+    start = time.perf_counter()
+    for _ in streaming_bulk(client, actions, chunk_size=indexer.BULK_MAX_DOCS, max_chunk_bytes=indexer.BULK_MAX_BYTES):
+        pass
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    client.indices.refresh(index=index_name)
+    client.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=1800)
+    merge_seconds = time.perf_counter() - start
+
+    latencies = []
+    hits_found = 0
+    for query_vector, expected in zip(query_vectors, truth):
+        vector = indexer.knn_value(query_vector, encoding)
+        body = {"size": k, "_source": False, "query": {"knn": {"embedding": {"vector": vector, "k": k}}}}
+        start = time.perf_counter()
+        response = client.search(index=index_name, body=body)
+        latencies.append((time.perf_counter() - start) * 1000)
+        returned = {int(hit['_id']) for hit in response['hits']['hits']}
+        hits_found += len(returned & set(expected.tolist()))
+
+    client.indices.delete(index=index_name)
+    return {
+        'm': m,
+        'ef_construction': ef_construction,
+        'encoding': encoding,
+        'docs_per_s': len(corpus) / load_seconds,
+        'merge_s': merge_seconds,
+        'recall': hits_found / (len(truth) * k),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=15)
+    parser.add_argument('--profiles', default='8:64,16:100,16:256,32:256', help='lista m:ef_construction')
+    parser.add_argument('--encodings', default=indexer.KNN_VECTOR_ENCODING, help='lista de codificaciones (float,fp16,byte)')
+    parser.add_argument('--vectors', default='', help='.npy con embeddings reales (N x dim)')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    corpus, query_vectors = load_vectors(args.vectors, args.docs, args.queries, indexer.EMBEDDING_DIMENSION, args.seed)
+    truth = exact_neighbours(corpus, query_vectors, args.k)
+
+    print(f"{'m':>4} {'ef_c':>6} {'encoding':>8} {'docs/s':>9} {'merge s':>8} {'recall@' + str(args.k):>10} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    for profile in args.profiles.split(','):
+        m, ef_construction = (int(value) for value in profile.split(':'))
+        for encoding in args.encodings.split(','):
+            r = run_profile(indexer.get_opensearch_client(), m, ef_construction, corpus, query_vectors, truth,
+                            args.k, encoding)
+            print(f"{r['m']:>4} {r['ef_construction']:>6} {r['encoding']:>8} {r['docs_per_s']:>9.1f} {r['merge_s']:>8.1f} "
+                  f"{r['recall']:>10.3f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
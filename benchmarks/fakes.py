@@ -0,0 +1,885 @@
+"""
+Dobles locales de Bedrock, S3 y OpenSearch para benchmarks offline
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+install() parchea boto3.client, boto3.Session y el __init__ de
+opensearchpy.RequestsHttpConnection. Hay que llamarlo ANTES de importar
+lambda/indexer.py o lambda/query.py. Ambos comparten el mismo cluster en
+memoria (lo que indexa el indexer lo consulta query).
+
+El doble de OpenSearch está a nivel HTTP: el cliente OpenSearch de
+layer/python con el serializer, la conexión y el transporte de
+lambda/opensearch_client.py (compresión, firma SigV4, métricas y decodificación
+de respuestas incluidas) son los reales; sólo el envío de la request se
+resuelve con un adaptador de requests contra el servidor en memoria.
+
+    - FakeBedrock: embeddings deterministas (feature hashing de tokens: mismo
+      texto → mismo vector, textos con palabras comunes → vectores cercanos) y
+      respuestas de Claude construidas con las apps del contexto del prompt.
+    - FakeS3: objetos en memoria (CSV a reproducir, endpoints, artefactos).
+    - FakeOpenSearch: servidor en memoria con búsqueda exacta (kNN por escaneo
+      l2 completo, BM25 simplificado por solapamiento de tokens, filtros term,
+      aggs cardinality/terms), bulk NDJSON, scroll, alias y _meta.
+
+Las llamadas a cada servicio se registran por etapa en un Recorder (en
+OpenSearch, el tiempo del lado del servidor). Los helpers de opensearchpy
+(streaming_bulk, scan) también son los reales.
+"""
+
+import fnmatch
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# opensearchpy (con el serializer y las métricas del proyecto) sale de la capa
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'layer', 'python'))
+
+
+# ==================== MÉTRICAS ====================
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+class Recorder:
+    """Duraciones por etapa (thread-safe)."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def wrap(self, module: Any, name: str, stage: Optional[str] = None) -> None:
+        """Sustituye module.name por una versión cronometrada (las llamadas internas del módulo la usan)."""
+        original = getattr(module, name)
+        stage = stage or f"{module.__name__}.{name}"
+
+        def timed(*args, **kwargs):
+            with self.timer(stage):
+                return original(*args, **kwargs)
+
+        timed.__wrapped__ = original
+        setattr(module, name, timed)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.samples.clear()
+
+    def summary(self, prefix: str = '') -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self.samples.items() if k.startswith(prefix))
+        return {
+            stage: {
+                'calls': len(values),
+                'total_s': sum(values),
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+            }
+            for stage, values in items
+        }
+
+
+# ==================== BEDROCK ====================
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+class FakeBedrock:
+    """bedrock-runtime: Titan (inputText → embedding) y Claude (messages → JSON de respuesta)."""
+
+    def __init__(self, recorder: Recorder, dimension: int = 1536, embed_latency: float = 0.0,
+                 generate_latency: float = 0.0, stream_chunks: int = 20):
+        self.recorder = recorder
+        self.dimension = dimension
+        self.embed_latency = embed_latency
+        self.generate_latency = generate_latency
+        self.stream_chunks = max(1, stream_chunks)
+
+    # ---------- Titan ----------
+    def embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    # ---------- Claude ----------
+    def answer_text(self, prompt: str) -> str:
+        if '"answer_type": "conversational"' in prompt:
+            return json.dumps({
+                "answer_type": "conversational",
+                "message": "¡Hola! Soy tu asistente de aplicaciones BBVA.",
+                "suggestions": ["¿Qué aplicaciones críticas tiene Colombia?"],
+                "show_examples": True
+            }, ensure_ascii=False)
+        context = prompt.split('<context>', 1)[-1].split('</context>', 1)[0]
+        # Tabla de build_context: cabecera 'Nombre | País | ...' y una fila por aplicación
+        lines = [line for line in context.strip().splitlines() if '|' in line or line.strip()]
+        names = [line.split('|', 1)[0].strip() for line in lines[1:]] if lines[:1] and lines[0].startswith('Nombre') else []
+        applications = [
+            {"name": name.strip(), "country": "N/A", "criticality": "N/A", "status": "N/A",
+             "deploy": "N/A", "score": 0, "highlights": [f"Coincide con la consulta ({rank})"]}
+            for rank, name in enumerate(names, 1)
+        ]
+        return json.dumps({
+            "answer_type": "success",
+            "summary": f"Encontré {len(applications)} aplicaciones relevantes.",
+            "total_found": len(applications),
+            "applications": applications,
+            "insights": ["Respuesta generada por FakeBedrock"],
+            "filters_applied": {},
+            "has_more": False,
+            "page": 1,
+            "page_size": len(applications)
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def _prompt(payload: Dict) -> str:
+        return ''.join(
+            part.get('text', '')
+            for message in payload.get('messages', [])
+            for part in message.get('content', [])
+        )
+
+    def invoke_model(self, body, modelId, accept=None, contentType=None, **kwargs):
+        payload = json.loads(body)
+        if 'inputText' in payload:
+            with self.recorder.timer('bedrock.embed'):
+                time.sleep(self.embed_latency)
+                result = {"embedding": self.embed(payload['inputText']),
+                          "inputTextTokenCount": len(payload['inputText']) // 4}
+        else:
+            with self.recorder.timer('bedrock.generate'):
+                time.sleep(self.generate_latency)
+                prompt = self._prompt(payload)
+                text = self.answer_text(prompt)
+                result = {"content": [{"type": "text", "text": text}],
+                          "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}}
+        return {'body': io.BytesIO(json.dumps(result).encode('utf-8'))}
+
+    def invoke_model_with_response_stream(self, body, modelId, accept=None, contentType=None, **kwargs):
+        prompt = self._prompt(json.loads(body))
+        text = self.answer_text(prompt)
+        return {'body': self._stream_events(prompt, text)}
+
+    def _stream_events(self, prompt: str, text: str) -> Iterator[Dict]:
+        def event(data: Dict) -> Dict:
+            return {'chunk': {'bytes': json.dumps(data).encode('utf-8')}}
+
+        start = time.perf_counter()
+        step = -(-len(text) // self.stream_chunks)
+        yield event({"type": "message_start", "message": {"usage": {"input_tokens": len(prompt) // 4}}})
+        for offset in range(0, len(text), step):
+            time.sleep(self.generate_latency / self.stream_chunks)
+            yield event({"type": "content_block_delta", "index": 0,
+                         "delta": {"type": "text_delta", "text": text[offset:offset + step]}})
+        yield event({"type": "message_delta", "usage": {"output_tokens": len(text) // 4}})
+        yield event({"type": "message_stop"})
+        self.recorder.add('bedrock.generate_stream', time.perf_counter() - start)
+
+
+# ==================== S3 ====================
+class FakeS3:
+    """Objetos en memoria por (bucket, key)."""
+
+    def __init__(self, recorder: Recorder):
+        self.recorder = recorder
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+
+    def _missing(self, bucket: str, key: str):
+        from botocore.exceptions import ClientError
+        return ClientError({'Error': {'Code': 'NoSuchKey', 'Message': f's3://{bucket}/{key}'}}, 'GetObject')
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        with self.recorder.timer('s3.put_object'):
+            self.objects[(Bucket, Key)] = Body.encode('utf-8') if isinstance(Body, str) else bytes(Body)
+        return {'ETag': hashlib.md5(self.objects[(Bucket, Key)]).hexdigest()}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self.recorder.timer('s3.get_object'):
+            if (Bucket, Key) not in self.objects:
+                raise self._missing(Bucket, Key)
+            data = self.objects[(Bucket, Key)]
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        with self.recorder.timer('s3.head_object'):
+            if (Bucket, Key) not in self.objects:
+                raise self._missing(Bucket, Key)
+            data = self.objects[(Bucket, Key)]
+        return {'ETag': f'"{hashlib.md5(data).hexdigest()}"', 'ContentLength': len(data)}
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        with self.recorder.timer('s3.list_objects_v2'):
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        return {'Contents': [{'Key': key, 'Size': len(self.objects[(Bucket, key)])} for key in keys],
+                'KeyCount': len(keys), 'IsTruncated': False}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        with self.recorder.timer('s3.delete_objects'):
+            for item in Delete['Objects']:
+                self.objects.pop((Bucket, item['Key']), None)
+        return {'Deleted': [{'Key': item['Key']} for item in Delete['Objects']]}
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise self._missing(Bucket, Key)
+        with open(Filename, 'wb') as f:
+            f.write(self.objects[(Bucket, Key)])
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            self.objects[(Bucket, Key)] = f.read()
+
+
+# ==================== OPENSEARCH ====================
+SHARDS = {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}
+
+def _field_value(source: Dict, field: str) -> Any:
+    """Valor de un campo con notación de puntos ('metadata.country', '.keyword' se ignora)."""
+    if field.endswith('.keyword'):
+        field = field[:-len('.keyword')]
+    value = source
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _tokens(value: Any) -> set:
+    return set(TOKEN_PATTERN.findall(str(value).lower())) if value is not None else set()
+
+
+def _filter_source(source: Dict, includes) -> Optional[Dict]:
+    if includes is False:
+        return None
+    if includes is None or includes is True:
+        return source
+    if isinstance(includes, str):
+        includes = [includes]
+    filtered: Dict = {}
+    for path in includes:
+        value = _field_value(source, path)
+        if value is None:
+            continue
+        target = filtered
+        parts = path.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return filtered
+
+
+class FakeIndex:
+    def __init__(self, name: str, body: Optional[Dict] = None):
+        self.name = name
+        body = body or {}
+        self.settings = dict(body.get('settings', {}))
+        self.mappings = dict(body.get('mappings', {}))
+        self.aliases: set = set()
+        self.docs: Dict[str, Dict] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[str] = []
+        self._analysis: Dict[str, Dict[Tuple[str, str], Any]] = {}
+
+    def put(self, doc_id: str, source: Dict) -> str:
+        result = 'updated' if doc_id in self.docs else 'created'
+        self.docs[doc_id] = source
+        self._matrix = None
+        self._analysis.pop(doc_id, None)
+        return result
+
+    def delete(self, doc_id: str) -> bool:
+        self._matrix = None
+        self._analysis.pop(doc_id, None)
+        return self.docs.pop(doc_id, None) is not None
+
+    def _analyzed(self, doc_id: str, kind: str, field: str):
+        """Tokens / frase normalizada de un campo, calculados una vez por documento."""
+        cache = self._analysis.setdefault(doc_id, {})
+        key = (kind, field)
+        if key not in cache:
+            value = _field_value(self.docs[doc_id], field)
+            cache[key] = _tokens(value) if kind == 'tokens' else \
+                ' '.join(TOKEN_PATTERN.findall(str(value or '').lower()))
+        return cache[key]
+
+    def tokens(self, doc_id: str, field: str) -> set:
+        return self._analyzed(doc_id, 'tokens', field)
+
+    def phrase(self, doc_id: str, field: str) -> str:
+        return self._analyzed(doc_id, 'phrase', field)
+
+    def vectors(self, field: str) -> Tuple[List[str], np.ndarray]:
+        """Matriz de vectores (se reconstruye sólo tras escrituras)."""
+        if self._matrix is None:
+            ids, rows = [], []
+            for doc_id, source in self.docs.items():
+                vector = _field_value(source, field)
+                if vector is not None:
+                    ids.append(doc_id)
+                    rows.append(vector)
+            self._matrix_ids = ids
+            self._matrix = np.asarray(rows, dtype=np.float32).reshape(len(rows), -1)
+        return self._matrix_ids, self._matrix
+
+
+class FakeCluster:
+    """Estado compartido por todos los FakeOpenSearch de un proceso."""
+
+    def __init__(self):
+        self.indices: Dict[str, FakeIndex] = {}
+        self.scrolls: Dict[str, List[Dict]] = {}
+        self.lock = threading.RLock()
+        self._scroll_ids = itertools.count(1)
+
+    def resolve(self, index: Optional[str]) -> List[str]:
+        if index is None or index in ('_all', '*'):
+            return list(self.indices)
+        names = []
+        for part in str(index).split(','):
+            if part in self.indices:
+                names.append(part)
+                continue
+            aliased = [name for name, idx in self.indices.items() if part in idx.aliases]
+            matched = aliased or [name for name in self.indices if '*' in part and fnmatch.fnmatch(name, part)]
+            names.extend(matched)
+        return names
+
+
+class FakeIndicesClient:
+    def __init__(self, client: 'FakeOpenSearch'):
+        self.client = client
+        self.cluster = client.cluster
+
+    def _not_found(self, index):
+        from opensearchpy.exceptions import NotFoundError
+        return NotFoundError(404, 'index_not_found_exception', {'index': index})
+
+    def exists(self, index, **kwargs) -> bool:
+        return bool(self.cluster.resolve(index))
+
+    def create(self, index, body=None, **kwargs):
+        with self.cluster.lock:
+            if index in self.cluster.indices:
+                from opensearchpy.exceptions import RequestError
+                raise RequestError(400, 'resource_already_exists_exception', {'index': index})
+            self.cluster.indices[index] = FakeIndex(index, body)
+        return {'acknowledged': True, 'index': index}
+
+    def delete(self, index, **kwargs):
+        with self.cluster.lock:
+            names = self.cluster.resolve(index)
+            if not names:
+                raise self._not_found(index)
+            for name in names:
+                del self.cluster.indices[name]
+        return {'acknowledged': True}
+
+    def get(self, index, **kwargs):
+        return {name: {'settings': self.cluster.indices[name].settings,
+                       'mappings': self.cluster.indices[name].mappings,
+                       'aliases': {alias: {} for alias in self.cluster.indices[name].aliases}}
+                for name in self.cluster.resolve(index)}
+
+    def refresh(self, index=None, **kwargs):
+        return {'_shards': {'successful': len(self.cluster.resolve(index))}}
+
+    def forcemerge(self, index=None, **kwargs):
+        return {'_shards': {'successful': len(self.cluster.resolve(index))}}
+
+    def put_settings(self, body, index=None, **kwargs):
+        for name in self.cluster.resolve(index):
+            self.cluster.indices[name].settings.update(body.get('index', body))
+        return {'acknowledged': True}
+
+    def get_settings(self, index=None, **kwargs):
+        return {name: {'settings': self.cluster.indices[name].settings} for name in self.cluster.resolve(index)}
+
+    def put_mapping(self, body, index=None, **kwargs):
+        for name in self.cluster.resolve(index):
+            mappings = self.cluster.indices[name].mappings
+            for key, value in body.items():
+                if isinstance(value, dict) and isinstance(mappings.get(key), dict):
+                    mappings[key] = {**mappings[key], **value}
+                else:
+                    mappings[key] = value
+        return {'acknowledged': True}
+
+    def get_mapping(self, index=None, **kwargs):
+        names = self.cluster.resolve(index)
+        if not names:
+            raise self._not_found(index)
+        return {name: {'mappings': self.cluster.indices[name].mappings} for name in names}
+
+    def exists_alias(self, name, index=None, **kwargs) -> bool:
+        return any(name in idx.aliases for idx in self.cluster.indices.values())
+
+    def get_alias(self, name=None, index=None, **kwargs):
+        result = {idx.name: {'aliases': {alias: {} for alias in idx.aliases if name in (None, alias)}}
+                  for idx in self.cluster.indices.values()
+                  if name is None or name in idx.aliases}
+        if not result:
+            raise self._not_found(name)
+        return result
+
+    def update_aliases(self, body, **kwargs):
+        with self.cluster.lock:
+            for action in body.get('actions', []):
+                (kind, spec), = action.items()
+                if kind == 'add':
+                    self.cluster.indices[spec['index']].aliases.add(spec['alias'])
+                elif kind == 'remove':
+                    self.cluster.indices[spec['index']].aliases.discard(spec['alias'])
+                elif kind == 'remove_index':
+                    self.cluster.indices.pop(spec['index'], None)
+        return {'acknowledged': True}
+
+
+class FakeOpenSearch:
+    """Cliente OpenSearch en memoria con búsqueda exacta y latencia configurable por request."""
+
+    def __init__(self, cluster: FakeCluster, recorder: Recorder, search_latency: float = 0.0,
+                 bulk_latency: float = 0.0, **kwargs):
+        self.cluster = cluster
+        self.recorder = recorder
+        self.search_latency = search_latency
+        self.bulk_latency = bulk_latency
+        self.indices = FakeIndicesClient(self)
+
+    # ---------- Escritura ----------
+    def bulk(self, body, index=None, **kwargs):
+        with self.recorder.timer('opensearch.bulk'):
+            time.sleep(self.bulk_latency)
+            if isinstance(body, bytes):
+                body = body.decode('utf-8')
+            lines = body if isinstance(body, list) else body.splitlines()
+            items, errors = [], False
+            iterator = iter(line for line in lines if line.strip())
+            with self.cluster.lock:
+                for line in iterator:
+                    (op, meta), = json.loads(line).items()
+                    name = meta.get('_index', index)
+                    doc_id = str(meta.get('_id'))
+                    target = self.cluster.indices.get(name)
+                    if target is None:
+                        resolved = self.cluster.resolve(name)
+                        target = self.cluster.indices[resolved[0]] if resolved else \
+                            self.cluster.indices.setdefault(name, FakeIndex(name))
+                    if op == 'delete':
+                        found = target.delete(doc_id)
+                        item = {'_index': target.name, '_id': doc_id, 'status': 200 if found else 404,
+                                'result': 'deleted' if found else 'not_found'}
+                    else:
+                        result = target.put(doc_id, json.loads(next(iterator)))
+                        item = {'_index': target.name, '_id': doc_id,
+                                'status': 201 if result == 'created' else 200, 'result': result}
+                    errors = errors or item['status'] >= 300
+                    items.append({op: item})
+        return {'took': 0, 'errors': errors, 'items': items}
+
+    def delete_by_query(self, index, body, **kwargs):
+        with self.cluster.lock:
+            matched = self._evaluate(self.cluster.resolve(index), body.get('query', {'match_all': {}}))
+            for name, doc_id in matched:
+                self.cluster.indices[name].delete(doc_id)
+        return {'deleted': len(matched)}
+
+    # ---------- Lectura ----------
+    def search(self, body=None, index=None, scroll=None, size=None, **kwargs):
+        with self.recorder.timer('opensearch.search'):
+            time.sleep(self.search_latency)
+            return self._search(index, body or {}, scroll, size)
+
+    def msearch(self, body, index=None, **kwargs):
+        if isinstance(body, (str, bytes)):
+            body = [json.loads(line) for line in (body.decode() if isinstance(body, bytes) else body).splitlines() if line.strip()]
+        with self.recorder.timer('opensearch.msearch'):
+            time.sleep(self.search_latency)
+            responses = []
+            for header, search_body in zip(body[::2], body[1::2]):
+                responses.append(self._search(header.get('index', index), search_body, None, None))
+        return {'responses': responses}
+
+    def count(self, body=None, index=None, **kwargs):
+        query = (body or {}).get('query', {'match_all': {}})
+        return {'count': len(self._evaluate(self.cluster.resolve(index), query))}
+
+    def scroll(self, body=None, scroll_id=None, **kwargs):
+        with self.recorder.timer('opensearch.scroll'):
+            time.sleep(self.search_latency)
+            scroll_id = scroll_id or body['scroll_id']
+            pending = self.cluster.scrolls.get(scroll_id, [])
+            page, self.cluster.scrolls[scroll_id] = pending[:self._scroll_size(scroll_id)], pending[self._scroll_size(scroll_id):]
+        return {'_scroll_id': scroll_id, '_shards': SHARDS,
+                'hits': {'hits': page, 'total': {'value': len(page), 'relation': 'eq'}}}
+
+    def clear_scroll(self, body=None, scroll_id=None, **kwargs):
+        ids = scroll_id or (body or {}).get('scroll_id', [])
+        for sid in ([ids] if isinstance(ids, str) else ids):
+            self.cluster.scrolls.pop(sid, None)
+        return {'succeeded': True}
+
+    @staticmethod
+    def _scroll_size(scroll_id: str) -> int:
+        return int(scroll_id.split(':', 1)[0])
+
+    def _search(self, index, body: Dict, scroll, size) -> Dict:
+        start = time.perf_counter()
+        names = self.cluster.resolve(index)
+        if index and not names:
+            from opensearchpy.exceptions import NotFoundError
+            raise NotFoundError(404, 'index_not_found_exception', {'index': index})
+        size = body.get('size', 10) if size is None else size
+        with self.cluster.lock:
+            scores = self._evaluate(names, body.get('query', {'match_all': {}}))
+            ranked = sorted(scores.items(), key=lambda item: -item[1])
+            hits = [
+                {'_index': name, '_id': doc_id, '_score': score,
+                 **({'_source': src} if (src := _filter_source(self.cluster.indices[name].docs[doc_id],
+                                                                body.get('_source'))) is not None else {})}
+                for (name, doc_id), score in ranked
+            ]
+            aggregations = self._aggregations(body.get('aggs') or body.get('aggregations') or {}, [
+                self.cluster.indices[name].docs[doc_id] for name, doc_id in scores
+            ])
+        response = {
+            'took': int((time.perf_counter() - start) * 1000),
+            'timed_out': False,
+            '_shards': SHARDS,
+            'hits': {'total': {'value': len(hits), 'relation': 'eq'},
+                     'max_score': hits[0]['_score'] if hits else None,
+                     'hits': hits[:size]},
+        }
+        if aggregations:
+            response['aggregations'] = aggregations
+        if scroll:
+            scroll_id = f"{size}:{next(self.cluster._scroll_ids)}"
+            self.cluster.scrolls[scroll_id] = hits[size:]
+            response['_scroll_id'] = scroll_id
+        return response
+
+    # ---------- Query DSL (subconjunto que usan los Lambdas) ----------
+    def _evaluate(self, names: List[str], query: Dict) -> Dict[Tuple[str, str], float]:
+        (kind, spec), = query.items()
+        docs = [(name, doc_id, source) for name in names
+                for doc_id, source in self.cluster.indices[name].docs.items()]
+
+        if kind == 'match_all':
+            return {(name, doc_id): 1.0 for name, doc_id, _ in docs}
+
+        if kind == 'bool':
+            return self._bool(names, docs, spec)
+
+        if kind == 'knn':
+            (field, params), = spec.items()
+            allowed = self._evaluate(names, params['filter']) if params.get('filter') else None
+            scores = {}
+            for name in names:
+                ids, matrix = self.cluster.indices[name].vectors(field)
+                if not ids:
+                    continue
+                vector = np.asarray(params['vector'], dtype=np.float32)
+                mapping = self.cluster.indices[name].mappings.get('properties', {}).get(field, {})
+                if mapping.get('method', {}).get('space_type') == 'innerproduct':
+                    distances = -(matrix @ vector)
+                    score = lambda d: 1.0 - d if d <= 0 else 1.0 / (1.0 + d)
+                else:
+                    distances = ((matrix - vector) ** 2).sum(axis=1)
+                    score = lambda d: 1.0 / (1.0 + d)
+                for position in np.argsort(distances):
+                    key = (name, ids[position])
+                    if allowed is not None and key not in allowed:
+                        continue
+                    scores[key] = float(score(distances[position])) * params.get('boost', 1.0)
+                    if len(scores) >= params.get('k', 10):
+                        break
+            return dict(sorted(scores.items(), key=lambda item: -item[1])[:params.get('k', 10)])
+
+        if kind in ('term', 'terms'):
+            (field, value), = ((k, v) for k, v in spec.items() if k != 'boost')
+            boost = spec.get('boost', 1.0)
+            if kind == 'term' and isinstance(value, dict):
+                boost, value = value.get('boost', 1.0), value['value']
+            values = value if kind == 'terms' else [value]
+            return {(name, doc_id): boost for name, doc_id, source in docs
+                    if _field_value(source, field) in values}
+
+        if kind in ('match', 'match_phrase'):
+            (field, value), = spec.items()
+            text, boost = (value.get('query'), value.get('boost', 1.0)) if isinstance(value, dict) else (value, 1.0)
+            scores = {}
+            if kind == 'match':
+                query_tokens = _tokens(text)
+                for name, doc_id, source in docs:
+                    overlap = len(query_tokens & self.cluster.indices[name].tokens(doc_id, field))
+                    if overlap:
+                        scores[(name, doc_id)] = overlap * boost
+            else:
+                phrase = ' '.join(TOKEN_PATTERN.findall(str(text).lower()))
+                for name, doc_id, source in docs:
+                    if phrase and phrase in self.cluster.indices[name].phrase(doc_id, field):
+                        scores[(name, doc_id)] = boost
+            return scores
+
+        if kind == 'multi_match':
+            query_tokens = _tokens(spec['query'])
+            boost = spec.get('boost', 1.0)
+            fields = [(f.split('^')[0], float(f.split('^')[1]) if '^' in f else 1.0) for f in spec['fields']]
+            scores = {}
+            for name, doc_id, source in docs:
+                index = self.cluster.indices[name]
+                best = max(len(query_tokens & index.tokens(doc_id, field)) * weight for field, weight in fields)
+                if best:
+                    scores[(name, doc_id)] = best * boost
+            return scores
+
+        raise ValueError(f"Query no soportada por FakeOpenSearch: {kind}")
+
+    def _bool(self, names, docs, spec: Dict) -> Dict[Tuple[str, str], float]:
+        def clauses(key):
+            value = spec.get(key, [])
+            return value if isinstance(value, list) else [value]
+
+        candidates = {(name, doc_id) for name, doc_id, _ in docs}
+        scores = defaultdict(float)
+        for clause in clauses('filter'):
+            candidates &= set(self._evaluate(names, clause))
+        for clause in clauses('must'):
+            matched = self._evaluate(names, clause)
+            candidates &= set(matched)
+            for key, score in matched.items():
+                scores[key] += score
+        for clause in clauses('must_not'):
+            candidates -= set(self._evaluate(names, clause))
+
+        should = clauses('should')
+        required = spec.get('minimum_should_match', 0 if (spec.get('must') or spec.get('filter')) else 1)
+        matches = defaultdict(int)
+        for clause in should:
+            for key, score in self._evaluate(names, clause).items():
+                if key in candidates:
+                    scores[key] += score
+                    matches[key] += 1
+        if should and required:
+            candidates = {key for key in candidates if matches[key] >= int(required)}
+        return {key: scores[key] for key in candidates}
+
+    @staticmethod
+    def _aggregations(aggs: Dict, sources: List[Dict]) -> Dict:
+        result = {}
+        for name, spec in aggs.items():
+            if 'cardinality' in spec:
+                values = {json.dumps(_field_value(s, spec['cardinality']['field']), sort_keys=True) for s in sources}
+                values.discard('null')
+                result[name] = {'value': len(values)}
+            elif 'terms' in spec:
+                counts = defaultdict(int)
+                for s in sources:
+                    value = _field_value(s, spec['terms']['field'])
+                    if value is not None:
+                        counts[value] += 1
+                buckets = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+                result[name] = {'buckets': [{'key': k, 'doc_count': c} for k, c in buckets[:spec['terms'].get('size', 10)]]}
+            else:
+                raise ValueError(f"Aggregation no soportada por FakeOpenSearch: {list(spec)}")
+        return result
+
+
+# ==================== HTTP ====================
+def _error(exc) -> Tuple[int, Dict]:
+    return exc.status_code, {'error': {'type': exc.error, **(exc.info or {})}, 'status': exc.status_code}
+
+
+def _ndjson(body: str) -> List[Dict]:
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+
+def route(server: FakeOpenSearch, method: str, path: str, params: Dict[str, str], body: str) -> Tuple[int, Any]:
+    """
+    Resuelve una request REST contra el servidor en memoria: (status, cuerpo JSON).
+    Cubre los endpoints que usan el cliente y los helpers de opensearchpy en los Lambdas.
+    """
+    from opensearchpy.exceptions import TransportError
+
+    parts = [part for part in path.split('/') if part]
+    ndjson = parts[-1:] in (['_bulk'], ['_msearch'])
+    document = json.loads(body) if body and not ndjson else None
+    size = int(params['size']) if 'size' in params else None
+    indices = server.indices
+    try:
+        if parts == ['_search', 'scroll']:
+            if method == 'DELETE':
+                return 200, server.clear_scroll(body=document)
+            return 200, server.scroll(body=document, scroll_id=params.get('scroll_id'))
+        if parts == ['_aliases']:
+            return 200, indices.update_aliases(document)
+        if parts[:1] == ['_alias']:
+            name = parts[1] if len(parts) > 1 else None
+            if method == 'HEAD':
+                return (200 if indices.exists_alias(name) else 404), None
+            return 200, indices.get_alias(name)
+
+        index = parts[0] if parts and not parts[0].startswith('_') else None
+        rest = parts[1:] if index else parts
+        action = rest[0] if rest else None
+        if action == '_bulk':
+            return 200, server.bulk(body, index=index)
+        if action == '_msearch':
+            return 200, server.msearch(_ndjson(body), index=index)
+        if action == '_search':
+            return 200, server.search(body=document, index=index, scroll=params.get('scroll'), size=size)
+        if action == '_count':
+            return 200, server.count(body=document, index=index)
+        if action == '_delete_by_query':
+            return 200, server.delete_by_query(index, document)
+        if action == '_refresh':
+            return 200, indices.refresh(index)
+        if action == '_forcemerge':
+            return 200, indices.forcemerge(index)
+        if action == '_settings':
+            return 200, indices.put_settings(document, index) if method == 'PUT' else indices.get_settings(index)
+        if action == '_mapping':
+            return 200, indices.put_mapping(document, index) if method == 'PUT' else indices.get_mapping(index)
+        if index and action is None:
+            if method == 'HEAD':
+                return (200 if indices.exists(index) else 404), None
+            if method == 'PUT':
+                return 200, indices.create(index, body=document)
+            if method == 'DELETE':
+                return 200, indices.delete(index)
+            if method == 'GET':
+                return 200, indices.get(index)
+    except TransportError as e:
+        return _error(e)
+    return 400, {'error': {'type': 'unsupported_request', 'reason': f"{method} {path}"}, 'status': 400}
+
+
+def make_adapter(server: FakeOpenSearch):
+    """
+    Adaptador de requests que responde con el servidor en memoria en lugar de
+    abrir un socket. Todo lo anterior al envío (serializer, gzip, firma SigV4,
+    métricas) y la decodificación de la respuesta (text/bytes/stream) son el
+    código real de RequestsHttpConnection.
+    """
+    import gzip
+    from urllib.parse import parse_qsl, urlsplit
+
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    class FakeOpenSearchAdapter(requests.adapters.BaseAdapter):
+        def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+            url = urlsplit(request.url)
+            body = request.body or b''
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            if request.headers.get('content-encoding') == 'gzip':
+                body = gzip.decompress(body)
+            status, payload = route(server, request.method, url.path, dict(parse_qsl(url.query)),
+                                    body.decode('utf-8'))
+            data = b'' if payload is None or request.method == 'HEAD' else json.dumps(payload).encode('utf-8')
+            response = requests.Response()
+            response.status_code = status
+            response.headers = CaseInsensitiveDict({'content-type': 'application/json; charset=UTF-8',
+                                                    'content-length': str(len(data))})
+            response.raw = io.BytesIO(data)
+            response.url = request.url
+            response.request = request
+            response.reason = 'OK' if status < 300 else 'Error'
+            return response
+
+        def close(self):
+            pass
+
+    return FakeOpenSearchAdapter()
+
+
+# ==================== INSTALACIÓN ====================
+class FakeServices:
+    """Conjunto de dobles instalados; expone recorder, s3, bedrock, el cluster y su servidor OpenSearch."""
+
+    def __init__(self, recorder, bedrock, s3, cluster, opensearch_kwargs):
+        self.recorder = recorder
+        self.bedrock = bedrock
+        self.s3 = s3
+        self.cluster = cluster
+        self.opensearch = FakeOpenSearch(cluster, recorder, **opensearch_kwargs)
+
+
+def install(embed_latency: float = 0.0, generate_latency: float = 0.0, search_latency: float = 0.0,
+            bulk_latency: float = 0.0, dimension: int = 1536, stream_chunks: int = 20) -> FakeServices:
+    """
+    Parchea boto3 y opensearchpy para que los Lambdas usen los dobles en memoria.
+    Latencias en segundos por llamada (Claude en streaming las reparte entre fragmentos).
+    """
+    import boto3
+    import opensearchpy
+    from botocore.credentials import Credentials
+
+    recorder = Recorder()
+    services = FakeServices(
+        recorder,
+        FakeBedrock(recorder, dimension, embed_latency, generate_latency, stream_chunks),
+        FakeS3(recorder),
+        FakeCluster(),
+        {'search_latency': search_latency, 'bulk_latency': bulk_latency},
+    )
+
+    def client(service_name, *args, **kwargs):
+        if service_name == 'bedrock-runtime':
+            return services.bedrock
+        if service_name == 's3':
+            return services.s3
+        raise ValueError(f"Servicio sin doble local: {service_name}")
+
+    class Session:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def get_credentials(self):
+            return Credentials('fake-access-key', 'fake-secret-key')
+
+        def client(self, service_name, *args, **kwargs):
+            return client(service_name)
+
+    boto3.client = client
+    boto3.Session = Session
+    # Se parchea el __init__ de la clase (no se sustituye) para que también lo
+    # hereden sus subclases, como LambdaHttpConnection de lambda/opensearch_client.py
+    connection_init = opensearchpy.RequestsHttpConnection.__init__
+
+    def mount_fake_adapter(self, *args, **kwargs):
+        connection_init(self, *args, **kwargs)
+        adapter = make_adapter(services.opensearch)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    opensearchpy.RequestsHttpConnection.__init__ = mount_fake_adapter
+    return services
@@ -0,0 +1,198 @@
+"""
+Benchmark de kNN filtrado (KNN_FILTER_MODE / KNN_FILTERED_EXACT_THRESHOLD)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Construye en memoria un grafo de vecinos como la capa 0 del HNSW de faiss
+(--m vecinos por nodo, aristas inversas incluidas) sobre --docs vectores
+sintéticos con metadata de portafolio (país y criticidad con distribución
+sesgada), y compara para filtros de distinta selectividad:
+    - post:      kNN sobre todo el grafo con k = top_k * 3 y filtro después
+                 (bool.filter exterior, comportamiento v6)
+    - efficient: filtro dentro del knn; la búsqueda recorre el grafo completo
+                 pero sólo acepta como resultado los docs que cumplen el filtro
+                 (filtrado de faiss durante el recorrido)
+    - exact:     fuerza bruta sobre los docs filtrados (script_score / el
+                 fallback exacto del plugin k-NN)
+    - auto:      exact si los docs filtrados <= --exact-threshold, si no
+                 efficient (index.knn.advanced.filtered_exact_search_threshold)
+Imprime recall@top_k frente al top_k exacto filtrado, resultados devueltos,
+distancias calculadas por query (el coste que domina en el clúster,
+independiente del lenguaje) y ms por query de esta implementación en numpy.
+
+Uso:
+    python benchmarks/filtered_knn.py --docs 20000 --dimension 128 --queries 100 --exact-threshold 5000
+"""
+
+import argparse
+import heapq
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+COUNTRIES = ('Perú', 'Colombia', 'Chile', 'México', 'Ecuador', 'Panamá', 'Uruguay', 'Bolivia')
+COUNTRY_WEIGHTS = (0.40, 0.22, 0.14, 0.10, 0.06, 0.04, 0.025, 0.015)
+CRITICALITIES = ('Bajo', 'Medio', 'Crítico', 'Muy Crítico')
+CRITICALITY_WEIGHTS = (0.35, 0.35, 0.22, 0.08)
+
+# Filtros de query.py (build_filter_clauses) de menos a más selectivos
+FILTERS = [
+    {},
+    {'country': 'Perú'},
+    {'country': 'Chile'},
+    {'critic_name': 'Muy Crítico'},
+    {'country': 'Ecuador'},
+    {'country': 'Chile', 'critic_name': 'Muy Crítico'},
+    {'country': 'Uruguay', 'critic_name': 'Crítico'},
+    {'country': 'Bolivia', 'critic_name': 'Muy Crítico'},
+]
+
+
+# ==================== DATOS ====================
+def make_corpus(docs: int, dimension: int, seed: int = 0) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Vectores agrupados (como los de descripciones de aplicaciones) y metadata independiente de ellos."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 1, (max(docs // 200, 8), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), docs)] + rng.normal(0, 0.6, (docs, dimension)).astype(np.float32)
+    metadata = {
+        'country': rng.choice(len(COUNTRIES), docs, p=COUNTRY_WEIGHTS),
+        'critic_name': rng.choice(len(CRITICALITIES), docs, p=CRITICALITY_WEIGHTS),
+    }
+    return vectors, metadata
+
+
+def filter_mask(metadata: Dict[str, np.ndarray], filters: Dict) -> Optional[np.ndarray]:
+    values = {'country': COUNTRIES, 'critic_name': CRITICALITIES}
+    mask = None
+    for field, value in filters.items():
+        matched = metadata[field] == values[field].index(value)
+        mask = matched if mask is None else mask & matched
+    return mask
+
+
+# ==================== GRAFO ====================
+class Graph:
+    """
+    Capa 0 de un HNSW: lista de vecinos por nodo y búsqueda voraz con ef candidatos.
+    
+    Las capas superiores se resumen en una muestra de nodos de entrada (el más
+    cercano a la query arranca la búsqueda) y m // 4 aristas aleatorias por nodo
+    (las conexiones largas que da la heurística de selección de vecinos).
+    """
+
+    def __init__(self, vectors: np.ndarray, m: int, seed: int = 0):
+        self.vectors = vectors
+        self.norms = np.einsum('ij,ij->i', vectors, vectors)
+        rng = np.random.default_rng(seed)
+        neighbors = [set(rng.integers(0, len(vectors), m // 4).tolist()) for _ in range(len(vectors))]
+        for start in range(0, len(vectors), 1024):
+            block = self.distances(vectors[start:start + 1024])
+            block[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+            for row, nearest in enumerate(np.argpartition(block, m, axis=1)[:, :m], start):
+                for node in nearest:
+                    neighbors[row].add(int(node))
+                    neighbors[int(node)].add(row)  # Aristas inversas: el grafo queda conexo
+        self.neighbors = [np.fromiter(n - {row}, dtype=np.int64) for row, n in enumerate(neighbors)]
+        self.entries = rng.choice(len(vectors), max(len(vectors) // m, 1), replace=False)
+
+    def distances(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Distancia l2² de cada query a los vectores (o sólo a rows)."""
+        matrix, norms = (self.vectors, self.norms) if rows is None else (self.vectors[rows], self.norms[rows])
+        return norms[None, :] - 2.0 * queries @ matrix.T + np.einsum('ij,ij->i', queries, queries)[:, None]
+
+    def search(self, query: np.ndarray, k: int, ef: int, allowed: Optional[np.ndarray] = None) -> Tuple[List[int], int]:
+        """
+        Top-k aproximado y distancias calculadas. Con allowed, los nodos que no
+        cumplen el filtro se recorren igual pero no entran en los resultados,
+        así que con filtros selectivos el recorrido crece hasta reunir ef válidos.
+        """
+        ef = max(ef, k)
+        entry_distances = self.distances(query[None, :], self.entries)[0]
+        entry = int(self.entries[np.argmin(entry_distances)])
+        distance = float(entry_distances.min())
+        visited = np.zeros(len(self.vectors), dtype=bool)
+        visited[entry] = True
+        candidates = [(distance, entry)]
+        results = [(-distance, entry)] if allowed is None or allowed[entry] else []
+        computed = len(self.entries)
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if len(results) >= ef and distance > -results[0][0]:
+                break
+            fresh = self.neighbors[node][~visited[self.neighbors[node]]]
+            if not len(fresh):
+                continue
+            visited[fresh] = True
+            computed += len(fresh)
+            for neighbor, d in zip(fresh.tolist(), self.distances(query[None, :], fresh)[0].tolist()):
+                if len(results) < ef or d < -results[0][0]:
+                    heapq.heappush(candidates, (d, neighbor))
+                    if allowed is None or allowed[neighbor]:
+                        heapq.heappush(results, (-d, neighbor))
+                        if len(results) > ef:
+                            heapq.heappop(results)
+        return [node for _, node in sorted(results, reverse=True)[:k]], computed
+
+
+# ==================== ESTRATEGIAS ====================
+def exact_search(graph: Graph, query: np.ndarray, k: int, mask: Optional[np.ndarray]) -> Tuple[List[int], int]:
+    rows = np.arange(len(graph.vectors)) if mask is None else np.flatnonzero(mask)
+    if not len(rows):
+        return [], 0
+    distances = graph.distances(query[None, :], rows)[0]
+    nearest = np.argpartition(distances, min(k, len(rows) - 1))[:k]
+    return rows[nearest[np.argsort(distances[nearest])]].tolist(), len(rows)
+
+
+def run(strategy: str, graph: Graph, query: np.ndarray, top_k: int, ef: int, mask: Optional[np.ndarray],
+        exact_threshold: int) -> Tuple[List[int], int]:
+    if strategy == 'post':
+        found, computed = graph.search(query, top_k * 3, ef)
+        return [node for node in found if mask is None or mask[node]][:top_k], computed
+    if strategy == 'exact' or (strategy == 'auto' and mask is not None and mask.sum() <= exact_threshold):
+        return exact_search(graph, query, top_k, mask)
+    return graph.search(query, top_k, ef, mask)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--dimension', type=int, default=128)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=15)
+    parser.add_argument('--m', type=int, default=16, help='vecinos por nodo (KNN_M)')
+    parser.add_argument('--ef-search', type=int, default=100, help='KNN_EF_SEARCH')
+    parser.add_argument('--exact-threshold', type=int, default=5000, help='KNN_FILTERED_EXACT_THRESHOLD')
+    args = parser.parse_args()
+
+    vectors, metadata = make_corpus(args.docs, args.dimension)
+    start = time.perf_counter()
+    graph = Graph(vectors, args.m)
+    print(f"Grafo: {args.docs} docs x {args.dimension} dims, m={args.m}, "
+          f"construido en {time.perf_counter() - start:.1f} s")
+    rng = np.random.default_rng(1)  # Preguntas cerca de documentos del índice, no copias
+    queries = vectors[rng.choice(args.docs, args.queries)] + rng.normal(0, 0.3, (args.queries, args.dimension)).astype(np.float32)
+
+    strategies = ('post', 'efficient', 'exact', 'auto')
+    print(f"\n  {'filtro':<40} {'docs':>6} {'estrategia':<10} {'recall':>7} {'hits':>5} {'dist/query':>11} {'ms/query':>9}")
+    for filters in FILTERS:
+        mask = filter_mask(metadata, filters)
+        matching = args.docs if mask is None else int(mask.sum())
+        truth = [set(exact_search(graph, q, args.top_k, mask)[0]) for q in queries]
+        label = ', '.join(f"{k}={v}" for k, v in filters.items()) or '(sin filtro)'
+        for strategy in strategies:
+            recall = returned = computed = 0
+            start = time.perf_counter()
+            for query, expected in zip(queries, truth):
+                found, distances = run(strategy, graph, query, args.top_k, args.ef_search, mask, args.exact_threshold)
+                recall += len(expected & set(found)) / max(len(expected), 1)
+                returned += len(found)
+                computed += distances
+            elapsed = (time.perf_counter() - start) / args.queries
+            print(f"  {label:<40} {matching:>6} {strategy:<10} {recall / args.queries:>7.3f} "
+                  f"{returned / args.queries:>5.1f} {computed / args.queries:>11.0f} {elapsed * 1000:>9.2f}")
+            label = ''
+
+
+if __name__ == '__main__':
+    main()
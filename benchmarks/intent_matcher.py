@@ -0,0 +1,188 @@
+"""
+Micro-benchmark del matcher de intenciones/filtros (lambda/matcher.py)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Compara, sobre un corpus de preguntas:
+    - legacy: los `keyword in question_lower` y any(...) por grupo de la V6
+    - matcher: una pasada del autómata de INTENT_RULES (needs_rag_search +
+      extract_filters_from_question de query.py)
+y reporta µs por pregunta y las preguntas en las que ambos difieren (las
+diferencias esperables vienen del plegado de tildes: 'cuanto' = 'cuánto').
+
+Además mide la detección de nombres de aplicación con N nombres (whole_word):
+autómata vs. un bucle `name in question` por nombre.
+
+Uso:
+    python benchmarks/intent_matcher.py --repeat 2000 --names 1000,5000,20000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'lambda'))
+
+import fakes  # noqa: E402
+from offline_pipeline import DEFAULT_CSV, configure_environment, load_questions  # noqa: E402
+
+EXTRA_QUESTIONS = [
+    "¿Cuáles son las aplicaciones muy críticas de Perú desplegadas en Azure?",
+    "Compara las apps on-premise vs las de Google Cloud en Estados Unidos",
+    "¿Qué sistemas de Turquia están en desarrollo?",
+    "Listar servicios con recuperación ante desastres",
+    "gracias, eso es todo",
+    "Muéstrame un gráfico de aplicaciones activas en España",
+    "¿Cuánto total de apps de criticidad baja hay en USA?",
+]
+
+
+# ==================== LEGACY (V6) ====================
+def legacy_needs_rag(question: str) -> bool:
+    question_lower = question.lower().strip()
+    data_keywords = [
+        'aplicacion', 'aplicaciones', 'app', 'apps', 'critica', 'crítica', 'criticidad', 'criticas', 'críticas',
+        'colombia', 'argentina', 'chile', 'perú', 'peru', 'méxico', 'mexico',
+        'españa', 'espana', 'uruguay', 'venezuela', 'paraguay',
+        'turquía', 'turquia', 'estados unidos', 'usa', 'eeuu',
+        'deploy', 'drp', 'estrategica', 'estratégica', 'activa', 'deprecada', 'mantenimiento', 'desarrollo',
+        'lista', 'listar', 'muestra', 'busca', 'encuentra', 'cuantas', 'cuántas', 'donde', 'dónde', 'cual', 'cuál',
+        'aws', 'azure', 'gcp', 'cloud', 'on-premise', 'kyndryl', 'ibm',
+        'portal', 'sistema', 'plataforma', 'servicio', 'atm', 'cajero'
+    ]
+    return any(keyword in question_lower for keyword in data_keywords)
+
+
+def legacy_filters(question: str) -> dict:
+    filters = {}
+    q = question.lower()
+    filters['is_numerical'] = any(w in q for w in ['cuantas', 'cuántas', 'total', 'cuánto', 'how many', 'cantidad', 'numero', 'número'])
+    visual_intent = {
+        'wants_table': any(w in q for w in ['tabla', 'table', 'listar', 'list']),
+        'wants_diagram': any(w in q for w in ['diagrama', 'diagram', 'flow', 'flujo', 'grafico', 'chart']),
+        'wants_comparison': any(w in q for w in ['comparar', 'compare', 'vs', 'versus', 'diferencia'])
+    }
+    countries = {
+        'colombia': 'Colombia', 'perú': 'Perú', 'peru': 'Perú', 'argentina': 'Argentina', 'chile': 'Chile',
+        'uruguay': 'Uruguay', 'venezuela': 'Venezuela', 'españa': 'España', 'espana': 'España',
+        'méxico': 'México', 'mexico': 'México', 'paraguay': 'Paraguay', 'turquía': 'Turquía', 'turquia': 'Turquía',
+        'estados unidos': 'Estados Unidos', 'usa': 'Estados Unidos', 'eeuu': 'Estados Unidos'
+    }
+    for key, value in countries.items():
+        if key in q:
+            filters['country'] = value
+            break
+    if any(w in q for w in ['muy critica', 'muy crítica', 'muy criticas', 'muy críticas']):
+        filters['critic_name'] = 'Muy Crítico'
+    elif any(w in q for w in ['critica', 'crítica', 'criticas', 'críticas', 'criticidad']):
+        filters['critic_name'] = 'Crítico'
+    elif any(w in q for w in ['media', 'medio']):
+        filters['critic_name'] = 'Medio'
+    elif any(w in q for w in ['baja', 'bajo']):
+        filters['critic_name'] = 'Bajo'
+    if any(w in q for w in ['activa', 'activas', 'activo', 'activos', 'en uso']):
+        filters['is_active'] = True
+    elif any(w in q for w in ['deprecada', 'deprecado', 'deprecadas']):
+        filters['status'] = 'Deprecado'
+    elif 'mantenimiento' in q:
+        filters['status'] = 'Mantenimiento'
+    elif any(w in q for w in ['desarrollo', 'en desarrollo']):
+        filters['status'] = 'En Desarrollo'
+    if 'drp' in q or 'recuperación' in q or 'recuperacion' in q:
+        filters['has_drp'] = True
+    if any(w in q for w in ['estratégica', 'estrategica', 'estratégicas', 'estrategico']):
+        filters['is_strategic'] = True
+    for keys, deploy in ((['aws'], 'AWS'), (['azure'], 'Azure'), (['gcp', 'google cloud'], 'GCP'),
+                         (['ibm'], 'IBM Cloud'), (['kyndryl'], 'Kyndryl'),
+                         (['hybrid', 'híbrido', 'hibrido'], 'Hybrid Cloud'),
+                         (['on premise', 'on-premise'], 'On-Premise')):
+        if any(k in q for k in keys):
+            filters['deploy'] = deploy
+            break
+    filters['visual_intent'] = visual_intent
+    return filters
+
+
+# ==================== MEDICIÓN ====================
+def per_call_us(fn, questions: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for question in questions:
+            fn(question)
+    return (time.perf_counter() - start) / (repeat * len(questions)) * 1e6
+
+
+def synthetic_names(base: list, count: int) -> list:
+    """Nombres únicos a partir de los del CSV ('Portal Empresas', 'Portal Empresas 2', ...)."""
+    names = []
+    copy = 1
+    while len(names) < count:
+        names.extend(name if copy == 1 else f"{name} {copy}" for name in base)
+        copy += 1
+    return names[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=DEFAULT_CSV)
+    parser.add_argument('--repeat', type=int, default=1000, help='pasadas sobre el corpus de preguntas')
+    parser.add_argument('--names', default='1000,5000,20000', help='tamaños del diccionario de nombres')
+    args = parser.parse_args()
+
+    configure_environment(1000)
+    fakes.install()
+    logging.disable(logging.INFO)
+    import pandas as pd
+    import query
+    from matcher import KeywordMatcher
+
+    questions = load_questions('', args.csv) + EXTRA_QUESTIONS
+
+    def matcher_route_and_filters(question):
+        return query.needs_rag_search(question), query.extract_filters_from_question(question)
+
+    def legacy_route_and_filters(question):
+        return legacy_needs_rag(question), legacy_filters(question)
+
+    mismatches = []
+    for question in questions:
+        new_rag, new_filters = matcher_route_and_filters(question)
+        old_rag, old_filters = legacy_route_and_filters(question)
+        new_filters.pop('exact_name', None)
+        if new_rag != old_rag or new_filters != old_filters:
+            mismatches.append((question, (old_rag, old_filters), (new_rag, new_filters)))
+
+    legacy_us = per_call_us(legacy_route_and_filters, questions, args.repeat)
+    matcher_us = per_call_us(query.match_intents.__wrapped__, questions, args.repeat)
+    full_us = per_call_us(matcher_route_and_filters, questions, args.repeat)
+
+    print(f"Reglas: {len(query.INTENT_RULES)}  patrones: {len(query.INTENT_MATCHER)}  preguntas: {len(questions)}")
+    print(f"  legacy (routing + filtros):          {legacy_us:8.1f} µs/pregunta")
+    print(f"  match_intents (sin memoizar):        {matcher_us:8.1f} µs/pregunta")
+    print(f"  needs_rag_search + extract_filters:  {full_us:8.1f} µs/pregunta")
+    print(f"  diferencias con legacy: {len(mismatches)}")
+    for question, old, new in mismatches:
+        print(f"    {question!r}\n      legacy:  {old}\n      matcher: {new}")
+
+    base = pd.read_csv(args.csv)['Name'].dropna().astype(str).unique().tolist()
+    print(f"\nNOMBRES DE APLICACIÓN (whole_word, {len(questions)} preguntas)")
+    print(f"  {'nombres':>8} {'build ms':>9} {'autómata µs':>12} {'bucle in µs':>12}")
+    for count in [int(n) for n in args.names.split(',') if n]:
+        names = synthetic_names(base, count)
+        start = time.perf_counter()
+        matcher = KeywordMatcher()
+        for index, name in enumerate(names):
+            matcher.add(name, index, whole_word=True)
+        matcher.build()
+        build_ms = (time.perf_counter() - start) * 1000
+        lowered = [name.lower() for name in names]
+        automaton_us = per_call_us(matcher.find, questions, max(args.repeat // 10, 1))
+        loop_us = per_call_us(lambda q: [n for n in lowered if n in q.lower()], questions, max(args.repeat // 100, 1))
+        print(f"  {count:>8} {build_ms:>9.1f} {automaton_us:>12.1f} {loop_us:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
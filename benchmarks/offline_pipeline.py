@@ -0,0 +1,229 @@
+"""
+Benchmark offline de los Lambdas (indexer + query) sin AWS
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Importa lambda/indexer.py y lambda/query.py contra los dobles de fakes.py
+(Bedrock, S3 y OpenSearch en memoria, con latencias configurables), reproduce
+data/bbva_applications.csv escalado a N filas y un corpus de preguntas, y mide:
+    - indexer: segundos, docs/s y tiempo por etapa
+    - query: latencia p50/p95/p99 por request (y TTFB con --stream), qps
+      y tiempo por etapa
+    - pico de RSS del proceso tras cada fase
+
+Las etapas 'bedrock.*', 'opensearch.*' y 's3.*' son llamadas a los dobles
+(incluyen la latencia simulada); 'indexer.*' y 'query.*' son funciones de los
+Lambdas. Sirve como línea base reproducible para cualquier cambio de rendimiento.
+
+Las variables de entorno de los Lambdas se respetan (p.ej. EMBEDDING_MAX_WORKERS,
+ANSWER_CACHE_SIZE=0 para medir sin caché de respuestas).
+
+Uso:
+    python benchmarks/offline_pipeline.py --rows 5000 --queries 200 \\
+        --embed-latency-ms 40 --generate-latency-ms 1500 --search-latency-ms 5 [--stream] [--json]
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'lambda'))
+
+import fakes  # noqa: E402
+
+DEFAULT_CSV = os.path.join(REPO_DIR, 'data', 'bbva_applications.csv')
+BUCKET = 'bench-bucket'
+KEY = 'bbva_applications.csv'
+
+DEFAULT_QUESTIONS = [
+    "¿Qué aplicaciones críticas tiene Colombia?",
+    "Muestra una tabla de apps en Argentina",
+    "Lista aplicaciones con DRP activo en Perú",
+    "¿Cuántas aplicaciones muy críticas hay en México?",
+    "¿Qué aplicaciones están desplegadas en AWS?",
+    "Aplicaciones deprecadas que requieren atención en Turquía",
+    "Dame un diagrama de las apps estratégicas de España",
+    "¿Cuántas aplicaciones hay en total?",
+    "Apps de microservicios en mantenimiento",
+    "hola",
+]
+
+
+def peak_rss_mb() -> float:
+    """Pico de memoria residente del proceso (ru_maxrss: KB en Linux, bytes en macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def scaled_csv(path: str, rows: int) -> bytes:
+    """Repite el CSV hasta N filas con Id_App únicos; las copias llevan sufijo en el nombre."""
+    df = pd.read_csv(path)
+    copies = -(-rows // len(df))
+    frames = []
+    for copy in range(copies):
+        frame = df.copy()
+        if copy:
+            frame['Name'] = frame['Name'].astype(str) + f" {copy + 1}"
+        frames.append(frame)
+    scaled = pd.concat(frames, ignore_index=True).head(rows)
+    scaled['Id_App'] = range(1, len(scaled) + 1)
+    return scaled.to_csv(index=False).encode('utf-8')
+
+
+def load_questions(path: str, csv_path: str) -> list:
+    if path:
+        with open(path, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    names = pd.read_csv(csv_path)['Name'].dropna().astype(str).unique()[:5]
+    return (DEFAULT_QUESTIONS + [f"¿Qué es {name}?" for name in names]
+            + [f"¿Quién es el owner de {name.lower()} y dónde está desplegada?" for name in names[:3]])
+
+
+def configure_environment(rows: int) -> None:
+    """Valores por defecto para que los Lambdas se importen sin AWS (el entorno manda)."""
+    defaults = {
+        'AWS_REGION': 'us-east-1',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'OPENSEARCH_ENDPOINT': 'fake-opensearch',
+        'OPENSEARCH_INDEX': 'bench-rag',
+        'S3_BUCKET': BUCKET,
+        'S3_KEY': KEY,
+        'ALUMNO_ID': 'bench',
+        'API_GATEWAY_ENDPOINT': 'http://localhost/bench',
+        'EMBEDDING_CACHE_BACKEND': 'none',
+        'QUERY_EMBEDDING_CACHE_BACKEND': 'none',
+        'BATCH_SIZE': str(min(max(rows // 10, 100), 1000)),
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def run_indexer(indexer, runs: int, mode: str) -> list:
+    results = []
+    event = {'mode': mode, 'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': KEY}}}]}
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = indexer.handler(event, None)
+        seconds = time.perf_counter() - start
+        body = json.loads(response['body'])
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"El indexer devolvió {response['statusCode']}: {body}")
+        results.append({'seconds': seconds, 'documents': body['documents_processed'],
+                        'docs_per_s': body['documents_processed'] / seconds if seconds else 0.0})
+    return results
+
+
+def run_queries(query, questions: list, total: int, stream: bool) -> dict:
+    latencies, ttfb = [], []
+    statuses = {}
+    start = time.perf_counter()
+    for i in range(total):
+        event = {'body': json.dumps({'question': questions[i % len(questions)]})}
+        request_start = time.perf_counter()
+        if stream:
+            first = None
+            for line in query.stream_events(event, None):
+                first = first or time.perf_counter()
+                final = json.loads(line)
+            status = final['status']
+            ttfb.append(first - request_start)
+        else:
+            status = query.handler(event, None)['statusCode']
+        latencies.append(time.perf_counter() - request_start)
+        statuses[status] = statuses.get(status, 0) + 1
+    wall = time.perf_counter() - start
+    return {
+        'requests': total,
+        'qps': total / wall if wall else 0.0,
+        'statuses': statuses,
+        'p50_ms': fakes.percentile(latencies, 50) * 1000,
+        'p95_ms': fakes.percentile(latencies, 95) * 1000,
+        'p99_ms': fakes.percentile(latencies, 99) * 1000,
+        'ttfb_p50_ms': fakes.percentile(ttfb, 50) * 1000 if ttfb else None,
+        'ttfb_p95_ms': fakes.percentile(ttfb, 95) * 1000 if ttfb else None,
+    }
+
+
+def print_stages(stages: dict) -> None:
+    print(f"  {'etapa':<40} {'llamadas':>9} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, s in stages.items():
+        print(f"  {stage:<40} {s['calls']:>9} {s['total_s']:>9.3f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=DEFAULT_CSV)
+    parser.add_argument('--rows', type=int, default=2000, help='filas del CSV reproducido')
+    parser.add_argument('--runs', type=int, default=1, help='ejecuciones del indexer')
+    parser.add_argument('--mode', default='full', choices=['full', 'incremental', 'bluegreen'])
+    parser.add_argument('--queries', type=int, default=100, help='requests al Lambda de query')
+    parser.add_argument('--questions', default='', help='archivo con una pregunta por línea')
+    parser.add_argument('--stream', action='store_true', help='usar stream_events (mide TTFB)')
+    parser.add_argument('--embed-latency-ms', type=float, default=30.0)
+    parser.add_argument('--generate-latency-ms', type=float, default=1000.0)
+    parser.add_argument('--search-latency-ms', type=float, default=5.0)
+    parser.add_argument('--bulk-latency-ms', type=float, default=20.0)
+    parser.add_argument('--json', action='store_true', help='imprimir el informe como JSON')
+    args = parser.parse_args()
+
+    configure_environment(args.rows)
+    services = fakes.install(
+        embed_latency=args.embed_latency_ms / 1000,
+        generate_latency=args.generate_latency_ms / 1000,
+        search_latency=args.search_latency_ms / 1000,
+        bulk_latency=args.bulk_latency_ms / 1000,
+    )
+    services.s3.objects[(BUCKET, KEY)] = scaled_csv(args.csv, args.rows)
+    recorder = services.recorder
+
+    start = time.perf_counter()
+    import indexer
+    import query
+    import_seconds = time.perf_counter() - start
+
+    for name in ('create_embedding', 'fetch_indexed_fingerprints', 'finalize_bulk_load', 'publish_index_generation'):
+        recorder.wrap(indexer, name, f"indexer.{name}")
+    for name in ('extract_filters_from_question', 'get_index_generation', 'create_embedding',
+                 'lookup_entities', 'search_opensearch', 'generate_response', 'generate_conversational_response'):
+        recorder.wrap(query, name, f"query.{name}")
+
+    report = {'config': vars(args), 'import_s': import_seconds}
+
+    index_runs = run_indexer(indexer, args.runs, args.mode)
+    report['indexer'] = {'runs': index_runs, 'stages': recorder.summary(), 'peak_rss_mb': peak_rss_mb()}
+    recorder.reset()
+
+    questions = load_questions(args.questions, args.csv)
+    report['query'] = run_queries(query, questions, args.queries, args.stream)
+    report['query']['stages'] = recorder.summary()
+    report['query']['peak_rss_mb'] = peak_rss_mb()
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f"Import de los Lambdas: {import_seconds:.2f}s")
+    print(f"\nINDEXER ({args.rows} filas, modo {args.mode})")
+    for i, run in enumerate(index_runs, 1):
+        print(f"  run {i}: {run['documents']} docs en {run['seconds']:.2f}s ({run['docs_per_s']:.1f} docs/s)")
+    print_stages(report['indexer']['stages'])
+    print(f"  pico RSS: {report['indexer']['peak_rss_mb']:.1f} MB")
+
+    q = report['query']
+    print(f"\nQUERY ({q['requests']} requests{', streaming' if args.stream else ''})")
+    print(f"  {q['qps']:.2f} req/s  p50 {q['p50_ms']:.1f} ms  p95 {q['p95_ms']:.1f} ms  p99 {q['p99_ms']:.1f} ms  status {q['statuses']}")
+    if args.stream:
+        print(f"  TTFB p50 {q['ttfb_p50_ms']:.1f} ms  p95 {q['ttfb_p95_ms']:.1f} ms")
+    print_stages(q['stages'])
+    print(f"  pico RSS: {q['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark de decodificación de respuestas grandes (LambdaHttpConnection)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Sirve desde un servidor HTTP local una página de scroll como las del export del
+snapshot del indexer (--hits documentos con texto, metadata y embedding de
+--dimension floats) y la pide con la conexión y el serializer de los Lambdas
+(lambda/opensearch_client.py, lambda/serializer.py) en cada modo de
+OPENSEARCH_RESPONSE_MODE:
+    - text:   response.content -> str -> json.loads (por defecto en ambos
+              Lambdas: el más rápido con el json de la biblioteca estándar)
+    - bytes:  response.content -> json.loads (decode_response=False); json
+              decodifica los bytes a str por dentro, así que no ahorra la copia
+              y el pico sube (para serializers que parsean bytes directamente)
+    - stream: chunks de 256 KB -> parser incremental, un hit cada vez
+              (stream_response=True); menos pico de memoria pero más lento, y
+              un corte a mitad del cuerpo salta en el deserializer fuera de los
+              reintentos del Transport (indexer: RETRIEVER_SNAPSHOT_STREAM)
+Mide ms por request (cliente completo) y el pico de memoria Python por request
+(tracemalloc, en una pasada aparte), y verifica que los tres modos devuelven el
+mismo resultado.
+
+Uso:
+    python benchmarks/response_decoding.py --hits 500 --dimension 1536 --requests 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'layer', 'python'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'lambda'))
+
+from opensearchpy import OpenSearch  # noqa: E402
+from opensearch_client import LambdaHttpConnection  # noqa: E402
+from serializer import VectorJSONSerializer  # noqa: E402
+from transport_metrics import TEXT, make_handler  # noqa: E402
+
+MODES = {
+    'text': {},
+    'bytes': {'decode_response': False},
+    'stream': {'stream_response': True},
+}
+
+
+def scroll_page(hits: int, dimension: int) -> bytes:
+    """Página de scroll con _source completo (text_content, metadata, embedding)."""
+    vectors = np.random.default_rng(0).normal(0, 0.03, (hits, dimension)).astype(np.float32)
+    return json.dumps({
+        "_scroll_id": "FGluY2x1ZGVfY29udGV4dF91dWlkDXF1ZXJ5QW5kRmV0Y2gBFk", "took": 20, "timed_out": False,
+        "hits": {"total": {"value": hits, "relation": "eq"}, "max_score": None, "hits": [{
+            "_index": "rag-index", "_id": f"{i}-0", "_score": None,
+            "_source": {"text_content": TEXT, "metadata": {"id_app": str(i), "name": f"Portal {i}", "country": "Perú"},
+                        "embedding": [float(x) for x in vector.astype(str).astype(float)]},
+        } for i, vector in enumerate(vectors)]},
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hits', type=int, default=500)
+    parser.add_argument('--dimension', type=int, default=1536)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    body = scroll_page(args.hits, args.dimension)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(body, 0.0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = {'host': '127.0.0.1', 'port': server.server_address[1]}
+    print(f"Respuesta: {args.hits} hits x {args.dimension} dims = {len(body) / 1e6:.1f} MB")
+
+    results = {}
+    print(f"\n  {'modo':<8} {'ms/request':>11} {'pico MB':>8}")
+    for mode, options in MODES.items():
+        client = OpenSearch(hosts=[host], connection_class=LambdaHttpConnection, serializer=VectorJSONSerializer(),
+                            **options)
+        client.search(index='rag-index', body={"query": {"match_all": {}}})  # conexión abierta
+
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            results[mode] = client.search(index='rag-index', body={"query": {"match_all": {}}})
+        elapsed = (time.perf_counter() - start) / args.requests
+
+        results[mode] = None
+        tracemalloc.start()
+        results[mode] = client.search(index='rag-index', body={"query": {"match_all": {}}})
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  {mode:<8} {elapsed * 1000:>11.1f} {peak / 1e6:>8.1f}")
+    server.shutdown()
+
+    print(f"\nMismo resultado en los tres modos: {results['text'] == results['bytes'] == results['stream']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark de firma SigV4 del cliente OpenSearch (lambda/signer.py)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Compara el coste por request de:
+    - antes: el AWSV4Signer de opensearchpy (AWSRequest + SigV4Auth de botocore
+      por request, credenciales congeladas y clave de firma derivadas cada vez,
+      query string re-codificada y payload hasheado dos veces)
+    - ahora: CachedSigV4Signer con credenciales, clave de firma y URL canónica
+      cacheadas y un único hash del payload
+para una query kNN (~20 KB) y cuerpos bulk de 1 y 5 MB, con credenciales
+estáticas y refrescables (las del rol de Lambda). Antes de medir verifica que
+ambos producen cabeceras idénticas con el mismo timestamp en varios casos
+(query string, puerto, Host explícito, cuerpo str / bytes / fichero, token).
+
+Uso:
+    python benchmarks/sigv4_signing.py --repeat 2000
+"""
+
+import argparse
+import datetime
+import io
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'layer', 'python'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'lambda'))
+
+import botocore.auth  # noqa: E402
+from botocore.credentials import Credentials, RefreshableCredentials  # noqa: E402
+from opensearchpy.helpers.signer import AWSV4Signer  # noqa: E402
+
+from signer import CachedSigV4Signer  # noqa: E402
+
+URL = "https://search-rag-abc123.us-east-1.es.amazonaws.com:443/rag-index/_search"
+
+
+def refreshable_credentials() -> RefreshableCredentials:
+    expiry = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)).isoformat()
+    metadata = {'access_key': 'ASIAEXAMPLE', 'secret_key': 'wJalrXUtnFEMI/K7MDENG/bPxRfiCYEXAMPLEKEY',
+                'token': 'IQoJb3JpZ2luX2VjEXAMPLE' * 20, 'expiry_time': expiry}
+    return RefreshableCredentials.create_from_metadata(metadata, lambda: metadata, 'sts-assume-role')
+
+
+def check_equivalence() -> int:
+    """Cabeceras de ambos firmantes con el mismo timestamp; devuelve los casos verificados."""
+    cases = [
+        ("POST", URL, b'{"size": 15}', None),
+        ("GET", URL + "?size=10&from=0&_source_excludes=embedding", None, None),
+        ("POST", "https://host.example.com/idx/_search?q=pa%C3%ADs:per%C3%BA&sort=a,b", "{}", None),
+        ("PUT", "http://localhost:9200/a//b/../c/", b"", None),
+        ("POST", "https://vpc-x.es.amazonaws.com/_bulk", io.BytesIO(b"x" * 3_000_000), None),
+        ("DELETE", "https://10.0.0.1:9443/idx", None, {"Host": "search.example.com"}),
+    ]
+    checked = 0
+    for credentials in (Credentials('AKIDEXAMPLE', 'secret'), Credentials('AKIDEXAMPLE', 'secret', 'token'),
+                        refreshable_credentials()):
+        for service in ('es', 'aoss'):
+            signer = CachedSigV4Signer(credentials, 'eu-west-1', service)
+            legacy = AWSV4Signer(credentials, 'eu-west-1', service)
+            for method, url, body, headers in cases:
+                signed = signer.sign(method, url, body, headers)
+                stamp = datetime.datetime.strptime(signed["X-Amz-Date"], "%Y%m%dT%H%M%SZ")
+                original = botocore.auth.get_current_datetime
+                botocore.auth.get_current_datetime = lambda *args, **kwargs: stamp
+                try:
+                    expected = legacy.sign(method, url, body, headers)
+                finally:
+                    botocore.auth.get_current_datetime = original
+                if signed != expected:
+                    raise AssertionError(f"Firma distinta para {method} {url}:\n{signed}\n{expected}")
+                checked += 1
+    return checked
+
+
+def timed(fn, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000, help='firmas por caso (los bulk usan /20)')
+    args = parser.parse_args()
+
+    print(f"Cabeceras idénticas a botocore en {check_equivalence()} casos")
+
+    bodies = [('kNN 20 KB', b'{"knn": [' + b'0.0123456,' * 2000 + b'0]}', args.repeat),
+              ('bulk 1 MB', b'x' * 1024 * 1024, max(args.repeat // 20, 10)),
+              ('bulk 5 MB', b'x' * 5 * 1024 * 1024, max(args.repeat // 20, 10))]
+    print(f"\n  {'credenciales':<13} {'cuerpo':<10} {'antes µs':>9} {'ahora µs':>9} {'speedup':>8}")
+    for name, credentials in (('estáticas', Credentials('AKIDEXAMPLE', 'secret', 'token')),
+                              ('refrescables', refreshable_credentials())):
+        legacy = AWSV4Signer(credentials, 'us-east-1', 'es')
+        signer = CachedSigV4Signer(credentials, 'us-east-1', 'es')
+        for label, body, repeat in bodies:
+            before = timed(lambda: legacy.sign('POST', URL, body), repeat)
+            after = timed(lambda: signer.sign('POST', URL, body), repeat)
+            print(f"  {name:<13} {label:<10} {before * 1e6:>9.1f} {after * 1e6:>9.1f} {before / after:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
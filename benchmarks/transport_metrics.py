@@ -0,0 +1,177 @@
+"""
+Desglose por fase de las requests a OpenSearch (lambda/metrics.py)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Levanta un servidor HTTP local que imita _search (respuesta con --hits
+documentos como los del índice y 'took' = --server-ms) y _bulk, y lanza
+queries hybrid + kNN con el cliente de los Lambdas (LambdaHttpConnection y
+MetricsTransport de lambda/opensearch_client.py, firma SigV4 con credenciales
+ficticias). Imprime por
+endpoint y fase (serialize, sign, network, decode, deserialize y server, el
+'took' del clúster) p50 / p95 / media en ms, bytes por request y reutilización
+de conexiones del pool.
+
+network - server es el tiempo fuera del clúster (red + HTTP); sign, decode y
+deserialize son CPU del cliente. En el Lambda, OPENSEARCH_METRICS=true escribe el
+mismo snapshot contra el dominio real.
+
+Uso:
+    python benchmarks/transport_metrics.py --requests 300 --hits 45 --server-ms 5 \\
+        [--threads 4] [--json]
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'layer', 'python'))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'lambda'))
+
+from botocore.credentials import Credentials  # noqa: E402
+from opensearchpy import OpenSearch  # noqa: E402
+
+from metrics import MetricsCollector  # noqa: E402
+from opensearch_client import LambdaHttpConnection, MetricsTransport  # noqa: E402
+from serializer import FloatVector, VectorJSONSerializer  # noqa: E402
+from signer import CachedSigV4Auth  # noqa: E402
+
+TEXT = ("Aplicación: Portal de Gestión de Quejas. País: Perú. Criticidad: Crítico. "
+        "Despliegue: AWS. Estado: Activo. Dominio: Atención al cliente. ") * 3
+
+
+# ==================== SERVIDOR LOCAL ====================
+def search_response(hits: int, took_ms: int) -> bytes:
+    """Respuesta de _search como la del índice RAG (text_content + metadata, sin embedding)."""
+    return json.dumps({
+        "took": took_ms,
+        "timed_out": False,
+        "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+        "hits": {
+            "total": {"value": hits, "relation": "eq"},
+            "max_score": 1.0,
+            "hits": [{
+                "_index": "bench-rag", "_id": f"{i}-0", "_score": 1.0 - i / 100,
+                "_source": {
+                    "text_content": TEXT,
+                    "metadata": {"id_app": str(i), "name": f"Portal {i}", "country": "Perú", "score": 3.5},
+                    "original_row_index": i,
+                },
+            } for i in range(hits)],
+        },
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def make_handler(search_body: bytes, server_ms: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive: el pool reutiliza conexiones
+
+        def setup(self):
+            super().setup()
+            # Cabeceras y cuerpo salen en dos writes: sin esto Nagle + delayed ACK suman ~40 ms
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('content-length') or 0))
+            time.sleep(server_ms / 1000)
+            if self.path.split('?')[0].endswith('/_bulk'):
+                body = json.dumps({"took": int(server_ms), "errors": False, "items": []}).encode('utf-8')
+            else:
+                body = search_body
+            self.send_response(200)
+            self.send_header('content-type', 'application/json; charset=UTF-8')
+            self.send_header('content-length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+# ==================== CLIENTE ====================
+def make_client(port: int, metrics: MetricsCollector, pool_size: int) -> OpenSearch:
+    """El cliente de opensearch_client.create_client, sin TLS contra el servidor local."""
+    credentials = Credentials('AKIDEXAMPLE', 'wJalrXUtnFEMI/K7MDENG/bPxRfiCYEXAMPLEKEY', 'token')
+    return OpenSearch(
+        hosts=[{'host': '127.0.0.1', 'port': port}],
+        http_auth=CachedSigV4Auth(credentials, 'us-east-1', 'es'),
+        use_ssl=False,
+        connection_class=LambdaHttpConnection,
+        transport_class=MetricsTransport,
+        serializer=VectorJSONSerializer(),
+        pool_maxsize=pool_size,
+        metrics=metrics,
+    )
+
+
+def knn_body(vector, k: int) -> dict:
+    return {"size": k, "_source": {"excludes": ["embedding"]}, "query": {"bool": {"should": [
+        {"match": {"text_content": {"query": "aplicaciones críticas de Perú"}}},
+        {"knn": {"embedding": {"vector": FloatVector(vector), "k": k * 3}}},
+    ], "minimum_should_match": 1}}}
+
+
+def print_snapshot(snapshot: dict) -> None:
+    conns = snapshot['connections']
+    print(f"{snapshot['requests']} requests en {snapshot['window_s']:.2f} s, "
+          f"conexiones nuevas={conns['new']} reutilizadas={conns['reused']} (reuse {conns['reuse_ratio']})")
+    for endpoint, stats in snapshot['endpoints'].items():
+        latency = stats['latency_ms']
+        print(f"\n{endpoint}: {latency['count']} requests, {stats['errors']} errores, "
+              f"{stats['bytes_sent'] / latency['count']:.0f} B enviados / "
+              f"{stats['bytes_received'] / latency['count']:.0f} B recibidos por request")
+        print(f"  {'fase':<12} {'p50 ms':>8} {'p95 ms':>8} {'media ms':>9}")
+        rows = [('total', latency)] + list(stats['phases_ms'].items())
+        for phase, histogram in rows:
+            print(f"  {phase:<12} {histogram['p50']:>8.3f} {histogram['p95']:>8.3f} {histogram['mean']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--hits', type=int, default=45, help='documentos por respuesta de _search')
+    parser.add_argument('--server-ms', type=float, default=5.0, help="latencia del servidor (y 'took')")
+    parser.add_argument('--dimension', type=int, default=1536)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--bulk', type=int, default=10, help='requests _bulk además de las búsquedas')
+    parser.add_argument('--json', action='store_true', help='imprime el snapshot completo en JSON')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                 make_handler(search_response(args.hits, int(args.server_ms)), args.server_ms))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    metrics = MetricsCollector()
+    client = make_client(server.server_address[1], metrics, args.threads)
+    vectors = np.random.default_rng(0).normal(0, 0.03, (32, args.dimension)).astype(np.float32)
+    serializer = VectorJSONSerializer()
+    bulk_body = b"".join(b'{"index":{"_index":"bench-rag"}}\n' + serializer.dumps(
+        {"text_content": TEXT, "embedding": FloatVector(v)}).encode() + b"\n" for v in vectors)
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(lambda i: client.search(index='bench-rag', body=knn_body(vectors[i % len(vectors)], 15)),
+                      range(args.requests)))
+    for _ in range(args.bulk):
+        client.bulk(body=bulk_body)
+    server.shutdown()
+
+    snapshot = metrics.snapshot()
+    if args.json:
+        print(json.dumps(snapshot, indent=2))
+    print_snapshot(snapshot)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark de codificación de vectores del índice kNN (lambda/vectors.py)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Compara, con búsqueda exacta en numpy, el ranking de cada codificación
+(KNN_VECTOR_ENCODING + EMBEDDING_NORMALIZE + KNN_SPACE_TYPE) frente al mapping
+actual (float32, l2, sin normalizar):
+    - recall@k frente al ranking de referencia, con empates: cuenta como
+      acierto cualquier documento a distancia <= la del k-ésimo de referencia
+      (el CSV repetido tiene muchas filas casi idénticas)
+    - % de componentes recortadas a [-128, 127] (sólo byte)
+    - memoria nativa estimada del grafo faiss por vector y total (N docs, réplicas)
+
+Antes compara, por space type y escala, el score kNN de byte con el boost de
+query.py (vectors.byte_score_boost) frente al de float, y verifica que en
+innerproduct conserva las diferencias entre los top-k de cada query y que en
+l2 (score 1 / (1 + escala² · d²), ya comprimido) no se aplica boost.
+
+La cuantización sólo cambia el ranking: la latencia y el recall de HNSW sobre un
+dominio real se miden con bulk_profiles.py --encodings.
+
+Vectores:
+    - por defecto, las filas del CSV (repetido hasta --docs) y las preguntas del
+      pipeline offline con los embeddings de FakeBedrock
+    - --cache: embeddings reales de Titan de la caché SQLite del indexer
+    - --vectors: .npy con embeddings reales (N x dim)
+    más --queries vectores del corpus perturbados
+
+Uso:
+    python benchmarks/vector_quantization.py --docs 5000 --k 15 --byte-scales 200,400,800 \\
+        [--cache /tmp/embedding_cache.sqlite3 | --vectors embeddings.npy]
+"""
+
+import argparse
+import io
+import os
+import sqlite3
+import sys
+from array import array
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'lambda'))
+
+import fakes  # noqa: E402
+from offline_pipeline import DEFAULT_CSV, load_questions, scaled_csv  # noqa: E402
+from vectors import (BYTE_MAX, BYTE_MIN, SPACE_TYPES, byte_score_boost, knn_score,  # noqa: E402
+                     native_memory_bytes, normalize, quantize)
+
+
+# ==================== VECTORES ====================
+def fake_vectors(csv_path: str, docs: int, dimension: int):
+    """Filas del CSV como texto 'columna: valor' y preguntas del pipeline offline (FakeBedrock)."""
+    bedrock = fakes.FakeBedrock(fakes.Recorder(), dimension)
+    frame = pd.read_csv(io.BytesIO(scaled_csv(csv_path, docs)))
+    texts = ['. '.join(f"{column}: {value}" for column, value in row.items() if pd.notna(value))
+             for row in frame.to_dict('records')]
+    corpus = np.asarray([bedrock.embed(text) for text in texts], dtype=np.float32)
+    queries = np.asarray([bedrock.embed(question) for question in load_questions('', csv_path)], dtype=np.float32)
+    return corpus, queries
+
+
+def cached_vectors(path: str, docs: int) -> np.ndarray:
+    """Embeddings de la caché SQLite del indexer (float32 binario, o float64 en archivos anteriores; cache.SQLiteCacheBackend)."""
+    with sqlite3.connect(path) as conn:
+        tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        rows = [array('f', blob) for blob, in conn.execute("SELECT value FROM embeddings_f32 LIMIT ?", (docs,))
+                ] if 'embeddings_f32' in tables else []
+        if len(rows) < docs and 'embeddings' in tables:
+            rows += [array('d', blob) for blob, in conn.execute("SELECT value FROM embeddings LIMIT ?",
+                                                                (docs - len(rows),))]
+    return np.asarray(rows, dtype=np.float32)
+
+
+def perturbed_queries(corpus: np.ndarray, queries: int, seed: int) -> np.ndarray:
+    """Vectores del corpus con ruido proporcional a su norma (como bulk_profiles.py)."""
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.choice(len(corpus), size=min(queries, len(corpus)), replace=False)]
+    scale = np.linalg.norm(picks, axis=1, keepdims=True) / np.sqrt(corpus.shape[1])
+    return picks + rng.standard_normal(picks.shape).astype(np.float32) * scale
+
+
+# ==================== RANKINGS ====================
+def distances(corpus: np.ndarray, queries: np.ndarray, space_type: str) -> np.ndarray:
+    """Matriz queries x corpus de distancias en el espacio indicado (mismo orden que faiss)."""
+    corpus, queries = corpus.astype(np.float32), queries.astype(np.float32)
+    products = queries @ corpus.T
+    if space_type == 'innerproduct':
+        return -products
+    return (corpus ** 2).sum(axis=1) - 2 * products + (queries ** 2).sum(axis=1, keepdims=True)
+
+
+def encode(corpus: np.ndarray, queries: np.ndarray, encoding: str, normalized: bool, scale: float):
+    """Vectores tal como los almacena faiss (y como se envía la query) para la codificación indicada."""
+    if normalized:
+        corpus, queries = normalize(corpus), normalize(queries)
+    if encoding == 'fp16':
+        # El encoder sq fp16 de faiss guarda fp16 y calcula distancias en float32
+        return corpus.astype(np.float16), queries
+    if encoding == 'byte':
+        return quantize(corpus, scale), quantize(queries, scale)
+    return corpus, queries
+
+
+def recall_with_ties(reference: np.ndarray, found: np.ndarray, k: int) -> float:
+    """Fracción de los k devueltos que están, en la referencia, a distancia <= la del k-ésimo."""
+    kth = np.partition(reference, k - 1, axis=1)[:, k - 1:k]
+    tolerance = 1e-5 * np.maximum(np.abs(kth), 1.0)
+    return float((np.take_along_axis(reference, found, axis=1) <= kth + tolerance).mean())
+
+
+# ==================== SCORES ====================
+def check_byte_scores(corpus: np.ndarray, queries: np.ndarray, scales, k: int) -> None:
+    """
+    Score de OpenSearch de los top-k (ranking float) con float y con byte + boost.
+    Δ: diferencia media absoluta; Δ rel.: la misma tras restar a cada query su
+    score medio (lo que cambia el orden de la fusión 'sum' con BM25).
+    """
+    corpus, queries = normalize(corpus), normalize(queries)
+    print(f"\n  {'space':<13} {'escala':>7} {'boost':>10} {'score float':>12} {'score byte':>11} {'Δ':>9} {'Δ rel.':>9}")
+    for space_type in SPACE_TYPES:
+        values = -distances(corpus, queries, 'innerproduct') if space_type == 'innerproduct' \
+            else distances(corpus, queries, 'l2')
+        top = np.argsort(-values if space_type == 'innerproduct' else values, axis=1)[:, :k]
+        float_scores = knn_score(np.take_along_axis(values, top, axis=1), space_type)
+        for scale in scales:
+            stored, sent = quantize(corpus, scale).astype(np.float32), quantize(queries, scale).astype(np.float32)
+            byte_values = -distances(stored, sent, 'innerproduct') if space_type == 'innerproduct' \
+                else distances(stored, sent, 'l2')
+            boost = byte_score_boost(space_type, scale)
+            byte_scores = knn_score(np.take_along_axis(byte_values, top, axis=1), space_type) * boost
+            error = float(np.abs(byte_scores - float_scores).mean())
+            relative = float(np.abs((byte_scores - byte_scores.mean(axis=1, keepdims=True))
+                                    - (float_scores - float_scores.mean(axis=1, keepdims=True))).mean())
+            print(f"  {space_type:<13} {scale:>7.0f} {boost:>10.3g} {float_scores.mean():>12.4f} "
+                  f"{byte_scores.mean():>11.4f} {error:>9.4f} {relative:>9.4f}")
+            if space_type == 'innerproduct' and relative > 0.05:
+                raise AssertionError(f"innerproduct, escala {scale}: el score byte con boost no sigue al float (Δ rel. {relative:.4f})")
+            if space_type == 'l2' and boost != 1.0:
+                raise AssertionError(f"l2, escala {scale}: un boost constante no lleva 1 / (1 + d²) a la escala float")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=DEFAULT_CSV)
+    parser.add_argument('--docs', type=int, default=5000)
+    parser.add_argument('--dimension', type=int, default=1536)
+    parser.add_argument('--queries', type=int, default=100, help='queries perturbadas a partir del corpus')
+    parser.add_argument('--k', type=int, default=15)
+    parser.add_argument('--byte-scales', default='200,400,800', help='valores de KNN_BYTE_SCALE a probar')
+    parser.add_argument('--m', type=int, default=16, help='m del grafo HNSW (memoria)')
+    parser.add_argument('--replicas', type=int, default=1, help='réplicas (memoria total)')
+    parser.add_argument('--cache', default='', help='caché SQLite de embeddings del indexer')
+    parser.add_argument('--vectors', default='', help='.npy con embeddings reales (N x dim)')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.cache or args.vectors:
+        corpus = cached_vectors(args.cache, args.docs) if args.cache else np.load(args.vectors).astype(np.float32)[:args.docs]
+        queries = perturbed_queries(corpus, args.queries, args.seed)
+        source = args.cache or args.vectors
+    else:
+        corpus, questions = fake_vectors(args.csv, args.docs, args.dimension)
+        queries = np.vstack([questions, perturbed_queries(corpus, args.queries, args.seed)])
+        source = f"CSV x{len(corpus)} (FakeBedrock)"
+    docs, dimension = corpus.shape
+    norms = np.linalg.norm(corpus, axis=1)
+    print(f"Vectores: {source}  docs={docs} dim={dimension} queries={len(queries)} "
+          f"norma media={norms.mean():.3f} |x|max={np.abs(normalize(corpus)).max():.3f} (normalizados)")
+
+    scales = [float(scale) for scale in args.byte_scales.split(',') if scale]
+    check_byte_scores(corpus, queries, scales, args.k)
+
+    reference = distances(corpus, queries, 'l2')
+    variants = [('float', False, 'l2', None), ('float', True, 'innerproduct', None),
+                ('fp16', False, 'l2', None), ('fp16', True, 'innerproduct', None)]
+    variants += [('byte', True, 'innerproduct', scale) for scale in scales]
+
+    print(f"\n  {'encoding':<8} {'norm':<5} {'space':<13} {'escala':>7} {'recall@' + str(args.k):>10} "
+          f"{'top-1':>6} {'clip %':>7} {'bytes/vec':>10} {'MB total':>9}")
+    for encoding, normalized, space_type, scale in variants:
+        stored, sent = encode(corpus, queries, encoding, normalized, scale or 1.0)
+        found = np.argsort(distances(stored, sent, space_type), axis=1, kind='stable')[:, :args.k]
+        clipped = 0.0
+        if encoding == 'byte':
+            scaled = np.rint(normalize(corpus) * scale)
+            clipped = float(((scaled < BYTE_MIN) | (scaled > BYTE_MAX)).mean() * 100)
+        memory = native_memory_bytes(docs, dimension, encoding, args.m, args.replicas)
+        print(f"  {encoding:<8} {'sí' if normalized else 'no':<5} {space_type:<13} {scale or '-':>7} "
+              f"{recall_with_ties(reference, found, args.k):>10.3f} {recall_with_ties(reference, found[:, :1], 1):>6.2f} "
+              f"{clipped:>7.3f} {memory / (docs * (args.replicas + 1)):>10.0f} {memory / 1e6:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
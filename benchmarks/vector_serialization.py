@@ -0,0 +1,109 @@
+"""
+Benchmark de serialización de vectores para bulk y kNN (lambda/serializer.py)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Compara, para N documentos como los del indexer (texto + metadata + embedding)
+troceados por el _chunk_actions de opensearchpy (el de streaming_bulk):
+    - antes: JSONSerializer de opensearchpy con la lista de floats (repr de 17
+      dígitos)
+    - ahora: VectorJSONSerializer con FloatVector (encode_vector, precisión
+      float32, una sola pasada sobre el documento)
+y el cuerpo de una query kNN. Reporta µs por documento, bytes por documento y
+verifica que los vectores decodificados son idénticos en float32.
+
+Uso:
+    python benchmarks/vector_serialization.py --docs 2000 --dimension 1536
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'layer', 'python'))  # opensearchpy (la capa del Lambda)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'lambda'))
+
+from opensearchpy import JSONSerializer  # noqa: E402
+from opensearchpy.helpers.actions import _chunk_actions, expand_action  # noqa: E402
+from serializer import FloatVector, VectorJSONSerializer  # noqa: E402
+
+TEXT = ("Aplicación: Portal de Gestión de Quejas. País: Perú. Criticidad: Crítico. "
+        "Despliegue: AWS. Estado: Activo. Dominio: Atención al cliente. ") * 3
+
+
+def make_actions(vectors: np.ndarray, wrap: bool) -> list:
+    return [{
+        "_index": "bench-rag",
+        "_id": f"{i}-0",
+        "_source": {
+            "text_content": TEXT,
+            "embedding": FloatVector(vector) if wrap else vector,
+            "metadata": {"id_app": str(i), "name": f"Portal {i}", "country": "Perú", "score": 3.5},
+            "original_row_index": i,
+        },
+    } for i, vector in enumerate(vectors)]
+
+
+def bulk_bodies(actions: list, serializer, chunk_size: int, max_bytes: int) -> list:
+    """Cuerpos bulk tal como los envía streaming_bulk."""
+    return [("\n".join(lines) + "\n").encode("utf-8")
+            for _, lines in _chunk_actions(map(expand_action, actions), chunk_size, max_bytes, serializer)]
+
+
+def timed(fn, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=2000)
+    parser.add_argument('--dimension', type=int, default=1536)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--max-chunk-bytes', type=int, default=5 * 1024 * 1024)
+    parser.add_argument('--queries', type=int, default=500, help='cuerpos kNN serializados')
+    args = parser.parse_args()
+
+    legacy_serializer, serializer = JSONSerializer(), VectorJSONSerializer()
+    rng = np.random.default_rng(0)
+    # Titan devuelve floats JSON: listas de float Python
+    vectors = [v.tolist() for v in rng.normal(0, 0.03, (args.docs, args.dimension))]
+
+    legacy_actions = make_actions(vectors, wrap=False)
+    fast_actions = make_actions(vectors, wrap=True)
+
+    legacy, legacy_s = timed(lambda: bulk_bodies(legacy_actions, legacy_serializer, args.chunk_size, args.max_chunk_bytes))
+    fast, fast_s = timed(lambda: bulk_bodies(fast_actions, serializer, args.chunk_size, args.max_chunk_bytes))
+
+    legacy_bytes = sum(map(len, legacy))
+    fast_bytes = sum(map(len, fast))
+
+    # Los vectores enviados deben ser los mismos una vez almacenados como float32
+    decoded = [json.loads(line)["embedding"] for line in fast[0].splitlines()[1::2][:50]]
+    identical = all(np.array_equal(np.float32(got), np.float32(sent)) for got, sent in zip(decoded, vectors))
+
+    query = vectors[0]
+    knn_body = lambda vector: {"size": 45, "query": {"bool": {"should": [
+        {"knn": {"embedding": {"vector": vector, "k": 45}}}], "minimum_should_match": 1}}}
+    _, legacy_q = timed(lambda: legacy_serializer.dumps(knn_body(query)).encode("utf-8"), args.queries)
+    _, fast_q = timed(lambda: serializer.dumps(knn_body(FloatVector(query))).encode("utf-8"), args.queries)
+
+    print(f"BULK ({args.docs} docs x {args.dimension} dims, {len(fast)} requests)")
+    print(f"  {'camino':<8} {'µs/doc':>9} {'docs/s':>10} {'bytes/doc':>10} {'MB total':>9}")
+    for name, seconds, size in (('antes', legacy_s, legacy_bytes), ('ahora', fast_s, fast_bytes)):
+        print(f"  {name:<8} {seconds / args.docs * 1e6:>9.1f} {args.docs / seconds:>10.0f} "
+              f"{size / args.docs:>10.0f} {size / 1e6:>9.2f}")
+    print(f"  speedup x{legacy_s / fast_s:.2f}, bytes -{(1 - fast_bytes / legacy_bytes) * 100:.0f}%, "
+          f"vectores idénticos en float32: {identical}")
+    print(f"\nQUERY kNN ({args.queries} cuerpos)")
+    print(f"  antes {legacy_q * 1e6:.1f} µs  ahora {fast_q * 1e6:.1f} µs  (x{legacy_q / fast_q:.2f})")
+
+
+if __name__ == '__main__':
+    main()
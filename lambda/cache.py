@@ -0,0 +1,495 @@
+"""
+Cachés de embeddings y respuestas
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Evita volver a llamar a Bedrock para textos ya vectorizados. La clave es
+sha256(model_id + texto), así que cambiar de modelo invalida todo de forma natural.
+
+Niveles:
+    - LRUTTLCache: memoria del proceso (sobrevive invocaciones warm del Lambda)
+    - CacheBackend: almacenamiento persistente/compartido
+
+AnswerCache reutiliza la LRU para respuestas RAG completas (query.py).
+
+Backends:
+    - none:   sin caché
+    - sqlite: archivo local (por defecto en /tmp, sobrevive invocaciones warm)
+    - s3:     el mismo archivo SQLite sincronizado con S3 (compartido entre
+              ejecuciones); cada flush() sube sólo las entradas nuevas
+    - 'paquete.modulo:Clase': cualquier CacheBackend propio (p.ej. DynamoDB)
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+# ==================== MEMORIA (LRU + TTL) ====================
+class LRUTTLCache:
+    """Caché en memoria con expulsión LRU y expiración por TTL (thread-safe)."""
+
+    def __init__(self, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= self.clock():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (self.clock() + self.ttl_seconds, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# ==================== BACKENDS ====================
+class CacheBackend:
+    """Interfaz mínima de almacenamiento clave → vector."""
+
+    def get(self, key: str) -> Optional[List[float]]:
+        raise NotImplementedError()
+
+    def set(self, key: str, value: List[float]) -> None:
+        raise NotImplementedError()
+
+    def flush(self) -> None:
+        """Persiste escrituras pendientes (se llama al final de cada invocación)."""
+
+
+class NullCacheBackend(CacheBackend):
+    """Backend vacío: todas las consultas son miss."""
+
+    def get(self, key: str) -> Optional[List[float]]:
+        return None
+
+    def set(self, key: str, value: List[float]) -> None:
+        pass
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Almacén local en SQLite. Los vectores se guardan como float32 binario
+    (array('f')) en la tabla embeddings_f32: es la precisión del knn_vector, así
+    que lo indexado no cambia, y ocupa la mitad que float64. Los archivos
+    anteriores guardaban float64 en la tabla embeddings, que se sigue leyendo.
+    """
+
+    COMMIT_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pending = 0
+        self._legacy = False  # Tabla embeddings (float64) de un archivo anterior
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings_f32 (key TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._legacy = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embeddings'").fetchone() is not None
+        return self._conn
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM embeddings_f32 WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                return array('f', row[0]).tolist()
+            if self._legacy:
+                row = conn.execute("SELECT value FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return array('d', row[0]).tolist()
+
+    def set(self, key: str, value: List[float]) -> None:
+        self._store(key, array('f', value).tobytes())
+
+    def _store(self, key: str, blob: bytes) -> None:
+        with self._lock:
+            self._connection().execute("INSERT OR REPLACE INTO embeddings_f32 (key, value) VALUES (?, ?)", (key, blob))
+            self._pending += 1
+            if self._pending >= self.COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.commit()
+                self._pending = 0
+
+
+# Cabecera de cada entrada de un delta: longitud de la clave y del vector float32
+DELTA_ENTRY = struct.Struct('<HI')
+
+
+def encode_delta(entries: Dict[str, bytes]) -> bytes:
+    """Delta de la caché S3: entradas clave → blob float32 seguidas, cada una con su DELTA_ENTRY."""
+    parts = []
+    for key, blob in entries.items():
+        encoded = key.encode('utf-8')
+        parts += [DELTA_ENTRY.pack(len(encoded), len(blob)), encoded, blob]
+    return b''.join(parts)
+
+
+def decode_delta(data: bytes) -> List[tuple]:
+    """Entradas (clave, blob float32) de un delta escrito por encode_delta."""
+    entries, offset = [], 0
+    while offset < len(data):
+        key_size, blob_size = DELTA_ENTRY.unpack_from(data, offset)
+        offset += DELTA_ENTRY.size
+        key = data[offset:offset + key_size].decode('utf-8')
+        offset += key_size
+        entries.append((key, data[offset:offset + blob_size]))
+        offset += blob_size
+    return entries
+
+
+class S3CacheBackend(SQLiteCacheBackend):
+    """
+    SQLite local sincronizado con S3 sin subir el archivo entero en cada flush():
+        - s3://bucket/key: la base completa, descargada en el primer acceso
+        - s3://bucket/key.delta/: un objeto por flush() con sólo las entradas
+          nuevas desde el anterior, que se aplican sobre la base al descargarla
+    Con COMPACT_DELTAS deltas o más, quien descarga sube la base con ellos
+    aplicados y los borra. Los Lambdas que escriben a la vez no se pisan: cada
+    uno sube sus propios deltas.
+    """
+
+    COMPACT_DELTAS = 20
+
+    def __init__(self, bucket: str, key: str, path: str, region: Optional[str] = None):
+        super().__init__(path)
+        self.bucket = bucket
+        self.key = key
+        self.region = region
+        self.delta_prefix = f"{key}.delta/"
+        self._dirty: Dict[str, bytes] = {}
+
+    def _s3(self):
+        import boto3
+        return boto3.client('s3', region_name=self.region)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            s3 = self._s3()
+            try:
+                # Deltas listados antes de descargar la base: uno compactado entre medias ya va en ella
+                deltas = self._list_deltas(s3)
+            except Exception as e:
+                print(f"No se pudieron listar los deltas de la caché de embeddings: {e}")
+                deltas = []
+            try:
+                s3.download_file(self.bucket, self.key, self.path)
+                print(f"Caché de embeddings descargada de s3://{self.bucket}/{self.key}")
+            except Exception as e:
+                print(f"Caché de embeddings no disponible en S3, se crea vacía: {e}")
+            conn = super()._connection()
+            if deltas:
+                self._apply_deltas(s3, conn, deltas)
+        return self._conn
+
+    def _list_deltas(self, s3) -> List[str]:
+        keys, token = [], None
+        while True:
+            page = s3.list_objects_v2(Bucket=self.bucket, Prefix=self.delta_prefix,
+                                      **({'ContinuationToken': token} if token else {}))
+            keys += [item['Key'] for item in page.get('Contents', [])]
+            token = page.get('NextContinuationToken')
+            if not token:
+                return sorted(keys)
+
+    def _apply_deltas(self, s3, conn: sqlite3.Connection, deltas: List[str]) -> None:
+        applied, entries = [], 0
+        for delta in deltas:
+            try:
+                data = s3.get_object(Bucket=self.bucket, Key=delta)['Body'].read()
+            except Exception as e:
+                print(f"Delta de la caché de embeddings no disponible ({delta}): {e}")
+                continue
+            rows = decode_delta(data)
+            conn.executemany("INSERT OR REPLACE INTO embeddings_f32 (key, value) VALUES (?, ?)", rows)
+            applied.append(delta)
+            entries += len(rows)
+        conn.commit()
+        print(f"Caché de embeddings: {len(applied)} deltas aplicados ({entries} entradas)")
+
+        if len(applied) >= self.COMPACT_DELTAS:
+            try:
+                s3.upload_file(self.path, self.bucket, self.key)
+                for start in range(0, len(applied), 1000):
+                    s3.delete_objects(Bucket=self.bucket, Delete={
+                        'Objects': [{'Key': delta} for delta in applied[start:start + 1000]], 'Quiet': True})
+                print(f"Caché de embeddings compactada en s3://{self.bucket}/{self.key}")
+            except Exception as e:
+                print(f"Error compactando la caché de embeddings: {e}")
+
+    def _store(self, key: str, blob: bytes) -> None:
+        super()._store(key, blob)
+        with self._lock:
+            self._dirty[key] = blob
+
+    def flush(self) -> None:
+        super().flush()
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        # Nombre ordenable por fecha y único entre Lambdas concurrentes
+        delta = f"{self.delta_prefix}{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex}"
+        try:
+            self._s3().put_object(Bucket=self.bucket, Key=delta, Body=encode_delta(dirty))
+        except Exception:
+            with self._lock:
+                self._dirty = {**dirty, **self._dirty}  # Se reintenta en el siguiente flush()
+            raise
+        print(f"Caché de embeddings: {len(dirty)} entradas subidas a s3://{self.bucket}/{delta}")
+
+
+def create_cache_backend(kind: str, path: str = '/tmp/embedding_cache.sqlite3',
+                         s3_bucket: str = '', s3_key: str = '', region: Optional[str] = None) -> CacheBackend:
+    """Construye el backend indicado por configuración ('none', 'sqlite', 's3' o 'modulo:Clase')."""
+    kind = (kind or 'none').strip()
+    if kind == 'none':
+        return NullCacheBackend()
+    if kind == 'sqlite':
+        return SQLiteCacheBackend(path)
+    if kind == 's3':
+        if not s3_bucket or not s3_key:
+            print("Caché S3 sin bucket/key configurados, se usa SQLite local")
+            return SQLiteCacheBackend(path)
+        return S3CacheBackend(s3_bucket, s3_key, path, region)
+    if ':' in kind:
+        module_name, class_name = kind.split(':', 1)
+        return getattr(importlib.import_module(module_name), class_name)()
+    raise ValueError(f"Backend de caché desconocido: {kind}")
+
+
+# ==================== CACHÉ DE EMBEDDINGS ====================
+class EmbeddingCache:
+    """
+    Caché de embeddings por hash de (modelo, texto) con estadísticas de hit/miss.
+
+    Con `memory` se consulta primero la LRU del proceso y después el backend;
+    los hits del backend se promueven a memoria.
+    """
+
+    def __init__(self, backend: CacheBackend, model_id: str, memory: Optional[LRUTTLCache] = None):
+        self.backend = backend
+        self.model_id = model_id
+        self.memory = memory
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_id}\x00{text}".encode('utf-8')).hexdigest()
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = self.key(text)
+        if self.memory is not None:
+            value = self.memory.get(key)
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.memory_hits += 1
+                return value
+
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"Error leyendo caché de embeddings: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is not None and self.memory is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, text: str, embedding: List[float]) -> None:
+        key = self.key(text)
+        if self.memory is not None:
+            self.memory.set(key, embedding)
+        try:
+            self.backend.set(key, embedding)
+        except Exception as e:
+            print(f"Error escribiendo caché de embeddings: {e}")
+
+    def flush(self) -> None:
+        try:
+            self.backend.flush()
+        except Exception as e:
+            print(f"Error persistiendo caché de embeddings: {e}")
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'memory_hits': self.memory_hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.memory_hits = 0
+            self.misses = 0
+
+
+# ==================== CACHÉ DE RESPUESTAS ====================
+class AnswerCache:
+    """
+    Respuestas RAG completas por (pregunta normalizada, filtros, generación del índice).
+
+    - Búsqueda exacta por clave (LRU + TTL).
+    - Búsqueda semántica opcional: misma combinación de filtros y similitud
+      coseno del embedding de la pregunta >= similarity_threshold.
+    - set_generation() vacía la caché cuando el indexer publica una generación nueva.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, similarity_threshold: float = 0.0):
+        self.entries = LRUTTLCache(max_size, ttl_seconds)
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        self.generation = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._vectors = OrderedDict()  # clave → (clave de filtros, vector unitario)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def filters_key(filters: Dict) -> str:
+        return json.dumps(filters or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+    def key(self, question: str, filters: Dict) -> str:
+        payload = f"{self.generation}\x00{question}\x00{self.filters_key(filters)}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def set_generation(self, generation: Optional[str]) -> None:
+        """Fija la generación vigente; si cambió, descarta todas las respuestas."""
+        if generation != self.generation:
+            if self.generation is not None:
+                print(f"Nueva generación de índice ({self.generation} → {generation}), caché de respuestas vaciada")
+            self.entries.clear()
+            with self._lock:
+                self._vectors.clear()
+            self.generation = generation
+
+    def get(self, question: str, filters: Dict) -> Optional[Dict]:
+        if self.generation is None:
+            return None
+        answer = self.entries.get(self.key(question, filters))
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def get_similar(self, embedding: List[float], filters: Dict) -> Optional[Dict]:
+        """
+        Respuesta de una pregunta casi idéntica (coseno >= umbral) con los mismos filtros.
+        Cualquier error (numpy, dimensión distinta tras cambiar de modelo) cuenta como miss.
+        """
+        if self.generation is None or self.similarity_threshold <= 0 or not embedding:
+            return None
+        try:
+            import numpy as np
+
+            filters_key = self.filters_key(filters)
+            query = np.asarray(embedding, dtype=np.float32)
+            with self._lock:
+                candidates = [(key, vector) for key, (fkey, vector) in self._vectors.items()
+                              if fkey == filters_key and vector.shape == query.shape]
+            if not candidates:
+                return None
+
+            query /= (np.linalg.norm(query) or 1.0)
+            similarities = np.stack([vector for _, vector in candidates]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+
+            answer = self.entries.get(candidates[best][0])
+        except Exception as e:
+            print(f"Error en la búsqueda semántica de la caché de respuestas: {e}")
+            return None
+        if answer is not None:
+            with self._lock:
+                self.semantic_hits += 1
+        return answer
+
+    def set(self, question: str, filters: Dict, answer: Dict, embedding: Optional[List[float]] = None) -> None:
+        """Guarda la respuesta; si falla, la petición sigue sin cachear."""
+        if self.generation is None:
+            return
+        try:
+            key = self.key(question, filters)
+            self.entries.set(key, answer)
+
+            if self.similarity_threshold > 0 and embedding:
+                import numpy as np
+
+                vector = np.asarray(embedding, dtype=np.float32)
+                vector /= (np.linalg.norm(vector) or 1.0)
+                with self._lock:
+                    self._vectors[key] = (self.filters_key(filters), vector)
+                    self._vectors.move_to_end(key)
+                    while len(self._vectors) > self.max_size:
+                        self._vectors.popitem(last=False)
+        except Exception as e:
+            print(f"Error guardando en la caché de respuestas: {e}")
+
+    def stats(self) -> Dict:
+        # Cada consulta hace una búsqueda exacta; los hits semánticos salen de los misses exactos
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses - self.semantic_hits,
+            'hit_rate': round((self.hits + self.semantic_hits) / total, 4) if total else 0.0,
+            'entries': len(self.entries),
+            'generation': self.generation
+        }
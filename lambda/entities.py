@@ -0,0 +1,81 @@
+"""
+Diccionario de entidades (nombres de aplicación)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+El indexer exporta a artifacts/ los pares (metadata.name → id_app) del índice.
+query.py lo carga una vez por contenedor en un KeywordMatcher (trie
+Aho–Corasick con límites de palabra, matcher.py): cualquier pregunta que nombre
+una aplicación ('¿Qué es X?', 'owner de X', 'X en Perú', ...) se resuelve con un
+term directo sobre metadata.name, sin embedding ni kNN.
+
+Artefacto (JSON utf-8, ~40 bytes por aplicación):
+    {'version': 1, 'generation': ..., 'entities': [[name, [id_app, ...]], ...]}
+"""
+
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from matcher import KeywordMatcher, fold
+
+ENTITY_DICTIONARY_VERSION = 1
+
+
+# ==================== ARTEFACTO ====================
+def build_entity_dictionary(pairs: Iterable[Tuple[str, str]], generation: Optional[str] = None) -> bytes:
+    """Serializa los pares (name, id_app) a bytes JSON, un registro por nombre."""
+    ids_by_name: Dict[str, set] = {}
+    for name, id_app in pairs:
+        if name:
+            ids_by_name.setdefault(name, set()).add(str(id_app))
+    payload = {
+        'version': ENTITY_DICTIONARY_VERSION,
+        'generation': generation,
+        'entities': [[name, sorted(ids)] for name, ids in sorted(ids_by_name.items())],
+    }
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def load_entity_dictionary(data: bytes, min_length: int = 6) -> 'EntityIndex':
+    """Construye un EntityIndex desde los bytes de build_entity_dictionary."""
+    payload = json.loads(data.decode('utf-8'))
+    if payload.get('version') != ENTITY_DICTIONARY_VERSION:
+        raise ValueError(f"Versión de diccionario no soportada: {payload.get('version')}")
+    return EntityIndex({name: ids for name, ids in payload['entities']}, payload.get('generation'), min_length)
+
+
+# ==================== ÍNDICE ====================
+class EntityIndex:
+    """Nombres de aplicación → id_app, con detección en una pasada sobre la pregunta."""
+
+    def __init__(self, entities: Dict[str, List[str]], generation: Optional[str] = None, min_length: int = 6):
+        self.entities = entities
+        self.generation = generation
+        # Los nombres muy cortos ('ATM', 'CRM') chocan con palabras de la pregunta
+        self.matcher = KeywordMatcher()
+        for name in entities:
+            if len(fold(name).strip()) >= min_length:
+                self.matcher.add(name, name, whole_word=True)
+        self.matcher.build()
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def match(self, question: str) -> List[str]:
+        """
+        Nombres canónicos mencionados en la pregunta, en orden de aparición.
+
+        Entre coincidencias solapadas gana la más larga ('Sistema de Pagos
+        Internacionales' frente a 'Sistema de Pagos').
+        """
+        names = []
+        last_end = -1
+        for start, end, name in sorted(self.matcher.find(question), key=lambda m: (m[0], m[0] - m[1])):
+            if start >= last_end:
+                if name not in names:
+                    names.append(name)
+                last_end = end
+        return names
+
+    def ids(self, names: Iterable[str]) -> List[str]:
+        """id_app de los nombres indicados."""
+        return [id_app for name in names for id_app in self.entities.get(name, [])]
@@ -1,16 +1,35 @@
 # lambda_function_csv.py
 # Versión optimizada para embeddings de aplicaciones - VARIABILIZADA
  
+import startup
+startup.install('indexer')  # STARTUP_PROFILE=true: tiempos de import e inicialización
+ 
 import boto3
+import numpy as np
 import pandas as pd
+import codecs
+import hashlib
 import json
 import os
-from io import StringIO
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-from opensearchpy.helpers import bulk
+from collections import deque
+from opensearchpy import OpenSearch
+from opensearchpy.helpers import scan, streaming_bulk
 from opensearchpy.exceptions import NotFoundError
+from cache import EmbeddingCache, create_cache_backend
+from entities import build_entity_dictionary
+from metrics import MetricsCollector
+from opensearch_client import create_client
+from retriever import build_snapshot
+from serializer import FloatVector
+from signer import CachedSigV4Auth
+from startup import lazy_client
+from vectors import check_encoding, dequantize, knn_vector_mapping, mapping_encoding, prepare_vector
 import re
-from typing import Dict, List, Optional, Tuple
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
  
 # --- 1. CONFIGURACIÓN DESDE VARIABLES DE ENTORNO ---
  
@@ -31,34 +50,122 @@ EMBEDDING_DIMENSION = int(os.environ.get('EMBEDDING_DIMENSION', '1536'))
 DEFAULT_S3_BUCKET = os.environ.get('S3_BUCKET', '')
 DEFAULT_S3_KEY = os.environ.get('S3_KEY', 'bbva_applications.csv')
  
+# Modo de indexación:
+#   'full'        borra y recarga todo en el mismo índice
+#   'incremental' sólo filas nuevas/modificadas/eliminadas
+#   'bluegreen'   construye un índice versionado nuevo y mueve el alias OPENSEARCH_INDEX al terminar
+INDEX_MODE = os.environ.get('INDEX_MODE', 'full')
+ 
+# Artefactos propios del indexer en S3 (caché, etc.). El bucket dispara este Lambda
+# con cualquier objeto, así que los eventos bajo este prefijo se ignoran.
+ARTIFACTS_PREFIX = os.environ.get('ARTIFACTS_PREFIX', 'artifacts/')
+ 
+# Caché de embeddings: 'none', 'sqlite' (local en /tmp), 's3' o 'modulo:Clase'
+EMBEDDING_CACHE_BACKEND = os.environ.get('EMBEDDING_CACHE_BACKEND', 'sqlite')
+EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', '/tmp/embedding_cache.sqlite3')
+EMBEDDING_CACHE_S3_BUCKET = os.environ.get('EMBEDDING_CACHE_S3_BUCKET', DEFAULT_S3_BUCKET)
+EMBEDDING_CACHE_S3_KEY = os.environ.get('EMBEDDING_CACHE_S3_KEY', f'{ARTIFACTS_PREFIX}embedding_cache.sqlite3')
+ 
+# Snapshot del índice para el recuperador local de query.py (retriever.py); vacío lo desactiva
+RETRIEVER_SNAPSHOT_KEY = os.environ.get('RETRIEVER_SNAPSHOT_KEY', f'{ARTIFACTS_PREFIX}retriever_snapshot.npz')
+ 
+# Diccionario nombre → id_app para la detección de aplicaciones en query.py (entities.py); vacío lo desactiva
+ENTITY_DICTIONARY_KEY = os.environ.get('ENTITY_DICTIONARY_KEY', f'{ARTIFACTS_PREFIX}entity_dictionary.json')
+ 
 # Chunks
 MAX_CHUNK_SIZE = int(os.environ.get('MAX_CHUNK_SIZE', '500'))
 MIN_CHUNK_SIZE = int(os.environ.get('MIN_CHUNK_SIZE', '50'))
  
 # Performance
-BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '100'))
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '100'))  # Filas leídas por bloque del CSV
+BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', str(5 * 1024 * 1024)))  # Tamaño máximo de cada request bulk
+BULK_MAX_DOCS = int(os.environ.get('BULK_MAX_DOCS', '1000'))  # Tope de documentos por request (manda el tamaño en bytes)
+BULK_LOAD_PROFILE = os.environ.get('BULK_LOAD_PROFILE', 'true').lower() == 'true'  # Sin refresh/réplicas durante cargas completas
 OPENSEARCH_POOL_SIZE = int(os.environ.get('OPENSEARCH_POOL_SIZE', '20'))
 OPENSEARCH_TIMEOUT = int(os.environ.get('OPENSEARCH_TIMEOUT', '30'))
+OPENSEARCH_METRICS = os.environ.get('OPENSEARCH_METRICS', 'false').lower() == 'true'  # Snapshot de MetricsCollector por invocación
+OPENSEARCH_RESPONSE_MODE = os.environ.get('OPENSEARCH_RESPONSE_MODE', 'text')  # 'text', 'bytes' o 'stream' (parseo incremental de hits.hits)
+# 'true': el scroll del snapshot usa un cliente aparte con stream_response. Baja el pico de
+# memoria por página (~26 vs 36 MB con 500 hits de 1536 dims) pero es más lento y un corte
+# a mitad del cuerpo ya no se reintenta (el export falla sin abortar la indexación)
+RETRIEVER_SNAPSHOT_STREAM = os.environ.get('RETRIEVER_SNAPSHOT_STREAM', 'false').lower() == 'true'
+EMBEDDING_MAX_WORKERS = int(os.environ.get('EMBEDDING_MAX_WORKERS', '16'))  # Llamadas concurrentes a Bedrock
  
 # Índice
 INDEX_SHARDS = int(os.environ.get('INDEX_SHARDS', '1'))
 INDEX_REPLICAS = int(os.environ.get('INDEX_REPLICAS', '0'))
 KNN_EF_SEARCH = int(os.environ.get('KNN_EF_SEARCH', '100'))
+KNN_M = int(os.environ.get('KNN_M', '16'))  # Vecinos por nodo del grafo HNSW
+KNN_EF_CONSTRUCTION = int(os.environ.get('KNN_EF_CONSTRUCTION', '100'))  # Candidatos al construir el grafo
+# kNN con filtro (KNN_FILTER_MODE='efficient' en query.py): si el filtro deja como mucho estos docs
+# por segmento, el plugin k-NN calcula las distancias exactas en vez de recorrer el grafo
+# (ver benchmarks/filtered_knn.py). 0 = heurística por defecto del plugin. Es un setting dinámico:
+# se fija al crear el índice y se actualiza en el existente de los modos 'full' e 'incremental'
+KNN_FILTERED_EXACT_THRESHOLD = int(os.environ.get('KNN_FILTERED_EXACT_THRESHOLD', '5000'))
+# Codificación del knn_vector (vectors.py): 'float', 'fp16' (faiss SQ) o 'byte'. Igual que en query.py
+KNN_VECTOR_ENCODING = os.environ.get('KNN_VECTOR_ENCODING', 'float')
+EMBEDDING_NORMALIZE = os.environ.get('EMBEDDING_NORMALIZE', 'false').lower() == 'true'  # Norma 1 antes de indexar
+KNN_SPACE_TYPE = os.environ.get('KNN_SPACE_TYPE', 'innerproduct' if EMBEDDING_NORMALIZE else 'l2')
+KNN_BYTE_SCALE = float(os.environ.get('KNN_BYTE_SCALE', '400'))  # Sólo 'byte': entero = round(x * escala)
+check_encoding(KNN_VECTOR_ENCODING, KNN_SPACE_TYPE)
+INDEX_REFRESH_INTERVAL = os.environ.get('INDEX_REFRESH_INTERVAL', '1s')
+INDEX_GENERATIONS_TO_KEEP = int(os.environ.get('INDEX_GENERATIONS_TO_KEEP', '2'))  # Actual + anterior (rollback)
  
 # --- 2. INICIALIZACIÓN DE CLIENTES ---
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=AWS_REGION)
- 
-credentials = boto3.Session().get_credentials()
-auth = AWSV4SignerAuth(credentials, AWS_REGION, OPENSEARCH_SERVICE)
- 
-opensearch_client = OpenSearch(
-    hosts=[{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
-    http_auth=auth,
-    use_ssl=True,
-    verify_certs=True,
-    connection_class=RequestsHttpConnection,
-    pool_maxsize=OPENSEARCH_POOL_SIZE,
-    timeout=OPENSEARCH_TIMEOUT
+# Se construyen en su primer uso (no al importar): los eventos de artefactos
+# internos se descartan sin crear ningún cliente.
+ 
+# El pool HTTP debe admitir tantas conexiones como hilos de embedding; el modo
+# 'adaptive' reintenta con backoff cuando Bedrock aplica throttling.
+@lazy_client
+def get_bedrock_runtime():
+    return boto3.client(
+        'bedrock-runtime',
+        region_name=AWS_REGION,
+        config=Config(
+            max_pool_connections=EMBEDDING_MAX_WORKERS,
+            retries={'max_attempts': 10, 'mode': 'adaptive'}
+        )
+    )
+ 
+@lazy_client
+def get_s3_client():
+    return boto3.client('s3', region_name=AWS_REGION)
+ 
+# Latencia por endpoint y fase (firma / red / decode / deserialize / 'took'), bytes y
+# reutilización del pool; el handler la imprime al terminar cada carga
+opensearch_metrics = MetricsCollector() if OPENSEARCH_METRICS else None
+
+def create_opensearch_client(response_mode: str = OPENSEARCH_RESPONSE_MODE) -> OpenSearch:
+    credentials = boto3.Session().get_credentials()
+    auth = CachedSigV4Auth(credentials, AWS_REGION, OPENSEARCH_SERVICE)
+    return create_client(
+        OPENSEARCH_HOST, OPENSEARCH_PORT, auth, OPENSEARCH_POOL_SIZE, OPENSEARCH_TIMEOUT,
+        metrics=opensearch_metrics,
+        decode_response=response_mode == 'text',
+        stream_response=response_mode == 'stream'
+    )
+
+@lazy_client
+def get_opensearch_client() -> OpenSearch:
+    return create_opensearch_client()
+
+@lazy_client
+def get_snapshot_client() -> OpenSearch:
+    """Cliente del scroll de export_retriever_snapshot (en streaming sólo con RETRIEVER_SNAPSHOT_STREAM)."""
+    if not RETRIEVER_SNAPSHOT_STREAM:
+        return get_opensearch_client()
+    return create_opensearch_client('stream')
+ 
+embedding_cache = EmbeddingCache(
+    create_cache_backend(
+        EMBEDDING_CACHE_BACKEND,
+        path=EMBEDDING_CACHE_PATH,
+        s3_bucket=EMBEDDING_CACHE_S3_BUCKET,
+        s3_key=EMBEDDING_CACHE_S3_KEY,
+        region=AWS_REGION
+    ),
+    BEDROCK_EMBEDDING_MODEL_ID
 )
  
 # --- 3. FUNCIONES DE PROCESAMIENTO DE TEXTO ---
@@ -70,92 +177,76 @@ def clean_text(text: str) -> str:
     text = re.sub(r'[^\w\s\.\,\;\:\!\?\-\(\)]', ' ', text)
     return text
  
+# Campos del texto enriquecido, en orden: (etiqueta, columna del CSV)
+ENRICHED_TEXT_FIELDS = [
+    ('Criticidad', 'Critic Name'), ('Score', 'Score'), ('Estratégico', 'Estrategic'),
+    ('Clasificación', 'ClassifType'), ('Tipo', 'AppType'), ('Cuadrante', 'Quadrant'),
+    ('Deploy', 'Deploy'), ('Estado', 'Status'), ('DRP', 'DRP'), ('RTO', 'RTO'),
+    ('Dominio Servicio', 'ServiceDomain'), ('Dominio Producto', 'ProductDomain'),
+    ('Especialista', 'Specialist'), ('Arquitecto', 'Architect App'), ('Owner', 'Owner'),
+    ('Año inicio', 'Starting Year'), ('Info crítica', 'Critic Info'), ('Descripción', 'Description'),
+]
+ 
+# Metadatos de texto: (campo, columna del CSV)
+METADATA_VALUE_FIELDS = [
+    ('id_app', 'Id_App'), ('country', 'Country'), ('name', 'Name'), ('critic_name', 'Critic Name'),
+    ('estrategic', 'Estrategic'), ('critic_info', 'Critic Info'), ('classif_type', 'ClassifType'),
+    ('app_type', 'AppType'), ('deploy', 'Deploy'), ('status', 'Status'), ('service_domain', 'ServiceDomain'),
+    ('quadrant', 'Quadrant'), ('product_domain', 'ProductDomain'), ('specialist', 'Specialist'),
+    ('architect_app', 'Architect App'), ('owner', 'Owner'), ('description', 'Description'),
+    ('rto', 'RTO'), ('drp', 'DRP'),
+]
+ 
+METADATA_KEY_ORDER = [
+    'id_app', 'country', 'name', 'critic_name', 'estrategic', 'critic_info', 'score', 'classif_type',
+    'app_type', 'deploy', 'status', 'service_domain', 'quadrant', 'product_domain', 'specialist',
+    'architect_app', 'owner', 'description', 'rto', 'drp', 'starting_year',
+    'is_strategic', 'has_drp', 'is_active', 'is_chunked', 'processed_timestamp'
+]
+ 
+def _column(df: pd.DataFrame, column: str) -> pd.Series:
+    """Columna del DataFrame; si falta, una columna de NaN (equivale a row.get sin valor)."""
+    if column in df.columns:
+        return df[column]
+    return pd.Series(float('nan'), index=df.index, dtype=object)
+ 
+def _is_empty(values: pd.Series) -> pd.Series:
+    """Equivalente vectorial de `pd.isna(v) or not v`."""
+    empty = values.isna()
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+        return empty | (values == 0)
+    if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        return empty | (values == '')
+    # Columnas object con tipos mezclados (p.ej. una fila suelta): elemento a elemento
+    return pd.Series([pd.isna(v) or not v for v in values], index=values.index)
+ 
+def clean_column(values: pd.Series) -> pd.Series:
+    """clean_text aplicado a una columna completa con operaciones de string de pandas."""
+    empty = _is_empty(values)
+    text = values.astype(str).str.strip()
+    text = text.str.replace(r'\s+', ' ', regex=True)
+    text = text.str.replace(r'[^\w\s\.\,\;\:\!\?\-\(\)]', ' ', regex=True)
+    return text.where(~empty, '').astype(object)
+ 
+def _labelled(values: pd.Series, prefix: str, suffix: str = '') -> pd.Series:
+    """prefix + valor + suffix donde el valor no está vacío; '' en el resto."""
+    return (prefix + values + suffix).where(values != '', '')
+ 
+def create_enriched_texts(df: pd.DataFrame) -> pd.Series:
+    """
+    Texto enriquecido de todas las filas a la vez (misma salida que la versión fila a fila).
+ 
+    Formato: "[País] Nombre (ID: x) | Etiqueta: valor | ..." omitiendo los campos vacíos.
+    """
+    texts = '[' + clean_column(_column(df, 'Country')) + '] ' + clean_column(_column(df, 'Name'))
+    texts = texts + _labelled(clean_column(_column(df, 'Id_App')), ' (ID: ', ')')
+    for label, column in ENRICHED_TEXT_FIELDS:
+        texts = texts + _labelled(clean_column(_column(df, column)), f' | {label}: ')
+    return texts
+ 
 def create_enriched_text(row: pd.Series) -> str:
     """Crea texto enriquecido con contexto para embedding de aplicaciones."""
-    id_app = clean_text(row.get('Id_App', ''))
-    country = clean_text(row.get('Country', ''))
-    name = clean_text(row.get('Name', ''))
-    critic_name = clean_text(row.get('Critic Name', ''))
-    estrategic = clean_text(row.get('Estrategic', ''))
-    critic_info = clean_text(row.get('Critic Info', ''))
-    score = clean_text(row.get('Score', ''))
-    classif_type = clean_text(row.get('ClassifType', ''))
-    app_type = clean_text(row.get('AppType', ''))
-    deploy = clean_text(row.get('Deploy', ''))
-    status = clean_text(row.get('Status', ''))
-    service_domain = clean_text(row.get('ServiceDomain', ''))
-    quadrant = clean_text(row.get('Quadrant', ''))
-    product_domain = clean_text(row.get('ProductDomain', ''))
-    specialist = clean_text(row.get('Specialist', ''))
-    architect_app = clean_text(row.get('Architect App', ''))
-    owner = clean_text(row.get('Owner', ''))
-    description = clean_text(row.get('Description', ''))
-    rto = clean_text(row.get('RTO', ''))
-    drp = clean_text(row.get('DRP', ''))
-    starting_year = clean_text(row.get('Starting Year', ''))
- 
-    base_text = f"[{country}] {name}"
-   
-    if id_app:
-        base_text += f" (ID: {id_app})"
- 
-    criticality_info = []
-    if critic_name:
-        criticality_info.append(f"Criticidad: {critic_name}")
-    if score:
-        criticality_info.append(f"Score: {score}")
-    if estrategic:
-        criticality_info.append(f"Estratégico: {estrategic}")
-    if criticality_info:
-        base_text += f" | {' | '.join(criticality_info)}"
- 
-    type_info = []
-    if classif_type:
-        type_info.append(f"Clasificación: {classif_type}")
-    if app_type:
-        type_info.append(f"Tipo: {app_type}")
-    if quadrant:
-        type_info.append(f"Cuadrante: {quadrant}")
-    if type_info:
-        base_text += f" | {' | '.join(type_info)}"
- 
-    deploy_info = []
-    if deploy:
-        deploy_info.append(f"Deploy: {deploy}")
-    if status:
-        deploy_info.append(f"Estado: {status}")
-    if drp:
-        deploy_info.append(f"DRP: {drp}")
-    if rto:
-        deploy_info.append(f"RTO: {rto}")
-    if deploy_info:
-        base_text += f" | {' | '.join(deploy_info)}"
- 
-    domain_info = []
-    if service_domain:
-        domain_info.append(f"Dominio Servicio: {service_domain}")
-    if product_domain:
-        domain_info.append(f"Dominio Producto: {product_domain}")
-    if specialist:
-        domain_info.append(f"Especialista: {specialist}")
-    if architect_app:
-        domain_info.append(f"Arquitecto: {architect_app}")
-    if owner:
-        domain_info.append(f"Owner: {owner}")
-    if domain_info:
-        base_text += f" | {' | '.join(domain_info)}"
- 
-    additional_info = []
-    if starting_year:
-        additional_info.append(f"Año inicio: {starting_year}")
-    if critic_info:
-        additional_info.append(f"Info crítica: {critic_info}")
-    if description:
-        additional_info.append(f"Descripción: {description}")
-    if additional_info:
-        base_text += f" | {' | '.join(additional_info)}"
- 
-    return base_text
+    return create_enriched_texts(row.to_frame().T).iloc[0]
  
 def create_chunks(text: str, metadata: Dict) -> List[Tuple[str, Dict]]:
     """Divide texto largo en chunks manteniendo contexto."""
@@ -199,11 +290,8 @@ def create_chunks(text: str, metadata: Dict) -> List[Tuple[str, Dict]]:
  
     return chunks
  
-def create_metadata(row: pd.Series, chunk_info: Optional[Dict] = None) -> Dict:
-    """Crea metadatos estructurados para el documento."""
-    def clean_value(value, default=""):
-        return default if pd.isna(value) else value
- 
+def create_metadata_records(df: pd.DataFrame, processed_timestamp: str) -> List[Dict]:
+    """Metadatos estructurados de todas las filas, construidos columna a columna."""
     def clean_numeric(value, default=0):
         try:
             return float(value) if not pd.isna(value) else default
@@ -216,36 +304,30 @@ def create_metadata(row: pd.Series, chunk_info: Optional[Dict] = None) -> Dict:
         except:
             return default
  
-    metadata = {
-        'id_app': clean_value(row.get('Id_App')),
-        'country': clean_value(row.get('Country')),
-        'name': clean_value(row.get('Name')),
-        'critic_name': clean_value(row.get('Critic Name')),
-        'estrategic': clean_value(row.get('Estrategic')),
-        'critic_info': clean_value(row.get('Critic Info')),
-        'score': clean_numeric(row.get('Score')),
-        'classif_type': clean_value(row.get('ClassifType')),
-        'app_type': clean_value(row.get('AppType')),
-        'deploy': clean_value(row.get('Deploy')),
-        'status': clean_value(row.get('Status')),
-        'service_domain': clean_value(row.get('ServiceDomain')),
-        'quadrant': clean_value(row.get('Quadrant')),
-        'product_domain': clean_value(row.get('ProductDomain')),
-        'specialist': clean_value(row.get('Specialist')),
-        'architect_app': clean_value(row.get('Architect App')),
-        'owner': clean_value(row.get('Owner')),
-        'description': clean_value(row.get('Description')),
-        'rto': clean_value(row.get('RTO')),
-        'drp': clean_value(row.get('DRP')),
-        'starting_year': clean_int(row.get('Starting Year')),
- 
-        'is_strategic': clean_value(row.get('Estrategic', '')).upper() == 'SI',
-        'has_drp': bool(clean_value(row.get('DRP'))),
-        'is_active': clean_value(row.get('Status', '')).lower() in ['activo', 'active', 'en uso'],
-       
-        'is_chunked': False,
-        'processed_timestamp': pd.Timestamp.now().isoformat()
-    }
+    columns = {}
+    for field, column in METADATA_VALUE_FIELDS:
+        values = _column(df, column).astype(object)
+        columns[field] = values.where(values.notna(), "")
+ 
+    # Listas (no Series) para conservar el 0 entero por defecto junto a floats
+    columns['score'] = pd.Series([clean_numeric(v) for v in _column(df, 'Score').astype(object)], index=df.index, dtype=object)
+    columns['starting_year'] = pd.Series([clean_int(v) for v in _column(df, 'Starting Year').astype(object)], index=df.index, dtype=object)
+ 
+    estrategic = columns['estrategic'].astype(str)
+    status = columns['status'].astype(str)
+    columns['is_strategic'] = estrategic.str.upper() == 'SI'
+    columns['has_drp'] = ~_is_empty(_column(df, 'DRP'))
+    columns['is_active'] = status.str.lower().isin(['activo', 'active', 'en uso'])
+ 
+    columns['is_chunked'] = pd.Series(False, index=df.index)
+    columns['processed_timestamp'] = pd.Series(processed_timestamp, index=df.index, dtype=object)
+ 
+    ordered = [columns[key].tolist() for key in METADATA_KEY_ORDER]
+    return [dict(zip(METADATA_KEY_ORDER, values)) for values in zip(*ordered)]
+ 
+def create_metadata(row: pd.Series, chunk_info: Optional[Dict] = None) -> Dict:
+    """Crea metadatos estructurados para el documento."""
+    metadata = create_metadata_records(row.to_frame().T, pd.Timestamp.now().isoformat())[0]
  
     if chunk_info:
         metadata.update(chunk_info)
@@ -253,102 +335,227 @@ def create_metadata(row: pd.Series, chunk_info: Optional[Dict] = None) -> Dict:
  
     return metadata
  
+def row_fingerprint(enriched_text: str, metadata: Dict) -> str:
+    """Huella del contenido de una fila (sin timestamp) + configuración que afecta a sus chunks/embeddings."""
+    stable_metadata = {k: v for k, v in metadata.items() if k != 'processed_timestamp'}
+    payload = json.dumps(
+        [BEDROCK_EMBEDDING_MODEL_ID, MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, enriched_text, stable_metadata],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+ 
+def document_id(row_key: str, chunk_metadata: Dict) -> str:
+    """_id estable por chunk: '<Id_App>-<chunk_number>'."""
+    return f"{row_key}-{chunk_metadata.get('chunk_number', 0)}"
+ 
 # --- 4. FUNCIONES DE EMBEDDING ---
 def create_embedding(text: str) -> List[float]:
-    """Crea embedding usando Amazon Bedrock."""
+    """Crea embedding usando Amazon Bedrock (sólo si el texto no está en caché)."""
+    cached = embedding_cache.get(text)
+    if cached is not None:
+        return cached
+ 
     try:
         body = json.dumps({"inputText": text})
-        response = bedrock_runtime.invoke_model(
+        response = get_bedrock_runtime().invoke_model(
             body=body,
             modelId=BEDROCK_EMBEDDING_MODEL_ID,
             accept="application/json",
             contentType="application/json"
         )
         response_body = json.loads(response.get("body").read())
-        return response_body.get("embedding")
+        embedding = response_body.get("embedding")
+        if embedding:
+            embedding_cache.set(text, embedding)
+        return embedding
     except Exception as e:
         print(f"Error creando embedding: {e}")
         return None
  
-def process_csv_data(bucket: str, key: str) -> List[Dict]:
-    """Procesa datos del CSV y crea documentos para indexar."""
-    s3_client = boto3.client('s3', region_name=AWS_REGION)
+def embed_chunks(chunks: Iterable[Tuple[str, int, str, Dict]], stats: Dict) -> Iterator[Tuple[str, int, str, Dict, Optional[List[float]]]]:
+    """
+    Genera embeddings en paralelo conservando el orden de entrada.
+ 
+    Mantiene como máximo 2 * EMBEDDING_MAX_WORKERS chunks en vuelo: la memoria
+    queda acotada aunque el CSV sea grande y los hilos nunca esperan al más lento del lote.
+    """
+    window = 2 * EMBEDDING_MAX_WORKERS
+    in_flight = deque()
+    embedded = 0
+    start = time.perf_counter()
+ 
+    with ThreadPoolExecutor(max_workers=EMBEDDING_MAX_WORKERS) as executor:
+        for doc_id, index, chunk_text, chunk_metadata in chunks:
+            in_flight.append((doc_id, index, chunk_text, chunk_metadata, executor.submit(create_embedding, chunk_text)))
+            if len(in_flight) >= window:
+                doc_id, index, chunk_text, chunk_metadata, future = in_flight.popleft()
+                embedded += 1
+                yield doc_id, index, chunk_text, chunk_metadata, future.result()
+ 
+        while in_flight:
+            doc_id, index, chunk_text, chunk_metadata, future = in_flight.popleft()
+            embedded += 1
+            yield doc_id, index, chunk_text, chunk_metadata, future.result()
+ 
+    elapsed = time.perf_counter() - start
+    throughput = embedded / elapsed if elapsed > 0 else 0.0
+    stats['embedding_seconds'] = round(elapsed, 2)
+    print(f"Embeddings: {embedded} chunks en {elapsed:.2f}s ({throughput:.1f} chunks/s, {EMBEDDING_MAX_WORKERS} hilos)")
+ 
+def iter_csv_batches(bucket: str, key: str) -> Iterator[pd.DataFrame]:
+    """Lee el CSV de S3 en bloques de BATCH_SIZE filas sin descargarlo completo en memoria."""
+    s3_client = get_s3_client()
     obj = s3_client.get_object(Bucket=bucket, Key=key)
-   
-    csv_content = obj['Body'].read().decode('utf-8')
-    df = pd.read_csv(StringIO(csv_content))
  
-    documents = []
-    processed_count = 0
-    skipped_count = 0
+    # El decoder incremental respeta caracteres multibyte partidos entre lecturas
+    reader = codecs.getreader('utf-8')(obj['Body'])
+    with pd.read_csv(reader, chunksize=BATCH_SIZE) as batches:
+        yield from batches
  
-    print(f"Procesando {len(df)} registros del CSV...")
+def iter_chunks(bucket: str, key: str, stats: Dict, indexed: Optional[Dict[str, Dict]] = None,
+                processed_timestamp: Optional[str] = None) -> Iterator[Tuple[str, int, str, Dict]]:
+    """
+    Produce (_id, fila, texto, metadatos) por cada chunk del CSV.
  
-    for index, row in df.iterrows():
-        try:
-            enriched_text = create_enriched_text(row)
+    El texto enriquecido y los metadatos se calculan por columnas para cada bloque
+    de filas; sólo el chunking recorre fila a fila.
  
-            if not enriched_text or len(enriched_text.strip()) < 10:
-                skipped_count += 1
-                continue
+    En modo incremental (indexed = huellas ya indexadas) las filas cuya huella no
+    cambió se omiten; sus _id se registran en stats['keep_ids'] para no borrarlos.
+    """
+    seen_row_keys = set()
+    if processed_timestamp is None:
+        processed_timestamp = pd.Timestamp.now().isoformat()
  
-            base_metadata = create_metadata(row)
-            chunks = create_chunks(enriched_text, base_metadata)
- 
-            for chunk_text, chunk_metadata in chunks:
-                embedding = create_embedding(chunk_text)
- 
-                if embedding:
-                    document = {
-                        "_index": OPENSEARCH_INDEX,
-                        "_source": {
-                            "text_content": chunk_text,
-                            "embedding": embedding,
-                            "metadata": chunk_metadata,
-                            "original_row_index": index
-                        }
-                    }
-                    documents.append(document)
-                    processed_count += 1
-                else:
-                    print(f"Error creando embedding para fila {index}")
+    for df in iter_csv_batches(bucket, key):
+        stats['rows_read'] += len(df)
+ 
+        enriched_texts = create_enriched_texts(df)
+        metadata_records = create_metadata_records(df, processed_timestamp)
  
-        except Exception as e:
-            print(f"Error procesando fila {index}: {e}")
-            skipped_count += 1
+        for index, enriched_text, base_metadata in zip(df.index, enriched_texts, metadata_records):
+            try:
+                if not enriched_text or len(enriched_text.strip()) < 10:
+                    stats['skipped'] += 1
+                    continue
  
-    print(f"Procesamiento completado: {processed_count} documentos creados, {skipped_count} registros omitidos")
-    return documents
+                base_metadata['content_hash'] = row_fingerprint(enriched_text, base_metadata)
  
-# --- 5. FUNCIONES DE OPENSEARCH ---
-def create_opensearch_index():
-    """Crea índice optimizado en OpenSearch."""
-    if opensearch_client.indices.exists(index=OPENSEARCH_INDEX):
-        print(f"El índice '{OPENSEARCH_INDEX}' ya existe.")
-        return True
+                # Clave de fila: Id_App (o la posición si falta o está duplicado)
+                row_key = str(base_metadata['id_app']) if base_metadata['id_app'] != "" else f"row{index}"
+                if row_key in seen_row_keys:
+                    row_key = f"{row_key}@{index}"
+                seen_row_keys.add(row_key)
+ 
+                previous = indexed.get(row_key) if indexed is not None else None
+                if previous and previous['content_hash'] == base_metadata['content_hash']:
+                    stats['unchanged'] += 1
+                    stats['keep_ids'].update(previous['ids'])
+                    continue
  
-    print(f"Creando índice optimizado '{OPENSEARCH_INDEX}' en OpenSearch...")
+                for chunk_text, chunk_metadata in create_chunks(enriched_text, base_metadata):
+                    doc_id = document_id(row_key, chunk_metadata)
+                    stats['keep_ids'].add(doc_id)
+                    yield doc_id, index, chunk_text, chunk_metadata
  
+            except Exception as e:
+                print(f"Error procesando fila {index}: {e}")
+                stats['skipped'] += 1
+ 
+def iter_documents(bucket: str, key: str, stats: Optional[Dict] = None, indexed: Optional[Dict[str, Dict]] = None,
+                   index_name: str = OPENSEARCH_INDEX) -> Iterator[Dict]:
+    """
+    Pipeline en streaming: S3 → filas → chunks → embeddings → acciones bulk.
+ 
+    Los documentos salen ordenados por original_row_index y se consumen a medida
+    que se generan (p.ej. por streaming_bulk), así que el pico de memoria depende
+    del tamaño de lote y no del tamaño del archivo.
+ 
+    Con `indexed` (ver fetch_indexed_fingerprints) sólo se reindexan las filas
+    modificadas y al final se emiten deletes para los _id que ya no existen.
+    """
+    if stats is None:
+        stats = {}
+    stats.update({
+        'rows_read': 0, 'processed': 0, 'skipped': 0, 'embedding_errors': 0,
+        'unchanged': 0, 'deleted': 0, 'keep_ids': set()
+    })
+ 
+    # Un único timestamp por ejecución para todos los documentos
+    processed_timestamp = pd.Timestamp.now().isoformat()
+    chunks = iter_chunks(bucket, key, stats, indexed, processed_timestamp)
+ 
+    for doc_id, index, chunk_text, chunk_metadata, embedding in embed_chunks(chunks, stats):
+        if not embedding:
+            # Si ya existía una versión anterior se conserva (su huella vieja fuerza el reintento)
+            print(f"Error creando embedding para fila {index}")
+            stats['embedding_errors'] += 1
+            continue
+ 
+        stats['processed'] += 1
+        yield {
+            "_index": index_name,
+            "_id": doc_id,
+            "_source": {
+                "text_content": chunk_text,
+                "embedding": knn_value(embedding),
+                "metadata": chunk_metadata,
+                "original_row_index": index
+            }
+        }
+ 
+    # Borrar chunks de filas eliminadas o que ahora generan menos chunks
+    if indexed and stats['rows_read']:
+        for previous in indexed.values():
+            for doc_id in previous['ids'] - stats['keep_ids']:
+                stats['deleted'] += 1
+                yield {"_op_type": "delete", "_index": index_name, "_id": doc_id}
+ 
+    print(f"Procesamiento completado: {stats['rows_read']} registros leídos, "
+          f"{stats['processed']} documentos creados, {stats['unchanged']} filas sin cambios, "
+          f"{stats['deleted']} documentos eliminados, {stats['skipped']} registros omitidos")
+ 
+def process_csv_data(bucket: str, key: str) -> List[Dict]:
+    """Procesa datos del CSV y devuelve todos los documentos en memoria (usar iter_documents para streaming)."""
+    return list(iter_documents(bucket, key))
+ 
+# --- 5. FUNCIONES DE OPENSEARCH ---
+def knn_value(embedding: List[float], encoding: str = KNN_VECTOR_ENCODING):
+    """Embedding codificado para el knn_vector (KNN_VECTOR_ENCODING / EMBEDDING_NORMALIZE)."""
+    if encoding != 'byte' and not EMBEDDING_NORMALIZE:
+        return FloatVector(embedding)  # Se serializa con precisión float32 (la del knn_vector)
+    vector = prepare_vector(embedding, encoding, EMBEDDING_NORMALIZE, KNN_BYTE_SCALE)
+    return vector if encoding == 'byte' else FloatVector(vector)
+ 
+def build_index_body(bulk_load: bool = False, m: int = KNN_M, ef_construction: int = KNN_EF_CONSTRUCTION,
+                     encoding: str = KNN_VECTOR_ENCODING, space_type: str = KNN_SPACE_TYPE) -> Dict:
+    """
+    Settings + mappings del índice.
+ 
+    Con bulk_load=True el índice nace sin refresh ni réplicas (carga masiva);
+    finalize_bulk_load restaura los valores de servicio. m / ef_construction
+    fijan el compromiso tiempo de construcción vs recall del grafo HNSW
+    (ver benchmarks/bulk_profiles.py); encoding / space_type, la memoria por
+    vector (ver vectors.py y benchmarks/vector_quantization.py).
+    """
     settings = {
+        "knn": True,
+        "knn.algo_param.ef_search": KNN_EF_SEARCH,
+        "number_of_shards": INDEX_SHARDS,
+        "number_of_replicas": 0 if bulk_load else INDEX_REPLICAS,
+        "refresh_interval": "-1" if bulk_load else INDEX_REFRESH_INTERVAL
+    }
+    if KNN_FILTERED_EXACT_THRESHOLD > 0:
+        settings["knn.advanced.filtered_exact_search_threshold"] = KNN_FILTERED_EXACT_THRESHOLD
+    return {
         "settings": {
-            "index": {
-                "knn": True,
-                "knn.algo_param.ef_search": KNN_EF_SEARCH,
-                "number_of_shards": INDEX_SHARDS,
-                "number_of_replicas": INDEX_REPLICAS
-            }
+            "index": settings
         },
         "mappings": {
             "properties": {
-                "embedding": {
-                    "type": "knn_vector",
-                    "dimension": EMBEDDING_DIMENSION,
-                    "method": {
-                        "name": "hnsw",
-                        "space_type": "l2",
-                        "engine": "faiss"
-                    }
-                },
+                "embedding": knn_vector_mapping(
+                    EMBEDDING_DIMENSION, encoding, space_type, m, ef_construction, KNN_EF_SEARCH
+                ),
                 "text_content": {
                     "type": "text",
                     "analyzer": "standard"
@@ -382,6 +589,7 @@ def create_opensearch_index():
                         "is_active": {"type": "boolean"},
  
                         "is_chunked": {"type": "boolean"},
+                        "content_hash": {"type": "keyword"},
                         "processed_timestamp": {"type": "date"},
                         "chunk_number": {"type": "integer"},
                         "total_chunks": {"type": "integer"}
@@ -392,15 +600,227 @@ def create_opensearch_index():
         }
     }
  
-    opensearch_client.indices.create(index=OPENSEARCH_INDEX, body=settings)
+def create_opensearch_index(index_name: str = OPENSEARCH_INDEX, bulk_load: bool = False):
+    """Crea índice optimizado en OpenSearch."""
+    if get_opensearch_client().indices.exists(index=index_name):
+        print(f"El índice '{index_name}' ya existe.")
+        warn_on_vector_mapping_change(index_name)
+        apply_filtered_exact_threshold(index_name)
+        return True
+ 
+    print(f"Creando índice optimizado '{index_name}' en OpenSearch...")
+ 
+    get_opensearch_client().indices.create(index=index_name, body=build_index_body(bulk_load))
     print("Índice creado exitosamente.")
     return False
  
+def apply_filtered_exact_threshold(index_name: str):
+    """Aplica KNN_FILTERED_EXACT_THRESHOLD a un índice existente (None devuelve el setting al valor del plugin)."""
+    try:
+        get_opensearch_client().indices.put_settings(
+            index=index_name,
+            body={"index": {"knn.advanced.filtered_exact_search_threshold": KNN_FILTERED_EXACT_THRESHOLD or None}}
+        )
+    except Exception as e:
+        print(f"No se pudo actualizar filtered_exact_search_threshold de '{index_name}': {e}")
+ 
+def warn_on_vector_mapping_change(index_name: str):
+    """Avisa si el knn_vector existente no tiene la codificación configurada (el mapping no se puede cambiar)."""
+    try:
+        for name, mapping in get_opensearch_client().indices.get_mapping(index=index_name).items():
+            current = mapping.get("mappings", {}).get("properties", {}).get("embedding", {})
+            if current and mapping_encoding(current) != (KNN_VECTOR_ENCODING, KNN_SPACE_TYPE):
+                print(f"AVISO: el knn_vector de '{name}' es {mapping_encoding(current)}, no "
+                      f"({KNN_VECTOR_ENCODING}, {KNN_SPACE_TYPE}); hace falta una generación nueva (INDEX_MODE=bluegreen)")
+    except Exception as e:
+        print(f"No se pudo comprobar el mapping de '{index_name}': {e}")
+ 
+# --- 5b. CARGA MASIVA Y BLUE/GREEN: GENERACIONES DE ÍNDICE DETRÁS DEL ALIAS ---
+def new_generation_name() -> str:
+    """Nombre del índice versionado: '<alias>-<YYYYmmddHHMMSS>' (ordenable por nombre)."""
+    return f"{OPENSEARCH_INDEX}-{time.strftime('%Y%m%d%H%M%S', time.gmtime())}"
+ 
+def begin_bulk_load(index_name: str):
+    """Desactiva refresh y réplicas de un índice existente antes de una carga completa."""
+    get_opensearch_client().indices.put_settings(
+        index=index_name,
+        body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}}
+    )
+ 
+def finalize_bulk_load(index_name: str):
+    """Tras la carga: refresh, force-merge a un segmento y settings de servicio."""
+    print(f"Finalizando carga de '{index_name}' (refresh + force-merge)...")
+    get_opensearch_client().indices.refresh(index=index_name)
+    get_opensearch_client().indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=600)
+    get_opensearch_client().indices.put_settings(
+        index=index_name,
+        body={"index": {"refresh_interval": INDEX_REFRESH_INTERVAL, "number_of_replicas": INDEX_REPLICAS}}
+    )
+ 
+def publish_index_generation(index_name: str) -> str:
+    """
+    Marca el índice con una generación nueva en _meta.generation.
+    query.py la consulta para invalidar su caché de respuestas.
+    """
+    generation = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+    get_opensearch_client().indices.put_mapping(index=index_name, body={"_meta": {"generation": generation}})
+    print(f"Generación publicada en '{index_name}': {generation}")
+    return generation
+ 
+def swap_alias(index_name: str):
+    """Apunta el alias OPENSEARCH_INDEX a index_name en una única operación atómica."""
+    actions = []
+    if get_opensearch_client().indices.exists_alias(name=OPENSEARCH_INDEX):
+        for old_index in get_opensearch_client().indices.get_alias(name=OPENSEARCH_INDEX):
+            actions.append({"remove": {"index": old_index, "alias": OPENSEARCH_INDEX}})
+    elif get_opensearch_client().indices.exists(index=OPENSEARCH_INDEX):
+        # Migración: el nombre lo ocupa un índice concreto de los modos 'full'/'incremental'
+        actions.append({"remove_index": {"index": OPENSEARCH_INDEX}})
+    actions.append({"add": {"index": index_name, "alias": OPENSEARCH_INDEX}})
+ 
+    get_opensearch_client().indices.update_aliases(body={"actions": actions})
+    print(f"Alias '{OPENSEARCH_INDEX}' → '{index_name}'")
+ 
+def discard_generation(index_name: str):
+    """Borra una generación que no llegó a publicarse (el alias nunca apuntó a ella)."""
+    try:
+        get_opensearch_client().indices.delete(index=index_name)
+        print(f"Generación sin publicar '{index_name}' eliminada.")
+    except Exception as e:
+        print(f"No se pudo eliminar la generación sin publicar '{index_name}': {e}")
+ 
+def delete_old_generations(keep: int = INDEX_GENERATIONS_TO_KEEP):
+    """Elimina generaciones antiguas conservando las `keep` más recientes (y nunca la activa)."""
+    active = set()
+    if get_opensearch_client().indices.exists_alias(name=OPENSEARCH_INDEX):
+        active = set(get_opensearch_client().indices.get_alias(name=OPENSEARCH_INDEX))
+ 
+    pattern = re.compile(rf"^{re.escape(OPENSEARCH_INDEX)}-\d{{14}}$")
+    generations = sorted(
+        (name for name in get_opensearch_client().indices.get(index=f"{OPENSEARCH_INDEX}-*") if pattern.match(name)),
+        reverse=True
+    )
+    for old_index in generations[keep:]:
+        if old_index in active:
+            continue
+        print(f"Eliminando generación antigua '{old_index}'")
+        get_opensearch_client().indices.delete(index=old_index)
+ 
+def fetch_indexed_fingerprints() -> Dict[str, Dict]:
+    """
+    Lee del índice la huella de contenido de cada fila ya indexada.
+ 
+    Returns:
+        {row_key: {'content_hash': str, 'ids': set(_id de sus chunks)}}
+    """
+    indexed = {}
+    for hit in scan(
+        get_opensearch_client(),
+        index=OPENSEARCH_INDEX,
+        query={"query": {"match_all": {}}, "_source": ["metadata.content_hash"]},
+        size=1000
+    ):
+        row_key = hit['_id'].rsplit('-', 1)[0]
+        content_hash = hit.get('_source', {}).get('metadata', {}).get('content_hash')
+        entry = indexed.setdefault(row_key, {'content_hash': content_hash, 'ids': set()})
+        # Si los chunks de una fila discrepan, la fila se considera modificada
+        if entry['content_hash'] != content_hash:
+            entry['content_hash'] = None
+        entry['ids'].add(hit['_id'])
+    print(f"Huellas indexadas: {len(indexed)} filas")
+    return indexed
+ 
+def export_retriever_snapshot(index_name: str, bucket: str, generation: Optional[str]) -> Optional[str]:
+    """
+    Vuelca embeddings, texto y metadata del índice a un snapshot .npz en S3
+    (RETRIEVER_SNAPSHOT_KEY) que query.py carga como recuperador local.
+ 
+    Returns:
+        Clave S3 escrita, o None si está desactivado o falla (no aborta la indexación)
+    """
+    if not RETRIEVER_SNAPSHOT_KEY:
+        return None
+    try:
+        # En modo incremental el índice no se ha refrescado todavía
+        get_opensearch_client().indices.refresh(index=index_name)
+        ids, texts, metadatas, vectors = [], [], [], []
+        for hit in scan(
+            get_snapshot_client(),
+            index=index_name,
+            query={"query": {"match_all": {}}, "_source": ["text_content", "metadata", "embedding"]},
+            size=500
+        ):
+            source = hit.get('_source', {})
+            if not source.get('embedding'):
+                continue
+            ids.append(hit['_id'])
+            texts.append(source.get('text_content', ''))
+            metadatas.append(source.get('metadata', {}))
+            vectors.append(source['embedding'])
+ 
+        embeddings = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), EMBEDDING_DIMENSION)
+        if KNN_VECTOR_ENCODING == 'byte':
+            embeddings = dequantize(embeddings, KNN_BYTE_SCALE)
+        data = build_snapshot(ids, texts, metadatas, embeddings, generation, space_type=KNN_SPACE_TYPE)
+        get_s3_client().put_object(
+            Bucket=bucket, Key=RETRIEVER_SNAPSHOT_KEY, Body=data, ContentType='application/octet-stream'
+        )
+        print(f"Snapshot del recuperador local: {len(ids)} documentos, {len(data) // 1024} KB en s3://{bucket}/{RETRIEVER_SNAPSHOT_KEY}")
+        return RETRIEVER_SNAPSHOT_KEY
+    except Exception as e:
+        print(f"No se pudo exportar el snapshot del recuperador local: {e}")
+        return None
+ 
+def export_entity_dictionary(index_name: str, bucket: str, generation: Optional[str]) -> Optional[str]:
+    """
+    Vuelca los pares metadata.name → id_app del índice a un diccionario JSON en S3
+    (ENTITY_DICTIONARY_KEY) que query.py usa para reconocer aplicaciones por nombre.
+ 
+    Returns:
+        Clave S3 escrita, o None si está desactivado o falla (no aborta la indexación)
+    """
+    if not ENTITY_DICTIONARY_KEY:
+        return None
+    try:
+        get_opensearch_client().indices.refresh(index=index_name)
+        pairs = []
+        for hit in scan(
+            get_opensearch_client(),
+            index=index_name,
+            query={"query": {"match_all": {}}, "_source": ["metadata.name", "metadata.id_app"]},
+            size=1000
+        ):
+            metadata = hit.get('_source', {}).get('metadata', {})
+            pairs.append((metadata.get('name'), metadata.get('id_app')))
+ 
+        data = build_entity_dictionary(pairs, generation)
+        get_s3_client().put_object(
+            Bucket=bucket, Key=ENTITY_DICTIONARY_KEY, Body=data, ContentType='application/json'
+        )
+        print(f"Diccionario de entidades: {len(data) // 1024} KB en s3://{bucket}/{ENTITY_DICTIONARY_KEY}")
+        return ENTITY_DICTIONARY_KEY
+    except Exception as e:
+        print(f"No se pudo exportar el diccionario de entidades: {e}")
+        return None
+ 
 # --- 6. FUNCIÓN PRINCIPAL DE LAMBDA ---
 def handler(event, context):
     """Función principal optimizada de Lambda para CSV."""
     print(f"Iniciando procesamiento - Región: {AWS_REGION}, Índice: {OPENSEARCH_INDEX}")
  
+    # Ignorar los eventos que generan los propios artefactos del indexer (evita bucles)
+    records = event.get('Records') or []
+    event_key = records[0].get('s3', {}).get('object', {}).get('key', '') if records else ''
+    if event_key.startswith(ARTIFACTS_PREFIX):
+        print(f"Evento de artefacto interno ({event_key}). Omitiendo.")
+        return {
+            'statusCode': 200,
+            'body': json.dumps('Artefacto interno, no se procesa.')
+        }
+ 
+    embedding_cache.reset_stats()
+    unpublished_index = None  # Generación blue/green creada y aún sin alias: se borra si la carga no termina
+ 
     try:
         # Usar valores por defecto o evento S3
         s3_bucket = DEFAULT_S3_BUCKET
@@ -426,50 +846,125 @@ def handler(event, context):
                 'body': json.dumps('Archivo no soportado.')
             }
  
-        # Crear o verificar índice
-        index_existed = create_opensearch_index()
+        index_mode = event.get('mode', INDEX_MODE)
+        print(f"Modo de indexación: {index_mode}")
  
-        # Limpiar índice si ya existía
-        if index_existed:
-            print(f"Limpiando documentos existentes del índice '{OPENSEARCH_INDEX}'...")
-            try:
-                opensearch_client.delete_by_query(
-                    index=OPENSEARCH_INDEX,
-                    body={"query": {"match_all": {}}}
-                )
-                print("Documentos anteriores eliminados.")
-            except NotFoundError:
-                print("No se encontraron documentos para eliminar.")
-            except Exception as e:
-                print(f"Error limpiando índice: {e}")
+        target_index = OPENSEARCH_INDEX
+        indexed = None
  
-        # Procesar datos y crear documentos
-        documents = process_csv_data(s3_bucket, s3_key)
+        if index_mode == 'bluegreen':
+            # Índice nuevo sin refresh ni réplicas; el alias sigue sirviendo la generación anterior
+            target_index = new_generation_name()
+            create_opensearch_index(target_index, bulk_load=True)
+            unpublished_index = target_index
  
-        if not documents:
+        else:
+            # Crear o verificar índice
+            index_existed = create_opensearch_index()
+ 
+            if index_mode == 'incremental':
+                # Sin borrado previo: sólo se envían cambios, el índice nunca queda vacío
+                indexed = fetch_indexed_fingerprints() if index_existed else {}
+ 
+            # Limpiar índice si ya existía
+            elif index_existed:
+                print(f"Limpiando documentos existentes del índice '{OPENSEARCH_INDEX}'...")
+                try:
+                    get_opensearch_client().delete_by_query(
+                        index=OPENSEARCH_INDEX,
+                        body={"query": {"match_all": {}}}
+                    )
+                    print("Documentos anteriores eliminados.")
+                except NotFoundError:
+                    print("No se encontraron documentos para eliminar.")
+                except Exception as e:
+                    print(f"Error limpiando índice: {e}")
+ 
+            if index_mode == 'full' and BULK_LOAD_PROFILE:
+                begin_bulk_load(target_index)
+ 
+        # Procesar e indexar en streaming: los documentos se envían a OpenSearch a medida que se generan
+        print(f"Indexando documentos en requests bulk de hasta {BULK_MAX_BYTES // 1024} KB...")
+        stats = {}
+        success = 0
+        failed = []
+        failed_count = 0
+        try:
+            for ok, item in streaming_bulk(
+                get_opensearch_client(),
+                iter_documents(s3_bucket, s3_key, stats, indexed, target_index),
+                chunk_size=BULK_MAX_DOCS,
+                max_chunk_bytes=BULK_MAX_BYTES,
+                raise_on_error=False,
+                ignore_status=(404,)  # delete de un _id que ya no existe
+            ):
+                if ok:
+                    success += 1
+                else:
+                    failed_count += 1
+                    if len(failed) < 5:
+                        failed.append(item)
+        finally:
+            # En modo 'full' el índice de servicio recupera refresh y réplicas aunque la carga falle
+            if index_mode == 'full' and BULK_LOAD_PROFILE:
+                finalize_bulk_load(target_index)
+ 
+        if index_mode == 'bluegreen' and (failed_count or not stats.get('processed')):
+            # No se publica una generación incompleta: el alias sigue en la anterior
+            print(f"Carga incompleta en '{target_index}', se descarta sin mover el alias.")
+            return {
+                'statusCode': 500,
+                'body': json.dumps({
+                    'message': 'Carga blue/green incompleta; se mantiene la generación anterior',
+                    'documents_processed': stats.get('processed', 0),
+                    'documents_failed': failed_count,
+                    'discarded_index': target_index
+                })
+            }
+ 
+        if not stats.get('processed') and not stats.get('unchanged'):
             return {
                 'statusCode': 400,
                 'body': json.dumps('No se pudieron procesar documentos del archivo.')
             }
  
-        print(f"Indexando {len(documents)} documentos en lotes de {BATCH_SIZE}...")
-        success, failed = bulk(opensearch_client, documents, chunk_size=BATCH_SIZE)
+        print(f"Indexación completada. Éxito: {success}, Fallos: {failed_count}")
+        print(f"Caché de embeddings: {embedding_cache.stats()}")
+ 
+        index_generation = None
+        if index_mode == 'bluegreen':
+            finalize_bulk_load(target_index)
+            index_generation = publish_index_generation(target_index)
+            swap_alias(target_index)
+            unpublished_index = None
+            delete_old_generations()
+        elif stats['processed'] or stats['deleted']:
+            index_generation = publish_index_generation(target_index)
  
-        print(f"Indexación completada. Éxito: {success}, Fallos: {len(failed) if failed else 0}")
+        # El snapshot del recuperador local y el diccionario de entidades siguen a cada generación publicada
+        retriever_snapshot = export_retriever_snapshot(target_index, s3_bucket, index_generation) if index_generation else None
+        entity_dictionary = export_entity_dictionary(target_index, s3_bucket, index_generation) if index_generation else None
  
         if failed:
             print("Fallos detectados durante la indexación:")
-            for i, fail_reason in enumerate(failed[:5]):
+            for i, fail_reason in enumerate(failed):
                 print(f"Fallo {i+1}: {fail_reason}")
  
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'message': 'Procesamiento de aplicaciones completado exitosamente',
-                'documents_processed': len(documents),
+                'documents_processed': stats['processed'],
                 'documents_indexed': success,
-                'documents_failed': len(failed) if failed else 0,
-                'index_name': OPENSEARCH_INDEX,
+                'documents_failed': failed_count,
+                'index_mode': index_mode,
+                'rows_unchanged': stats['unchanged'],
+                'documents_deleted': stats['deleted'],
+                'embedding_cache': embedding_cache.stats(),
+                'index_name': target_index,
+                'index_generation': index_generation,
+                'retriever_snapshot': retriever_snapshot,
+                'entity_dictionary': entity_dictionary,
                 's3_source': f's3://{s3_bucket}/{s3_key}'
             })
         }
@@ -479,4 +974,18 @@ def handler(event, context):
         return {
             'statusCode': 500,
             'body': json.dumps(f'Error procesando archivo: {str(e)}')
-        }
\ No newline at end of file
+        }
+ 
+    finally:
+        # Carga incompleta, excepción en el bulk o swap_alias fallido: delete_old_generations
+        # no la vería como antigua y desplazaría a la generación de rollback
+        if unpublished_index:
+            discard_generation(unpublished_index)
+        embedding_cache.flush()
+        profile = startup.report()
+        if profile:
+            print(json.dumps(profile))
+        if opensearch_metrics is not None:
+            print(json.dumps({'opensearch_metrics': opensearch_metrics.snapshot(reset=True)}))
+ 
+startup.ready()
@@ -0,0 +1,109 @@
+"""
+Matcher multi-patrón (Aho–Corasick)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Autómata construido una vez (al importar) a partir de una tabla de patrones.
+Una sola pasada sobre la pregunta devuelve TODAS las coincidencias, incluidas
+las solapadas ('listar' → 'lista' y 'list'), igual que una batería de
+`patrón in texto` pero sin recorrer el texto una vez por patrón.
+
+    - Texto y patrones se pliegan igual: minúsculas y sin tildes ('Perú' = 'peru')
+    - Cada patrón lleva un payload arbitrario (regla, id de aplicación, ...)
+    - whole_word=True exige límites de palabra (para nombres de aplicaciones)
+
+El coste del escaneo es O(len(texto) + coincidencias), independiente del
+número de patrones: sirve igual para 100 keywords que para miles de nombres.
+"""
+
+import unicodedata
+from typing import Any, Dict, List, Tuple
+
+
+def fold(text: str) -> str:
+    """Minúsculas sin tildes ni diacríticos ('Turquía' → 'turquia', 'España' → 'espana')."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class KeywordMatcher:
+    """Autómata Aho–Corasick sobre texto plegado con fold()."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any, bool]]] = [[]]
+        self._built = False
+        self.patterns = 0
+
+    def add(self, pattern: str, payload: Any, whole_word: bool = False) -> None:
+        """Registra un patrón; hay que llamar a build() antes de find()."""
+        key = fold(pattern).strip()
+        if not key:
+            return
+        state = 0
+        for c in key:
+            nxt = self._goto[state].get(c)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][c] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(key), payload, whole_word))
+        self.patterns += 1
+        self._built = False
+
+    def build(self) -> 'KeywordMatcher':
+        """Calcula los enlaces de fallo (BFS) y propaga las salidas."""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for c, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and c not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(c, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def find(self, text: str) -> List[Tuple[int, int, Any]]:
+        """
+        Todas las coincidencias en el texto (ya plegado o no).
+
+        Returns:
+            Lista de (inicio, fin, payload) sobre fold(text), en orden de fin
+        """
+        if not self._built:
+            self.build()
+        folded = fold(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        state = 0
+        for i, c in enumerate(folded):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            for length, payload, whole_word in out[state]:
+                start = i - length + 1
+                if whole_word and not _is_word(folded, start, i + 1):
+                    continue
+                matches.append((start, i + 1, payload))
+        return matches
+
+    def __len__(self) -> int:
+        return self.patterns
+
+
+def _is_word(text: str, start: int, end: int) -> bool:
+    """La coincidencia no está pegada a letras o dígitos por ninguno de los lados."""
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
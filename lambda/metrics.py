@@ -0,0 +1,226 @@
+"""
+Métricas por fase del transporte de OpenSearch
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+MetricsEvents de opensearchpy sólo guarda el inicio y el fin de la última
+request. MetricsCollector (el metrics= del cliente, ver opensearch_client.py)
+acumula todas las requests del contenedor:
+    - histograma de latencia por endpoint ('POST _search', 'POST _bulk', ...)
+    - histograma por endpoint y fase: serialize / deserialize (transporte),
+      compress / sign / network / decode (conexión) y server, el 'took' que
+      informa el clúster
+    - bytes enviados y recibidos por endpoint
+    - requests que reutilizaron una conexión del pool y las que abrieron una
+
+network - server es el tiempo fuera del clúster; sign, decode y deserialize son
+CPU del cliente. snapshot() lo exporta como un dict serializable a JSON.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence
+
+from opensearchpy import Metrics
+
+# Límite superior (ms) de cada bucket del histograma de latencia
+DEFAULT_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+@lru_cache(maxsize=1024)
+def endpoint_name(method: str, url: str) -> str:
+    """
+    Etiqueta de baja cardinalidad de una request: el método y los segmentos de
+    API del path (los que empiezan por '_'). 'POST /rag/_search?size=10' →
+    'POST _search', 'PUT /rag' → 'PUT {index}'.
+    """
+    path = url.split('?', 1)[0].strip('/')
+    if not path:
+        return f'{method} /'
+    api = [segment for segment in path.split('/') if segment.startswith('_')]
+    return f"{method} {'/'.join(api) if api else '{index}'}"
+
+
+class Histogram:
+    """
+    Histograma de latencias en ms con buckets fijos. Los percentiles se estiman
+    interpolando dentro del bucket, acotados al mínimo y máximo observados.
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float('inf')
+        self.maximum = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.minimum = min(self.minimum, ms)
+        self.maximum = max(self.maximum, ms)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            if bucket and seen + bucket >= rank:
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.maximum
+                value = lower + (upper - lower) * (rank - seen) / bucket
+                return min(max(value, self.minimum), self.maximum)
+            seen += bucket
+        return self.maximum
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f'le_{bound:g}' for bound in self.bounds] + ['inf']
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'mean': round(self.total / self.count, 3) if self.count else 0.0,
+            'min': round(self.minimum, 3) if self.count else 0.0,
+            'max': round(self.maximum, 3),
+            'p50': round(self.percentile(50), 3),
+            'p95': round(self.percentile(95), 3),
+            'p99': round(self.percentile(99), 3),
+            'buckets': {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+class _EndpointStats:
+    __slots__ = ('latency', 'phases', 'bytes_sent', 'bytes_received', 'errors')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.latency = Histogram(bounds)
+        self.phases: Dict[str, Histogram] = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors = 0
+
+
+class MetricsCollector(Metrics):
+    """
+    Metrics de opensearchpy que agrega todas las requests del cliente. Las
+    fases y requests llegan por record_phase / record_request desde
+    LambdaHttpConnection y MetricsTransport. Es thread-safe (la query lanza
+    las búsquedas léxica y vectorial en paralelo) y puede compartirse entre
+    clientes.
+
+    start_time / end_time / service_time mantienen la semántica de
+    MetricsEvents (última request del hilo que pregunta).
+    """
+
+    def __init__(self, buckets_ms: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self._buckets = tuple(buckets_ms)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._endpoints: Dict[str, _EndpointStats] = {}
+        self._new_connections = 0
+        self._reused_connections = 0
+        self._started = time.time()
+
+    @property
+    def start_time(self) -> Optional[float]:
+        return getattr(self._local, 'start_time', None)
+
+    @property
+    def end_time(self) -> Optional[float]:
+        return getattr(self._local, 'end_time', None)
+
+    @property
+    def service_time(self) -> Optional[float]:
+        return getattr(self._local, 'service_time', None)
+
+    def request_start(self) -> None:
+        self._local.start_time = time.perf_counter()
+        self._local.end_time = None
+        self._local.service_time = None
+
+    def request_end(self) -> None:
+        self._local.end_time = time.perf_counter()
+        start_time = getattr(self._local, 'start_time', None)
+        if start_time is not None:
+            self._local.service_time = self._local.end_time - start_time
+
+    def _stats(self, endpoint: str) -> _EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = _EndpointStats(self._buckets)
+        return stats
+
+    def record_phase(self, endpoint: str, phase: str, seconds: float) -> None:
+        """Duración de una fase de la request (ver el docstring del módulo)."""
+        with self._lock:
+            phases = self._stats(endpoint).phases
+            histogram = phases.get(phase)
+            if histogram is None:
+                histogram = phases[phase] = Histogram(self._buckets)
+            histogram.observe(seconds * 1000.0)
+
+    def record_request(self, endpoint: str, seconds: float, bytes_sent: int = 0, bytes_received: int = 0,
+                       status: Optional[int] = None, new_connection: Optional[bool] = None) -> None:
+        """
+        Request terminada tal como la ve la conexión: de la firma al cuerpo
+        decodificado. status None = falló sin respuesta; new_connection None =
+        no se sabe si el pool abrió una conexión.
+        """
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.latency.observe(seconds * 1000.0)
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            if status is None or not 200 <= status < 300:
+                stats.errors += 1
+            if new_connection is True:
+                self._new_connections += 1
+            elif new_connection is False:
+                self._reused_connections += 1
+
+    def reset(self) -> None:
+        """Descarta todo lo registrado hasta ahora."""
+        with self._lock:
+            self._reset()
+
+    def _reset(self) -> None:
+        self._endpoints = {}
+        self._new_connections = 0
+        self._reused_connections = 0
+        self._started = time.time()
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Any]:
+        """Todo lo registrado desde la creación (o el último reset), latencias en ms; reset abre una ventana nueva."""
+        with self._lock:
+            endpoints = {
+                name: {
+                    'latency_ms': stats.latency.snapshot(),
+                    'phases_ms': {phase: histogram.snapshot() for phase, histogram in stats.phases.items()},
+                    'bytes_sent': stats.bytes_sent,
+                    'bytes_received': stats.bytes_received,
+                    'errors': stats.errors,
+                }
+                for name, stats in self._endpoints.items()
+            }
+            new, reused = self._new_connections, self._reused_connections
+            window = time.time() - self._started
+            if reset:
+                self._reset()
+
+        return {
+            'window_s': round(window, 3),
+            'requests': sum(stats['latency_ms']['count'] for stats in endpoints.values()),
+            'bytes_sent': sum(stats['bytes_sent'] for stats in endpoints.values()),
+            'bytes_received': sum(stats['bytes_received'] for stats in endpoints.values()),
+            'connections': {
+                'new': new,
+                'reused': reused,
+                'reuse_ratio': round(reused / (new + reused), 4) if new + reused else None,
+            },
+            'endpoints': endpoints,
+        }
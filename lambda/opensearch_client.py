@@ -0,0 +1,265 @@
+"""
+Cliente OpenSearch de los Lambdas
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+indexer.py y query.py construyen su cliente con create_client(). Lo que
+añadimos a opensearchpy son subclases pasadas por sus puntos de extensión
+(serializer=, connection_class=, transport_class=, metrics=, http_auth=):
+layer/build.sh y lambda/build.sh reinstalan opensearch-py desde PyPI, así que
+la copia de layer/python no se modifica.
+    - VectorJSONSerializer (serializer.py): embeddings con precisión float32 y
+      decodificación de bytes y de respuestas en streaming
+    - LambdaHttpConnection: RequestsHttpConnection que entrega el cuerpo según
+      OPENSEARCH_RESPONSE_MODE ('text', 'bytes' o 'stream') y mide las fases
+      compress, sign, network y decode, los bytes y la reutilización del pool
+    - MetricsTransport: Transport que mide serialize, deserialize y server
+      (el 'took' de la respuesta)
+Sin un MetricsCollector (metrics.py) como metrics= no se mide nada y
+MetricsTransport delega en el Transport de opensearchpy.
+"""
+
+import threading
+import time
+from typing import Any, Collection, Dict, Mapping, Optional, Union
+
+import requests
+from opensearchpy import OpenSearch, RequestsHttpConnection, Transport
+from opensearchpy.compat import reraise_exceptions, string_types, urlencode
+from opensearchpy.exceptions import ConnectionError, ConnectionTimeout, SSLError
+from opensearchpy.serializer import Deserializer
+
+from metrics import MetricsCollector, endpoint_name
+from serializer import VectorJSONSerializer
+
+
+class LambdaHttpConnection(RequestsHttpConnection):
+    """
+    RequestsHttpConnection con el cuerpo de las respuestas JSON correctas según
+    decode_response / stream_response y, con un MetricsCollector, las fases de
+    cada request.
+
+    :arg decode_response: True (por defecto) entrega el cuerpo como str; False,
+        los bytes tal cual (json los decodifica por dentro, así que con el json
+        de la biblioteca estándar no ahorra memoria)
+    :arg stream_response: entrega el cuerpo como _StreamedBody, chunks de
+        stream_chunk_size bytes que VectorJSONSerializer.loads decodifica de
+        forma incremental. El cuerpo se lee al deserializar: las métricas
+        cuentan su transferencia en deserialize y un corte a mitad del cuerpo
+        salta en el deserializer, fuera de los reintentos del Transport
+    :arg stream_chunk_size: tamaño de los chunks leídos en streaming
+    Las respuestas de error siempre llegan como str.
+    """
+
+    def __init__(self, *args: Any, decode_response: bool = True, stream_response: bool = False,
+                 stream_chunk_size: int = 256 * 1024, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.decode_response = decode_response
+        self.stream_response = stream_response
+        self.stream_chunk_size = stream_chunk_size
+        self.collects_phases = isinstance(self.metrics, MetricsCollector)
+        self._pool_connections: Dict[int, int] = {}
+        self._pool_lock = threading.Lock()
+
+    def _opened_connection(self, pool: Any) -> Optional[bool]:
+        """Si el pool de urllib3 abrió una conexión desde la llamada anterior (None si no lo expone)."""
+        created = getattr(pool, 'num_connections', None)
+        if created is None:
+            return None
+        with self._pool_lock:
+            previous = self._pool_connections.get(id(pool), 0)
+            self._pool_connections[id(pool)] = created
+        return created > previous
+
+    def _response_body(self, response: Any, stream: bool) -> Any:
+        """Cuerpo que recibe el Transport: str, o bytes / _StreamedBody en las respuestas JSON correctas."""
+        if 200 <= response.status_code < 300 and response.headers.get('content-type', '').startswith('application/json'):
+            if stream:
+                return _StreamedBody(response, self.stream_chunk_size)
+            if not self.decode_response:
+                return response.content
+        return response.content.decode('utf-8', 'surrogatepass')
+
+    def perform_request(self, method: str, url: str, params: Optional[Mapping[str, Any]] = None,
+                        body: Optional[bytes] = None, timeout: Optional[Union[int, float]] = None,
+                        allow_redirects: Optional[bool] = True, ignore: Collection[int] = (),
+                        headers: Optional[Mapping[str, str]] = None) -> Any:
+        """
+        El perform_request de RequestsHttpConnection con el cuerpo de
+        _response_body y, si se miden, las fases: compress (gzip), sign
+        (prepare_request aplica http_auth, la firma SigV4), network (envío y
+        lectura del cuerpo) y decode (bytes → str).
+        """
+        timed = self.collects_phases
+        endpoint = endpoint_name(method, url) if timed else ''
+        url = self.base_url + url
+        headers = headers or {}
+        if params:
+            url = f'{url}?{urlencode(params or {})}'
+
+        orig_body = body
+        if self.http_compress and body:
+            mark = time.perf_counter()
+            body = self._gzip_compress(body)
+            headers['content-encoding'] = 'gzip'
+            if timed:
+                self.metrics.record_phase(endpoint, 'compress', time.perf_counter() - mark)
+
+        start = time.time()
+        mark = time.perf_counter()
+        request = requests.Request(method=method, headers=headers, url=url, data=body)
+        prepared_request = self.session.prepare_request(request)
+        settings = self.session.merge_environment_settings(prepared_request.url, {}, None, None, None)
+        send_kwargs: Any = {'timeout': timeout or self.timeout, 'allow_redirects': allow_redirects}
+        send_kwargs.update(settings)
+        stream = self.stream_response and method != 'HEAD'
+        if stream:
+            send_kwargs['stream'] = True
+        signed = time.perf_counter()
+        try:
+            self.metrics.request_start()
+            response = self.session.send(prepared_request, **send_kwargs)
+            duration = time.time() - start
+            received = time.perf_counter()
+            raw_data = self._response_body(response, stream)
+        except reraise_exceptions:
+            raise
+        except Exception as e:
+            if timed:
+                self.metrics.record_request(endpoint, time.perf_counter() - mark, len(prepared_request.body or b''))
+            self.log_request_fail(method, url, prepared_request.path_url, orig_body, time.time() - start, exception=e)
+            if isinstance(e, requests.exceptions.SSLError):
+                raise SSLError('N/A', str(e), e)
+            if isinstance(e, requests.Timeout):
+                raise ConnectionTimeout('TIMEOUT', str(e), e)
+            raise ConnectionError('N/A', str(e), e)
+        finally:
+            self.metrics.request_end()
+
+        if timed:
+            decoded = time.perf_counter()
+            self.metrics.record_phase(endpoint, 'sign', signed - mark)
+            self.metrics.record_phase(endpoint, 'network', received - signed)
+            self.metrics.record_phase(endpoint, 'decode', decoded - received)
+            raw = response.raw
+            if isinstance(raw_data, _StreamedBody):
+                received_bytes = int(response.headers.get('content-length') or 0)  # Aún sin leer: lo anunciado
+            elif hasattr(raw, 'tell'):
+                received_bytes = raw.tell()
+            else:
+                received_bytes = len(response.content)
+            self.metrics.record_request(endpoint, decoded - mark, len(prepared_request.body or b''), received_bytes,
+                                        response.status_code, self._opened_connection(getattr(raw, '_pool', None)))
+
+        self._raise_warnings((response.headers['warning'],) if 'warning' in response.headers else ())
+        if not (200 <= response.status_code < 300) and response.status_code not in ignore:
+            self.log_request_fail(method, url, response.request.path_url, orig_body, duration,
+                                  response.status_code, raw_data)
+            self._raise_error(response.status_code, raw_data, response.headers.get('Content-Type'))
+
+        self.log_request_success(method, url, response.request.path_url, orig_body, response.status_code,
+                                 raw_data, duration)
+        return response.status_code, response.headers, raw_data
+
+    def _pretty_json(self, data: Any) -> str:
+        """El de Connection (trazas curl), sin consumir un _StreamedBody y con los bytes decodificados."""
+        if isinstance(data, _StreamedBody):
+            return repr(data)  # Sólo lo puede leer una vez el deserializer
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'ignore')
+        return super()._pretty_json(data)
+
+    def _log_request_response(self, body: Any, response: Any) -> None:
+        if isinstance(response, bytes):
+            response = response.decode('utf-8', 'ignore')
+        super()._log_request_response(body, response)
+
+
+class _StreamedBody:
+    """Cuerpo de una respuesta en streaming: sus chunks (descomprimidos) una sola vez; al acabar libera la conexión."""
+
+    __slots__ = ('response', 'chunk_size')
+
+    def __init__(self, response: Any, chunk_size: int):
+        self.response = response
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        try:
+            yield from self.response.iter_content(self.chunk_size)
+        finally:
+            self.response.close()
+
+    def __bool__(self) -> bool:
+        return True  # El Transport sólo deserializa cuerpos no vacíos
+
+    def __repr__(self) -> str:
+        return f"<streamed response body: {self.response.headers.get('content-length', '?')} bytes>"
+
+
+class _TimedDeserializer(Deserializer):
+    """Deserializer que registra deserialize y server para el endpoint en curso del MetricsTransport."""
+
+    def __init__(self, transport: 'MetricsTransport'):
+        super().__init__(transport.deserializer.serializers, transport.deserializer.default.mimetype)
+        self.transport = transport
+
+    def loads(self, s: Any, mimetype: Optional[str] = None) -> Any:
+        mark = time.perf_counter()
+        data = super().loads(s, mimetype)
+        endpoint = getattr(self.transport.current, 'endpoint', None)
+        if endpoint is not None:  # El sniffing también deserializa, fuera de perform_request
+            metrics = self.transport.metrics
+            metrics.record_phase(endpoint, 'deserialize', time.perf_counter() - mark)
+            took = data.get('took') if isinstance(data, dict) else None
+            if isinstance(took, (int, float)) and not isinstance(took, bool):
+                metrics.record_phase(endpoint, 'server', took / 1000.0)
+        return data
+
+
+class MetricsTransport(Transport):
+    """Transport con las fases serialize, deserialize y server en el MetricsCollector."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.current = threading.local()  # Endpoint de la request en curso en cada hilo
+        if isinstance(self.metrics, MetricsCollector):
+            self.deserializer = _TimedDeserializer(self)
+
+    def perform_request(self, method: str, url: str, params: Optional[Mapping[str, Any]] = None,
+                        body: Any = None, timeout: Optional[Union[int, float]] = None,
+                        ignore: Collection[int] = (), headers: Optional[Mapping[str, str]] = None) -> Any:
+        if not isinstance(self.metrics, MetricsCollector):
+            return super().perform_request(method, url, params, body, timeout, ignore, headers)
+        endpoint = self.current.endpoint = endpoint_name(method, url)
+        try:
+            if body is not None and not isinstance(body, string_types):
+                # Transport.perform_request no vuelve a serializar un str
+                mark = time.perf_counter()
+                body = self.serializer.dumps(body)
+                self.metrics.record_phase(endpoint, 'serialize', time.perf_counter() - mark)
+            return super().perform_request(method, url, params, body, timeout, ignore, headers)
+        finally:
+            self.current.endpoint = None
+
+
+def create_client(host: str, port: int, http_auth: Any, pool_size: int, timeout: int,
+                  metrics: Optional[MetricsCollector] = None, **connection_kwargs: Any) -> OpenSearch:
+    """
+    Cliente OpenSearch con TLS, el serializer de vectores y, si se pasa metrics,
+    las fases del transporte. connection_kwargs llega a LambdaHttpConnection
+    (decode_response, stream_response, ...).
+    """
+    if metrics is not None:
+        connection_kwargs['metrics'] = metrics
+    return OpenSearch(
+        hosts=[{'host': host, 'port': port}],
+        http_auth=http_auth,
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=LambdaHttpConnection,
+        transport_class=MetricsTransport,
+        serializer=VectorJSONSerializer(),
+        pool_maxsize=pool_size,
+        timeout=timeout,
+        **connection_kwargs
+    )
@@ -8,18 +8,33 @@ Fecha: 2025-01-09
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 """
 
+import startup
+startup.install('query')  # STARTUP_PROFILE=true: tiempos de import e inicialización
+
 import boto3
 import json
 import os
 import re
-from typing import Dict, List, Optional, Any
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Any, Tuple
 from datetime import datetime
 import logging
 from botocore.exceptions import ClientError
+from cache import AnswerCache, EmbeddingCache, LRUTTLCache, create_cache_backend
+from entities import EntityIndex, load_entity_dictionary
+from matcher import KeywordMatcher
+from startup import lazy_client
+import tracing
+from streaming import IncrementalJSONEmitter
+from tracing import traced
 
-# ==================== JSON ENDPOINT =====================
-s3 = boto3.client('s3')
+if TYPE_CHECKING:  # opensearchpy y retriever (numpy) se importan en su primer uso
+    from metrics import MetricsCollector
+    from opensearchpy import OpenSearch
+    from retriever import LocalRetriever
 
 # ==================== LOGGING ====================
 logger = logging.getLogger()
@@ -29,7 +44,7 @@ logger.setLevel(logging.INFO)
 ALUMNO_ID = os.environ.get('ALUMNO_ID')
 API_GATEWAY_ENDPOINT = os.environ.get('API_GATEWAY_ENDPOINT')
 OPENSEARCH_HOST = os.environ.get('OPENSEARCH_ENDPOINT', '')
-OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', '')
+OPENSEARCH_INDEX = os.environ.get('OPENSEARCH_INDEX', '')  # Índice o alias (el indexer en modo 'bluegreen' lo mueve entre generaciones)
 OPENSEARCH_PORT = int(os.environ.get('OPENSEARCH_PORT', '443'))
 OPENSEARCH_SERVICE = os.environ.get('OPENSEARCH_SERVICE', 'es')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
@@ -37,24 +52,213 @@ BEDROCK_EMBEDDING_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'amazon.titan-em
 BEDROCK_GENERATION_MODEL_ID = os.environ.get('BEDROCK_GENERATION_MODEL', 'anthropic.claude-3-sonnet-20240229-v1:0')
 TOP_K_RESULTS = int(os.environ.get('TOP_K_RESULTS', '15'))
 MAX_TOKENS = int(os.environ.get('MAX_TOKENS', '3000'))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '1500'))  # Tokens (estimados) para la tabla de aplicaciones
+CHARS_PER_TOKEN = float(os.environ.get('CHARS_PER_TOKEN', '3.5'))  # Estimación para texto en español
 OPENSEARCH_POOL_SIZE = int(os.environ.get('OPENSEARCH_POOL_SIZE', '20'))
 OPENSEARCH_TIMEOUT = int(os.environ.get('OPENSEARCH_TIMEOUT', '30'))
+# Métricas por fase del transporte (metrics.MetricsCollector): latencia por endpoint,
+# firma / red / decode / deserialize frente al 'took' del clúster, bytes y reutilización del pool
+OPENSEARCH_METRICS = os.environ.get('OPENSEARCH_METRICS', 'false').lower() == 'true'
+OPENSEARCH_METRICS_INTERVAL = int(os.environ.get('OPENSEARCH_METRICS_INTERVAL', '300'))  # Segundos entre snapshots (0 = cada invocación)
+OPENSEARCH_RESPONSE_MODE = os.environ.get('OPENSEARCH_RESPONSE_MODE', 'text')  # 'text', 'bytes' o 'stream' (parseo incremental de hits.hits)
 BUCKET = os.environ.get('S3_BUCKET')
 
+# Caché de embeddings de preguntas: LRU+TTL en memoria del contenedor + nivel compartido opcional
+# ('none', 'sqlite' en QUERY_EMBEDDING_CACHE_PATH, o 'modulo:Clase' para un KV propio)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get('QUERY_EMBEDDING_CACHE_SIZE', '1024'))
+QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get('QUERY_EMBEDDING_CACHE_TTL', '3600'))
+QUERY_EMBEDDING_CACHE_BACKEND = os.environ.get('QUERY_EMBEDDING_CACHE_BACKEND', 'none')
+QUERY_EMBEDDING_CACHE_PATH = os.environ.get('QUERY_EMBEDDING_CACHE_PATH', '/tmp/query_embedding_cache.sqlite3')
+
+# Caché de respuestas RAG completas (se invalida cuando el indexer publica una generación nueva)
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', '256'))
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', '900'))
+# Similitud coseno mínima para reutilizar la respuesta de una pregunta parecida (p.ej. 0.97). 0 = sólo
+# coincidencia exacta: dos preguntas cercanas pueden pedir cosas distintas ('apps críticas de Perú' / 'de Chile')
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', '0'))
+INDEX_GENERATION_TTL = int(os.environ.get('INDEX_GENERATION_TTL', '30'))  # Segundos entre consultas de la generación
+
+# Pipeline concurrente: la parte léxica (Term + BM25 + Aggs) arranca mientras se calcula el embedding
+QUERY_PARALLEL_SEARCH = os.environ.get('QUERY_PARALLEL_SEARCH', 'true').lower() == 'true'
+QUERY_MAX_WORKERS = int(os.environ.get('QUERY_MAX_WORKERS', '4'))
+
+# Fusión léxico + vectorial:
+#   'sum'    suma de scores por _id (equivalente al bool/should de v6, kNN con k = top_k * 3)
+#   'rrf'    reciprocal rank fusion: sum(1 / (HYBRID_RRF_K + rank))
+#   'minmax' scores normalizados a [0, 1] por recuperador y ponderados
+HYBRID_MODE = os.environ.get('HYBRID_MODE', 'sum')
+HYBRID_KNN_K = int(os.environ.get('HYBRID_KNN_K', '0'))  # k del kNN en rrf/minmax (0 = TOP_K_RESULTS)
+HYBRID_RRF_K = int(os.environ.get('HYBRID_RRF_K', '60'))
+HYBRID_VECTOR_WEIGHT = float(os.environ.get('HYBRID_VECTOR_WEIGHT', '0.5'))  # minmax: peso del kNN (léxico = 1 - peso)
+
+# Codificación del knn_vector (vectors.py): debe coincidir con la del indexer
+KNN_VECTOR_ENCODING = os.environ.get('KNN_VECTOR_ENCODING', 'float')  # 'float', 'fp16' o 'byte'
+EMBEDDING_NORMALIZE = os.environ.get('EMBEDDING_NORMALIZE', 'false').lower() == 'true'
+KNN_SPACE_TYPE = os.environ.get('KNN_SPACE_TYPE', 'innerproduct' if EMBEDDING_NORMALIZE else 'l2')
+KNN_BYTE_SCALE = float(os.environ.get('KNN_BYTE_SCALE', '400'))
+# Filtros term en el kNN:
+#   'efficient' dentro de la cláusula knn (faiss filtra durante la búsqueda en el grafo y el
+#               índice pasa a búsqueda exacta si quedan pocos docs: KNN_FILTERED_EXACT_THRESHOLD del indexer)
+#   'post'      sólo en el bool.filter exterior (comportamiento v6: los k vecinos se filtran después)
+KNN_FILTER_MODE = os.environ.get('KNN_FILTER_MODE', 'efficient')
+
+# Recuperador local (retriever.py) sobre el snapshot que exporta el indexer:
+#   'fallback' sólo si OpenSearch falla (hot-standby), 'local' siempre que haya snapshot, 'off'
+RETRIEVER_MODE = os.environ.get('RETRIEVER_MODE', 'fallback')
+RETRIEVER_SNAPSHOT_KEY = os.environ.get('RETRIEVER_SNAPSHOT_KEY', 'artifacts/retriever_snapshot.npz')
+RETRIEVER_REFRESH_SECONDS = int(os.environ.get('RETRIEVER_REFRESH_SECONDS', '300'))  # Revalidación del ETag
+
+# Diccionario de entidades (entities.py): nombres de aplicación → id_app, exportado por el indexer.
+# Las preguntas que nombran aplicaciones se resuelven con un term directo (sin embedding ni kNN).
+ENTITY_DICTIONARY_KEY = os.environ.get('ENTITY_DICTIONARY_KEY', 'artifacts/entity_dictionary.json')  # Vacío lo desactiva
+ENTITY_MIN_LENGTH = int(os.environ.get('ENTITY_MIN_LENGTH', '6'))  # Nombres más cortos no se detectan
+ENTITY_REFRESH_SECONDS = int(os.environ.get('ENTITY_REFRESH_SECONDS', str(RETRIEVER_REFRESH_SECONDS)))
+
 # ==================== CLIENTES AWS ====================
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=AWS_REGION)
-credentials = boto3.Session().get_credentials()
-auth = AWSV4SignerAuth(credentials, AWS_REGION, OPENSEARCH_SERVICE)
-
-opensearch_client = OpenSearch(
-    hosts=[{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
-    http_auth=auth,
-    use_ssl=True,
-    verify_certs=True,
-    connection_class=RequestsHttpConnection,
-    pool_maxsize=OPENSEARCH_POOL_SIZE,
-    timeout=OPENSEARCH_TIMEOUT
+# Se construyen en su primer uso, no al importar: las preguntas conversacionales no
+# crean el cliente de OpenSearch y el de S3 sólo se usa para el endpoint y los artefactos.
+@lazy_client
+def get_s3_client():
+    return boto3.client('s3')
+
+@lazy_client
+def get_bedrock_runtime():
+    return boto3.client('bedrock-runtime', region_name=AWS_REGION)
+
+@lazy_client
+def get_opensearch_metrics() -> 'MetricsCollector':
+    from metrics import MetricsCollector
+    return MetricsCollector()
+
+@lazy_client
+def get_opensearch_client() -> 'OpenSearch':
+    from opensearch_client import create_client
+    from signer import CachedSigV4Auth
+    credentials = boto3.Session().get_credentials()
+    auth = CachedSigV4Auth(credentials, AWS_REGION, OPENSEARCH_SERVICE)
+    return create_client(
+        OPENSEARCH_HOST, OPENSEARCH_PORT, auth, OPENSEARCH_POOL_SIZE, OPENSEARCH_TIMEOUT,
+        metrics=get_opensearch_metrics() if OPENSEARCH_METRICS else None,  # Sin él, el MetricsNone por defecto
+        decode_response=OPENSEARCH_RESPONSE_MODE == 'text',
+        stream_response=OPENSEARCH_RESPONSE_MODE == 'stream'
+    )
+
+# ==================== CACHÉ DE EMBEDDINGS ====================
+query_embedding_cache = EmbeddingCache(
+    create_cache_backend(QUERY_EMBEDDING_CACHE_BACKEND, path=QUERY_EMBEDDING_CACHE_PATH),
+    BEDROCK_EMBEDDING_MODEL_ID,
+    memory=LRUTTLCache(QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL)
 )
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
+_index_generation = {'value': None, 'checked_at': 0.0}
+
+# ==================== EJECUCIÓN CONCURRENTE ====================
+# Hilos del contenedor para el trabajo que no está en el camino crítico de la respuesta
+_executor = ThreadPoolExecutor(max_workers=QUERY_MAX_WORKERS)
+_endpoint_registration = {'future': None}
+_endpoint_lock = threading.Lock()
+
+def save_endpoint() -> None:
+    """Guarda el endpoint del alumno en S3 (endpoints/{ALUMNO_ID}.json)."""
+    get_s3_client().put_object(
+        Bucket=BUCKET,
+        Key=f'endpoints/{ALUMNO_ID}.json',
+        Body=json.dumps({
+            "nombre-apellido": ALUMNO_ID,
+            "endpoint": API_GATEWAY_ENDPOINT
+        }, indent=2),
+        ContentType='application/json'
+    )
+
+@traced('endpoint')
+def register_endpoint_once() -> None:
+    """
+    Lanza save_endpoint en segundo plano una vez por contenedor (fire-and-forget).
+    Si la escritura falló, se reintenta en la siguiente invocación.
+    """
+    with _endpoint_lock:
+        future = _endpoint_registration['future']
+        if future is not None and (not future.done() or future.exception() is None):
+            return
+        if future is not None:
+            logger.warning(f"No se pudo guardar el endpoint en S3, reintentando: {future.exception()}")
+        _endpoint_registration['future'] = _executor.submit(save_endpoint)
+
+# ==================== ARTEFACTOS DEL INDEXER ====================
+_local_retriever = {'value': None, 'etag': None, 'checked_at': None, 'future': None, 'lock': threading.Lock()}
+_entity_index = {'value': None, 'etag': None, 'checked_at': None, 'lock': threading.Lock()}
+
+def load_artifact(state: Dict, key: str, parse, refresh_seconds: int, label: str):
+    """
+    Último artefacto del indexer en s3://BUCKET/key, parseado con parse(bytes). El ETag
+    se revalida como mucho cada refresh_seconds; si S3 falla se sigue usando el que hay en memoria.
+    """
+    if not key or not BUCKET:
+        return None
+    with state['lock']:
+        now = time.monotonic()
+        checked_at = state['checked_at']
+        if checked_at is not None and now - checked_at < refresh_seconds:
+            return state['value']
+        state['checked_at'] = now
+        try:
+            etag = get_s3_client().head_object(Bucket=BUCKET, Key=key)['ETag']
+            if etag != state['etag']:
+                value = parse(get_s3_client().get_object(Bucket=BUCKET, Key=key)['Body'].read())
+                state.update(value=value, etag=etag)
+                logger.info(f"{label} cargado: {len(value)} entradas (generación {value.generation})")
+        except Exception as e:
+            logger.warning(f"{label} no disponible: {e}")
+        return state['value']
+
+def parse_retriever_snapshot(data: bytes) -> 'LocalRetriever':
+    from retriever import load_snapshot  # numpy sólo entra si hay snapshot que cargar
+    return load_snapshot(data)
+
+def load_local_retriever() -> Optional['LocalRetriever']:
+    """Recuperador local con el último snapshot del indexer (retriever.py)."""
+    if RETRIEVER_MODE == 'off':
+        return None
+    return load_artifact(_local_retriever, RETRIEVER_SNAPSHOT_KEY, parse_retriever_snapshot,
+                         RETRIEVER_REFRESH_SECONDS, 'Recuperador local')
+
+def load_entity_index() -> Optional[EntityIndex]:
+    """Diccionario de nombres de aplicación del indexer (entities.py)."""
+    return load_artifact(_entity_index, ENTITY_DICTIONARY_KEY,
+                         lambda data: load_entity_dictionary(data, ENTITY_MIN_LENGTH),
+                         ENTITY_REFRESH_SECONDS, 'Diccionario de entidades')
+
+def prefetch_local_retriever() -> None:
+    """En modo 'fallback' carga/revalida el snapshot en segundo plano para tenerlo listo si OpenSearch falla."""
+    if RETRIEVER_MODE != 'fallback':
+        return
+    checked_at = _local_retriever['checked_at']
+    if checked_at is not None and time.monotonic() - checked_at < RETRIEVER_REFRESH_SECONDS:
+        return
+    future = _local_retriever['future']
+    if future is None or future.done():
+        _local_retriever['future'] = _executor.submit(load_local_retriever)
+
+def get_index_generation() -> Optional[str]:
+    """
+    Generación vigente del índice: nombre del índice concreto detrás de OPENSEARCH_INDEX
+    + _meta.generation publicado por el indexer. Se consulta como mucho cada
+    INDEX_GENERATION_TTL segundos. None si no se puede determinar (caché desactivada).
+    """
+    now = time.monotonic()
+    if _index_generation['value'] is not None and now - _index_generation['checked_at'] < INDEX_GENERATION_TTL:
+        return _index_generation['value']
+    try:
+        mappings = get_opensearch_client().indices.get_mapping(index=OPENSEARCH_INDEX)
+        generation = ','.join(
+            f"{name}:{body.get('mappings', {}).get('_meta', {}).get('generation', '')}"
+            for name, body in sorted(mappings.items())
+        )
+    except Exception as e:
+        logger.warning(f"No se pudo leer la generación del índice: {e}")
+        generation = None
+    _index_generation.update(value=generation, checked_at=now)
+    return generation
 
 # ==================== VALIDACIÓN MANUAL (Sin Pydantic) ====================
 def validate_response(data: Dict) -> Dict:
@@ -116,6 +320,14 @@ def safe_json_parse(text: str) -> Optional[Dict]:
                 pass
         return None
 
+def normalize_question(question: str) -> str:
+    """
+    Forma canónica de una pregunta para claves de caché.
+    Minúsculas, espacios colapsados y sin signos de apertura/cierre en los extremos.
+    """
+    text = re.sub(r'\s+', ' ', question.lower()).strip()
+    return text.strip('¿?¡!.,;: ')
+
 def sanitize_html(html: str) -> str:
     """
     Sanitiza HTML para evitar XSS.
@@ -151,6 +363,166 @@ def validate_mermaid(code: str) -> bool:
     keywords = ['graph', 'flowchart', 'sequenceDiagram', 'classDiagram', 'gantt', 'pie']
     return any(kw in code for kw in keywords)
 
+# ==================== CLAUDE (BEDROCK) ====================
+def log_token_usage(usage: Dict) -> None:
+    """Tokens de entrada/salida que reporta Bedrock (los de entrada dominan latencia y coste)."""
+    if usage:
+        logger.info(f"Tokens Claude: entrada={usage.get('input_tokens')}, salida={usage.get('output_tokens')}")
+
+@traced('bedrock')
+def invoke_claude_text(body: str) -> str:
+    """Llamada bloqueante a Claude: devuelve el texto completo de la respuesta."""
+    response = get_bedrock_runtime().invoke_model(
+        body=body,
+        modelId=BEDROCK_GENERATION_MODEL_ID,
+        accept="application/json",
+        contentType="application/json"
+    )
+    response_body = json.loads(response.get('body').read())
+    log_token_usage(response_body.get('usage', {}))
+    return response_body.get('content', [{}])[0].get('text', '')
+
+@traced('bedrock')
+def stream_claude_text(body: str) -> Iterator[str]:
+    """Llamada en streaming a Claude: genera los fragmentos de texto según llegan."""
+    response = get_bedrock_runtime().invoke_model_with_response_stream(
+        body=body,
+        modelId=BEDROCK_GENERATION_MODEL_ID,
+        accept="application/json",
+        contentType="application/json"
+    )
+    usage = {}
+    for event in response.get('body'):
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        data = json.loads(chunk['bytes'])
+        if data.get('type') == 'content_block_delta':
+            yield data.get('delta', {}).get('text', '')
+        elif data.get('type') == 'message_start':
+            usage.update(data.get('message', {}).get('usage', {}))
+        elif data.get('type') == 'message_delta':
+            usage.update(data.get('usage', {}))
+    log_token_usage(usage)
+
+def validate_stream_event(event: Dict) -> Dict:
+    """Aplica a un evento parcial los mismos límites que validate_response a la respuesta final."""
+    if event['type'] == 'field':
+        partial = validate_response({'answer_type': 'success', event['name']: event['value']})
+        event['value'] = partial[event['name']]
+    elif event['type'] == 'item' and isinstance(event['value'], dict):
+        partial = validate_response({'answer_type': 'success', event['name']: [event['value']]})
+        event['value'] = partial[event['name']][0]
+    return event
+
+def stream_structured_answer(body: str, finalize, fields=('summary',), arrays=('applications',)) -> Iterator[Dict]:
+    """
+    Genera eventos 'field'/'item' a medida que Claude completa cada campo y
+    termina con {'type': 'final', 'status': 200, 'answer': finalize(texto completo)}.
+    """
+    emitter = IncrementalJSONEmitter(fields=fields, arrays=arrays)
+    for delta in stream_claude_text(body):
+        for event in emitter.feed(delta):
+            # validate_response limita applications a 20 entradas
+            if event['type'] == 'item' and event['index'] >= 20:
+                continue
+            yield validate_stream_event(event)
+    yield {'type': 'final', 'status': 200, 'answer': finalize(emitter.text)}
+
+# ==================== INTENCIONES Y FILTROS (tabla declarativa) ====================
+# (grupo, campo, valor, patrones). Dentro de un grupo gana la PRIMERA regla presente
+# en la pregunta: el orden es la prioridad ('muy crítica' antes que 'crítica', AWS antes que Azure).
+# Los patrones se comparan sin tildes ni mayúsculas ('perú' = 'peru').
+INTENT_RULES = [
+    # Routing: keywords que indican necesidad de datos
+    ('data', 'needs_data', True, [
+        'aplicacion', 'app', 'critica', 'criticidad',                                      # Apps
+        'colombia', 'argentina', 'chile', 'peru', 'mexico', 'espana', 'uruguay',           # Países
+        'venezuela', 'paraguay', 'turquia', 'estados unidos', 'usa', 'eeuu',
+        'deploy', 'drp', 'estrategica', 'activa', 'deprecada', 'mantenimiento', 'desarrollo',  # Atributos
+        'lista', 'muestra', 'busca', 'encuentra', 'cuantas', 'donde', 'cual',             # Acciones
+        'aws', 'azure', 'gcp', 'cloud', 'on-premise', 'kyndryl', 'ibm',                    # Tecnología
+        'portal', 'sistema', 'plataforma', 'servicio', 'atm', 'cajero',                    # Específicos
+    ]),
+    
+    # Intent numérico
+    ('numerical', 'is_numerical', True, ['cuantas', 'total', 'cuanto', 'how many', 'cantidad', 'numero']),
+    
+    # Intención visual
+    ('wants_table', 'wants_table', True, ['tabla', 'table', 'listar', 'list']),
+    ('wants_diagram', 'wants_diagram', True, ['diagrama', 'diagram', 'flow', 'flujo', 'grafico', 'chart']),
+    ('wants_comparison', 'wants_comparison', True, ['comparar', 'compare', 'vs', 'versus', 'diferencia']),
+    
+    # Países (variaciones → nombre oficial)
+    ('country', 'country', 'Colombia', ['colombia']),
+    ('country', 'country', 'Perú', ['peru']),
+    ('country', 'country', 'Argentina', ['argentina']),
+    ('country', 'country', 'Chile', ['chile']),
+    ('country', 'country', 'Uruguay', ['uruguay']),
+    ('country', 'country', 'Venezuela', ['venezuela']),
+    ('country', 'country', 'España', ['espana']),
+    ('country', 'country', 'México', ['mexico']),
+    ('country', 'country', 'Paraguay', ['paraguay']),
+    ('country', 'country', 'Turquía', ['turquia']),
+    ('country', 'country', 'Estados Unidos', ['estados unidos', 'usa', 'eeuu']),
+    
+    # Criticidad (muy crítico primero)
+    ('criticality', 'critic_name', 'Muy Crítico', ['muy critica']),
+    ('criticality', 'critic_name', 'Crítico', ['critica', 'criticidad']),
+    ('criticality', 'critic_name', 'Medio', ['media', 'medio']),
+    ('criticality', 'critic_name', 'Bajo', ['baja', 'bajo']),
+    
+    # Status
+    ('status', 'is_active', True, ['activa', 'activo', 'en uso']),
+    ('status', 'status', 'Deprecado', ['deprecada', 'deprecado']),
+    ('status', 'status', 'Mantenimiento', ['mantenimiento']),
+    ('status', 'status', 'En Desarrollo', ['desarrollo']),
+    
+    # DRP y estratégico
+    ('drp', 'has_drp', True, ['drp', 'recuperacion']),
+    ('strategic', 'is_strategic', True, ['estrategica', 'estrategico']),
+    
+    # Deploy (orden específico para evitar falsos positivos)
+    ('deploy', 'deploy', 'AWS', ['aws']),
+    ('deploy', 'deploy', 'Azure', ['azure']),
+    ('deploy', 'deploy', 'GCP', ['gcp', 'google cloud']),
+    ('deploy', 'deploy', 'IBM Cloud', ['ibm']),
+    ('deploy', 'deploy', 'Kyndryl', ['kyndryl']),
+    ('deploy', 'deploy', 'Hybrid Cloud', ['hybrid', 'hibrido']),
+    ('deploy', 'deploy', 'On-Premise', ['on premise', 'on-premise']),
+]
+
+VISUAL_INTENT_GROUPS = ('wants_table', 'wants_diagram', 'wants_comparison')
+FILTER_GROUPS = ('country', 'criticality', 'status', 'drp', 'strategic', 'deploy')
+
+def build_intent_matcher(rules: List[Tuple]) -> KeywordMatcher:
+    """Autómata con todos los patrones de la tabla; el payload es el índice de la regla."""
+    matcher = KeywordMatcher()
+    for index, (_, _, _, patterns) in enumerate(rules):
+        for pattern in patterns:
+            matcher.add(pattern, index)
+    return matcher.build()
+
+INTENT_MATCHER = build_intent_matcher(INTENT_RULES)
+
+@lru_cache(maxsize=256)
+def match_intents(question: str) -> Dict[str, Tuple[str, Any]]:
+    """
+    Una sola pasada del autómata sobre la pregunta.
+    
+    Memoizada: routing y extracción de filtros la llaman con la misma pregunta
+    (el dict devuelto es compartido, sólo lectura).
+    
+    Returns:
+        {grupo: (campo, valor)} con la regla de mayor prioridad de cada grupo presente
+    """
+    best = {}
+    for _, _, index in INTENT_MATCHER.find(question):
+        group = INTENT_RULES[index][0]
+        if index < best.get(group, len(INTENT_RULES)):
+            best[group] = index
+    return {group: INTENT_RULES[index][1:3] for group, index in best.items()}
+
 # ==================== ROUTING INTELIGENTE ====================
 def needs_rag_search(question: str) -> bool:
     """
@@ -161,45 +533,12 @@ def needs_rag_search(question: str) -> bool:
         False: Conversacional (saludo, ayuda, despedida)
     
     Estrategia:
-        - Si contiene keywords de datos → RAG
-        - Si es muy corta (≤3 palabras) sin keywords → Conversacional
+        - Si contiene keywords de datos (grupo 'data' de INTENT_RULES) → RAG
+        - Sin keywords (saludos, ayuda, despedidas) → Conversacional
     """
-    question_lower = question.lower().strip()
-    
-    # Keywords que indican necesidad de datos
-    data_keywords = [
-        # Apps
-        'aplicacion', 'aplicaciones', 'app', 'apps',
-        'critica', 'crítica', 'criticidad', 'criticas', 'críticas',
-        
-        # Países
-        'colombia', 'argentina', 'chile', 'perú', 'peru', 'méxico', 'mexico',
-        'españa', 'espana', 'uruguay', 'venezuela', 'paraguay', 
-        'turquía', 'turquia', 'estados unidos', 'usa', 'eeuu',
-        
-        # Atributos
-        'deploy', 'drp', 'estrategica', 'estratégica',
-        'activa', 'deprecada', 'mantenimiento', 'desarrollo',
-        
-        # Acciones
-        'lista', 'listar', 'muestra', 'busca', 'encuentra',
-        'cuantas', 'cuántas', 'donde', 'dónde', 'cual', 'cuál',
-        
-        # Tecnología
-        'aws', 'azure', 'gcp', 'cloud', 'on-premise', 'kyndryl', 'ibm',
-        
-        # Específicos
-        'portal', 'sistema', 'plataforma', 'servicio', 'atm', 'cajero'
-    ]
-    
-    needs_data = any(keyword in question_lower for keyword in data_keywords)
-    
-    # Si es muy corto y sin keywords → conversacional
-    if len(question_lower.split()) <= 3 and not needs_data:
-        return False
-    
-    return needs_data
+    return 'data' in match_intents(question)
 
+@traced('generation')
 def generate_conversational_response(question: str) -> Dict:
     """
     Claude responde SIN búsqueda (para small talk, ayuda, etc).
@@ -212,6 +551,16 @@ def generate_conversational_response(question: str) -> Dict:
     """
     logger.info("Modo conversacional: Claude responde sin RAG")
     
+    try:
+        answer_text = invoke_claude_text(build_conversational_request(question))
+        return finalize_conversational_answer(answer_text)
+    except Exception as e:
+        logger.error(f"Error en conversational: {e}")
+        return conversational_error_answer()
+
+@traced('context')
+def build_conversational_request(question: str) -> str:
+    """Body de Bedrock (Claude) para la respuesta conversacional."""
     prompt = f"""Human: Eres un asistente amigable y profesional de aplicaciones BBVA.
 
 **CONTEXTO**: El usuario hizo una pregunta que NO requiere buscar datos en la base de aplicaciones.
@@ -263,63 +612,73 @@ Pregunta: "apps"
 
 Responde SOLO con el JSON (sin ```json ni texto adicional):"""
 
-    body = json.dumps({
+    return json.dumps({
         "anthropic_version": "bedrock-2023-05-31",
         "max_tokens": 1500,
         "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
         "temperature": 0.7  # Más creativo para conversación
     })
+
+@traced('parse')
+def finalize_conversational_answer(answer_text: str) -> Dict:
+    """Parsea y valida el texto completo de Claude (modo conversacional)."""
+    logger.info(f"Respuesta conversacional (primeros 200 chars): {answer_text[:200]}")
     
-    try:
-        response = bedrock_runtime.invoke_model(
-            body=body,
-            modelId=BEDROCK_GENERATION_MODEL_ID,
-            accept="application/json",
-            contentType="application/json"
-        )
-        
-        response_body = json.loads(response.get('body').read())
-        answer_text = response_body.get('content', [{}])[0].get('text', '')
-        
-        logger.info(f"Respuesta conversacional (primeros 200 chars): {answer_text[:200]}")
-        
-        parsed = safe_json_parse(answer_text)
-        
-        if parsed and parsed.get('answer_type') == 'conversational':
-            return validate_response(parsed)
-        else:
-            # Fallback si parsing falla
-            return validate_response({
-                "answer_type": "conversational",
-                "message": "¡Hola! Soy tu asistente de aplicaciones BBVA. Puedo ayudarte a consultar el portafolio de apps por país, criticidad, deploy, etc.\n\nPor ejemplo: '¿Qué aplicaciones críticas tiene Colombia?'",
-                "suggestions": [
-                    "¿Apps críticas en Colombia?",
-                    "Muestra tabla de apps en Argentina",
-                    "Apps con DRP activo"
-                ],
-                "show_examples": True
-            })
-            
-    except Exception as e:
-        logger.error(f"Error en conversational: {e}")
+    parsed = safe_json_parse(answer_text)
+    
+    if parsed and parsed.get('answer_type') == 'conversational':
+        return validate_response(parsed)
+    else:
+        # Fallback si parsing falla
         return validate_response({
             "answer_type": "conversational",
-            "message": "¡Hola! Soy tu asistente de aplicaciones BBVA. ¿En qué puedo ayudarte?\n\nPrueba preguntarme sobre aplicaciones por país, criticidad o estado.",
+            "message": "¡Hola! Soy tu asistente de aplicaciones BBVA. Puedo ayudarte a consultar el portafolio de apps por país, criticidad, deploy, etc.\n\nPor ejemplo: '¿Qué aplicaciones críticas tiene Colombia?'",
             "suggestions": [
-                "¿Aplicaciones críticas en Colombia?",
-                "Lista apps en Argentina",
-                "Apps con DRP"
+                "¿Apps críticas en Colombia?",
+                "Muestra tabla de apps en Argentina",
+                "Apps con DRP activo"
             ],
             "show_examples": True
         })
 
+def conversational_error_answer() -> Dict:
+    """Respuesta conversacional por defecto si Bedrock falla."""
+    return validate_response({
+        "answer_type": "conversational",
+        "message": "¡Hola! Soy tu asistente de aplicaciones BBVA. ¿En qué puedo ayudarte?\n\nPrueba preguntarme sobre aplicaciones por país, criticidad o estado.",
+        "suggestions": [
+            "¿Aplicaciones críticas en Colombia?",
+            "Lista apps en Argentina",
+            "Apps con DRP"
+        ],
+        "show_examples": True
+    })
+
+@traced('generation')
+def generate_conversational_response_stream(question: str) -> Iterator[Dict]:
+    """
+    Variante en streaming de generate_conversational_response: emite 'message'
+    en cuanto Claude lo termina y después el evento 'final'.
+    """
+    logger.info("Modo conversacional (streaming): Claude responde sin RAG")
+    try:
+        yield from stream_structured_answer(
+            build_conversational_request(question), finalize_conversational_answer,
+            fields=('message',), arrays=()
+        )
+    except Exception as e:
+        logger.error(f"Error en conversational: {e}")
+        yield {'type': 'final', 'status': 200, 'answer': conversational_error_answer()}
+
 # ==================== EXTRACCIÓN DE FILTROS (V6: +exact_name +is_numerical) ====================
+@traced('filters')
 def extract_filters_from_question(question: str) -> Dict:
     """
     Detecta filtros, keywords visuales, nombres exactos y queries numéricas.
     
     V6 Cambios:
         + Detecta "qué es [nombre]" → exact_name
+        + Nombres del diccionario de entidades → exact_name + entity_names
         + Detecta "cuántas/total" → is_numerical
     
     Returns:
@@ -332,6 +691,7 @@ def extract_filters_from_question(question: str) -> Dict:
         - is_strategic: bool
         - is_active: bool
         - exact_name: str (v6)
+        - entity_names: list (aplicaciones del diccionario de entidades)
         - is_numerical: bool (v6)
         - visual_intent: dict (wants_table, wants_diagram, wants_comparison)
     """
@@ -340,8 +700,16 @@ def extract_filters_from_question(question: str) -> Dict:
     
     logger.info(f"Extrayendo filtros de: '{question[:80]}'")
     
-    # V6: Detectar nombre exacto (patrón: "qué es [nombre]")
-    name_match = re.search(r'qu[ée]\s+es\s+(.+?)(?:\?|$)', question_lower)
+    # Aplicaciones nombradas en la pregunta (diccionario de entidades del indexer)
+    entities = load_entity_index()
+    entity_names = entities.match(question) if entities is not None else []
+    if entity_names:
+        filters['exact_name'] = entity_names[0]
+        filters['entity_names'] = entity_names
+        logger.info(f"Aplicaciones detectadas por nombre: {entity_names}")
+    
+    # V6: Detectar nombre exacto (patrón: "qué es [nombre]") si el diccionario no lo reconoce
+    name_match = None if entity_names else re.search(r'qu[ée]\s+es\s+(.+?)(?:\?|$)', question_lower)
     if name_match:
         exact_name_raw = name_match.group(1).strip()
         # Normaliza: Title case preservando acrónimos
@@ -352,152 +720,82 @@ def extract_filters_from_question(question: str) -> Dict:
         filters['exact_name'] = exact_name
         logger.info(f"Nombre exacto detectado: '{exact_name}'")
     
+    # Intenciones y filtros en una sola pasada (tabla INTENT_RULES)
+    intents = match_intents(question)
+    
     # V6: Detectar intent numérico
-    filters['is_numerical'] = any(word in question_lower for word in [
-        'cuantas', 'cuántas', 'total', 'cuánto', 'how many', 'cantidad', 'numero', 'número'
-    ])
+    filters['is_numerical'] = 'numerical' in intents
     if filters['is_numerical']:
         logger.info("Intent numérico detectado")
     
     # Intención visual
-    visual_intent = {
-        'wants_table': any(word in question_lower for word in ['tabla', 'table', 'listar', 'list']),
-        'wants_diagram': any(word in question_lower for word in ['diagrama', 'diagram', 'flow', 'flujo', 'grafico', 'chart']),
-        'wants_comparison': any(word in question_lower for word in ['comparar', 'compare', 'vs', 'versus', 'diferencia'])
-    }
-    
-    # Países (mapa de variaciones → nombre oficial)
-    countries = {
-        'colombia': 'Colombia',
-        'perú': 'Perú', 'peru': 'Perú',
-        'argentina': 'Argentina',
-        'chile': 'Chile',
-        'uruguay': 'Uruguay',
-        'venezuela': 'Venezuela',
-        'españa': 'España', 'espana': 'España',
-        'méxico': 'México', 'mexico': 'México',
-        'paraguay': 'Paraguay',
-        'turquía': 'Turquía', 'turquia': 'Turquía',
-        'estados unidos': 'Estados Unidos', 'usa': 'Estados Unidos', 'eeuu': 'Estados Unidos'
-    }
-    
-    for key, value in countries.items():
-        if key in question_lower:
-            filters['country'] = value
-            break
-    
-    # Criticidad (orden específico: muy crítico primero)
-    if any(word in question_lower for word in ['muy critica', 'muy crítica', 'muy criticas', 'muy críticas']):
-        filters['critic_name'] = 'Muy Crítico'
-    elif any(word in question_lower for word in ['critica', 'crítica', 'criticas', 'críticas', 'criticidad']):
-        filters['critic_name'] = 'Crítico'
-    elif any(word in question_lower for word in ['media', 'medio']):
-        filters['critic_name'] = 'Medio'
-    elif any(word in question_lower for word in ['baja', 'bajo']):
-        filters['critic_name'] = 'Bajo'
-    
-    # Status
-    if any(word in question_lower for word in ['activa', 'activas', 'activo', 'activos', 'en uso']):
-        filters['is_active'] = True
-    elif any(word in question_lower for word in ['deprecada', 'deprecado', 'deprecadas']):
-        filters['status'] = 'Deprecado'
-    elif 'mantenimiento' in question_lower:
-        filters['status'] = 'Mantenimiento'
-    elif any(word in question_lower for word in ['desarrollo', 'en desarrollo']):
-        filters['status'] = 'En Desarrollo'
-    
-    # DRP
-    if 'drp' in question_lower or 'recuperación' in question_lower or 'recuperacion' in question_lower:
-        filters['has_drp'] = True
-    
-    # Estratégico
-    if any(word in question_lower for word in ['estratégica', 'estrategica', 'estratégicas', 'estrategico']):
-        filters['is_strategic'] = True
+    visual_intent = {group: group in intents for group in VISUAL_INTENT_GROUPS}
     
-    # Deploy (orden específico para evitar falsos positivos)
-    if 'aws' in question_lower:
-        filters['deploy'] = 'AWS'
-    elif 'azure' in question_lower:
-        filters['deploy'] = 'Azure'
-    elif 'gcp' in question_lower or 'google cloud' in question_lower:
-        filters['deploy'] = 'GCP'
-    elif 'ibm' in question_lower:
-        filters['deploy'] = 'IBM Cloud'
-    elif 'kyndryl' in question_lower:
-        filters['deploy'] = 'Kyndryl'
-    elif 'hybrid' in question_lower or 'híbrido' in question_lower or 'hibrido' in question_lower:
-        filters['deploy'] = 'Hybrid Cloud'
-    elif 'on premise' in question_lower or 'on-premise' in question_lower:
-        filters['deploy'] = 'On-Premise'
+    # Filtros term (país, criticidad, status, DRP, estratégico, deploy)
+    for group in FILTER_GROUPS:
+        if group in intents:
+            field, value = intents[group]
+            filters[field] = value
     
     filters['visual_intent'] = visual_intent
     logger.info(f"Filtros detectados: {filters}")
     return filters
 
 # ==================== EMBEDDING ====================
+@traced('embedding')
 def create_embedding(text: str) -> Optional[List[float]]:
     """
     Genera embedding usando Amazon Titan en Bedrock.
     
+    Las preguntas repetidas (misma forma normalizada) se sirven desde
+    query_embedding_cache sin llamar a Bedrock.
+    
     Args:
         text: Texto a convertir en embedding
     
     Returns:
         Lista de floats (embedding vector) o None si falla
     """
+    cache_key = normalize_question(text)
+    cached = query_embedding_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Embedding servido desde caché")
+        return cached
+    
     try:
         body = json.dumps({"inputText": text})
-        response = bedrock_runtime.invoke_model(
+        response = get_bedrock_runtime().invoke_model(
             body=body,
             modelId=BEDROCK_EMBEDDING_MODEL_ID,
             accept="application/json",
             contentType="application/json"
         )
         response_body = json.loads(response.get("body").read())
-        return response_body.get("embedding")
+        embedding = response_body.get("embedding")
+        if embedding:
+            query_embedding_cache.set(cache_key, embedding)
+            query_embedding_cache.flush()
+        return embedding
     except Exception as e:
         logger.error(f"Error creando embedding: {e}")
         return None
 
 # ==================== BÚSQUEDA HÍBRIDA V6 (Exact + Aggs + KNN Optimizado) ====================
-def search_opensearch(query_text: str, query_embedding: List[float], filters: Dict = None, top_k: int = TOP_K_RESULTS) -> Dict:
+FILTER_TERM_FIELDS = ['country', 'status', 'critic_name', 'deploy', 'app_type', 'quadrant',
+                      'is_strategic', 'has_drp', 'is_active']
+
+def build_filter_clauses(filters: Optional[Dict]) -> List[Dict]:
+    """Filtros term (country, criticidad, etc) comunes a la parte léxica y a la KNN."""
+    if not filters:
+        return []
+    return [{"term": {f"metadata.{key}": value}}
+            for key, value in filters.items() if key in FILTER_TERM_FIELDS]
+
+def build_lexical_clauses(query_text: str, exact_name: Optional[str] = None) -> List[Dict]:
     """
-    Búsqueda híbrida v6: BM25 + KNN + Exact Term + Aggregations.
-    
-    V6 Cambios:
-        + Term query en metadata.name.keyword (boost 10.0) para exact match
-        + Aggregations (size=0) para queries numéricas
-        + KNN k aumentado a top_k * 3 (45) para mejor cobertura
-    
-    Estrategia de 6 métodos combinados:
-        1. Term exacto en name.keyword (boost 10.0) - SI exact_name detectado
-        2. KNN semántico (k=45) - Encuentra conceptos similares
-        3. BM25 en metadata.name (boost 5.0) - Nombres fuzzy
-        4. BM25 en text_content (boost 2.0) - Descripciones
-        5. Phrase match (boost 3.0) - Frases exactas
-        6. Multi-match (boost 1.5) - Búsqueda en múltiples campos
-    
-    Aggregations:
-        - total_apps: cardinality en id_app (apps únicas, no docs)
-        - by_country: terms agg (si no numérico)
-    
-    Args:
-        query_text: Texto original de la pregunta
-        query_embedding: Vector embedding de la pregunta
-        filters: Filtros detectados (país, criticidad, exact_name, is_numerical, etc)
-        top_k: Número máximo de resultados
-    
-    Returns:
-        Dict con 'total', 'results', 'has_more', 'aggregations'
+    Should clauses que no dependen del embedding (métodos 1 y 3-6):
+    term exacto en name (si exact_name), BM25 en name y text_content, phrase y multi-match.
     """
-    logger.info(f"Búsqueda híbrida v6 - Query: '{query_text[:80]}'")
-    
-    # Extraer flags especiales antes de construir query
-    is_numerical = filters.get('is_numerical', False) if filters else False
-    exact_name = filters.pop('exact_name', None) if filters else None
-    visual_intent = filters.pop('visual_intent', None) if filters else None
-    
-    # Construir should clauses (métodos de búsqueda)
     should_clauses = []
     
     # V6: 1. Term exacto (MÁXIMA PRIORIDAD si exact_name detectado)
@@ -512,16 +810,6 @@ def search_opensearch(query_text: str, query_embedding: List[float], filters: Di
         })
         logger.info(f"Búsqueda exacta por nombre: '{exact_name}' (boost 10.0)")
     
-    # V6: 2. KNN Semántico (k aumentado a top_k * 3 = 45)
-    should_clauses.append({
-        "knn": {
-            "embedding": {
-                "vector": query_embedding,
-                "k": top_k * 3  # V6: De 30 a 45 para mejor cobertura
-            }
-        }
-    })
-    
     # 3. BM25 en metadata.name (nombres fuzzy)
     should_clauses.append({
         "match": {
@@ -561,34 +849,51 @@ def search_opensearch(query_text: str, query_embedding: List[float], filters: Di
             "boost": 1.5
         }
     })
+    return should_clauses
+
+def index_space_vector(query_embedding: List[float]):
+    """Embedding de la pregunta en el espacio del índice (norma 1 con EMBEDDING_NORMALIZE)."""
+    if not EMBEDDING_NORMALIZE:
+        return query_embedding
+    from vectors import normalize
+    return normalize(query_embedding)
+
+def build_knn_clause(query_embedding: List[float], top_k: int = TOP_K_RESULTS, k: Optional[int] = None,
+                     filter_clauses: Optional[List[Dict]] = None) -> Dict:
+    """
+    2. KNN semántico (k aumentado a top_k * 3 = 45 para mejor cobertura, salvo k explícito).
     
-    # V6: Size = 0 para queries numéricas (solo aggregations)
-    search_body = {
-        "size": 0 if is_numerical else top_k,
-        "query": {
-            "bool": {
-                "should": should_clauses,
-                "minimum_should_match": 1
-            }
-        },
-        "_source": ["text_content", "metadata"]
+    Con filter_clauses y KNN_FILTER_MODE 'efficient' los filtros van en el propio knn:
+    los k vecinos ya cumplen los filtros en vez de descartarse después en el bool.filter.
+    """
+    from serializer import FloatVector  # Se serializa con precisión float32 (la del knn_vector)
+    from vectors import byte_score_boost, quantize
+    if KNN_VECTOR_ENCODING == 'byte':
+        vector = quantize(index_space_vector(query_embedding), KNN_BYTE_SCALE).tolist()
+    else:
+        vector = FloatVector(index_space_vector(query_embedding))
+    clause = {
+        "vector": vector,
+        "k": k or top_k * 3  # V6: De 30 a 45 para mejor cobertura
     }
-    
-    # Aplicar filtros adicionales (country, criticidad, etc)
-    if filters:
-        filter_clauses = []
-        
-        for key, value in filters.items():
-            if key in ['country', 'status', 'critic_name', 'deploy', 'app_type', 'quadrant']:
-                filter_clauses.append({"term": {f"metadata.{key}": value}})
-            elif key in ['is_strategic', 'has_drp', 'is_active']:
-                filter_clauses.append({"term": {f"metadata.{key}": value}})
-        
-        if filter_clauses:
-            search_body["query"]["bool"]["filter"] = filter_clauses
-            logger.info(f"Filtros aplicados: {[f['term'] for f in filter_clauses]}")
-    
-    # V6: Aggregations (para counts precisos)
+    if filter_clauses and KNN_FILTER_MODE == 'efficient':
+        clause["filter"] = {"bool": {"filter": filter_clauses}}
+    boost = byte_score_boost(KNN_SPACE_TYPE, KNN_BYTE_SCALE) if KNN_VECTOR_ENCODING == 'byte' else 1.0
+    if boost != 1.0:
+        # innerproduct: el producto de enteros escala el score por KNN_BYTE_SCALE²; se devuelve a
+        # la escala float para que la fusión 'sum' con BM25 no quede dominada por el kNN. Con l2
+        # el score 1 / (1 + d²) no se corrige con un boost: byte + l2 pide HYBRID_MODE rrf o minmax
+        clause["boost"] = boost
+    return {"knn": {"embedding": clause}}
+
+def hybrid_knn_k(top_k: int = TOP_K_RESULTS) -> int:
+    """k del kNN: con fusión por rangos no hace falta sobre-pedir candidatos."""
+    if HYBRID_MODE == 'sum':
+        return top_k * 3
+    return HYBRID_KNN_K or top_k
+
+def build_aggregations(filters: Optional[Dict], is_numerical: bool) -> Dict:
+    """Aggregations: total_apps (cardinality en id_app) y by_country si no es numérico."""
     aggs = {
         "total_apps": {
             "cardinality": {"field": "metadata.id_app"}  # Estima apps únicas por ID
@@ -603,16 +908,285 @@ def search_opensearch(query_text: str, query_embedding: List[float], filters: Di
                 "size": 10
             }
         }
+    return aggs
+
+def build_search_body(should_clauses: List[Dict], filter_clauses: List[Dict], size: int, aggs: Dict = None) -> Dict:
+    """Query bool (should + filter) con los campos que consume generate_response."""
+    search_body = {
+        "size": size,
+        "query": {
+            "bool": {
+                "should": should_clauses,
+                "minimum_should_match": 1
+            }
+        },
+        "_source": ["text_content", "metadata"]
+    }
+    if filter_clauses:
+        search_body["query"]["bool"]["filter"] = filter_clauses
+    if aggs:
+        search_body["aggs"] = aggs
+    return search_body
+
+def build_lexical_body(query_text: str, filters: Dict = None, top_k: int = TOP_K_RESULTS) -> Dict:
+    """
+    Query de la parte que no necesita embedding (Term + BM25 + Aggs).
+    
+    No modifica filters (search_opensearch retira exact_name/visual_intent después).
+    Pide top_k * 3 hits para que la fusión con KNN tenga candidatos suficientes.
+    """
+    filters = filters or {}
+    is_numerical = filters.get('is_numerical', False)
+    term_filters = {k: v for k, v in filters.items() if k not in ('exact_name', 'visual_intent')}
+    return build_search_body(
+        build_lexical_clauses(query_text, filters.get('exact_name')),
+        build_filter_clauses(term_filters),
+        size=0 if is_numerical else top_k * 3,
+        aggs=build_aggregations(term_filters, is_numerical)
+    )
+
+def timed_search(body: Dict) -> Tuple[Dict, float]:
+    """get_opensearch_client().search + latencia en ms medida en el cliente."""
+    start = time.perf_counter()
+    response = get_opensearch_client().search(index=OPENSEARCH_INDEX, body=body)
+    return response, (time.perf_counter() - start) * 1000
+
+def start_lexical_search(query_text: str, filters: Dict = None, top_k: int = TOP_K_RESULTS) -> Optional[Future]:
+    """
+    Lanza en segundo plano la parte léxica de la búsqueda (build_lexical_body),
+    para que corra mientras Bedrock calcula el vector.
+    
+    Las preguntas numéricas no se adelantan: su respuesta es el conteo, que
+    search_opensearch calcula con la query combinada (léxico + kNN) como en v6.
+    
+    Returns:
+        Future con (respuesta cruda de OpenSearch, ms), o None si está desactivado
+    """
+    if not QUERY_PARALLEL_SEARCH or (filters or {}).get('is_numerical'):
+        return None
+    if RETRIEVER_MODE == 'local' and load_local_retriever() is not None:
+        return None
+    return _executor.submit(timed_search, build_lexical_body(query_text, filters, top_k))
+
+def fuse_hits(lexical_hits: List[Dict], vector_hits: List[Dict], mode: str = None) -> List[Dict]:
+    """
+    Fusiona los hits léxicos y los del kNN por _id (ordenado por score descendente).
     
-    search_body["aggs"] = aggs
+    Modos (HYBRID_MODE):
+        - sum: suma de _score, igual que un bool/should con todas las cláusulas juntas
+        - rrf: 1 / (HYBRID_RRF_K + rank) por recuperador; sólo importa el orden
+        - minmax: (score - min) / (max - min) por recuperador, ponderado con HYBRID_VECTOR_WEIGHT
+    """
+    mode = mode or HYBRID_MODE
+    weights = (1.0 - HYBRID_VECTOR_WEIGHT, HYBRID_VECTOR_WEIGHT) if mode == 'minmax' else (1.0, 1.0)
+    merged = {}
+    for hits, weight in zip((lexical_hits, vector_hits), weights):
+        if not hits:
+            continue
+        scores = [hit['_score'] or 0.0 for hit in hits]
+        low, high = min(scores), max(scores)
+        for rank, (hit, score) in enumerate(zip(hits, scores), 1):
+            if mode == 'rrf':
+                contribution = 1.0 / (HYBRID_RRF_K + rank)
+            elif mode == 'minmax':
+                contribution = weight * ((score - low) / (high - low) if high > low else 1.0)
+            else:
+                contribution = score
+            doc_id = hit['_id']
+            if doc_id in merged:
+                merged[doc_id]['_score'] += contribution
+            else:
+                merged[doc_id] = dict(hit, _score=contribution)
+    return sorted(merged.values(), key=lambda h: h['_score'], reverse=True)
+
+def multi_search(bodies: List[Dict]) -> Tuple[List[Dict], float]:
+    """Varias búsquedas en un único round trip (_msearch). Devuelve las respuestas y los ms totales."""
+    start = time.perf_counter()
+    payload = []
+    for body in bodies:
+        payload.extend([{"index": OPENSEARCH_INDEX}, body])
+    responses = get_opensearch_client().msearch(body=payload)['responses']
+    return responses, (time.perf_counter() - start) * 1000
+
+def search_local(local: 'LocalRetriever', query_embedding: List[float], filters: Dict, top_k: int,
+                 exact_name: Optional[str], is_numerical: bool) -> Dict:
+    """search_opensearch resuelto en proceso con el recuperador local (mismo formato de salida)."""
+    start = time.perf_counter()
+    search_results = local.search(index_space_vector(query_embedding), filters, top_k,
+                                  exact_name=exact_name, is_numerical=is_numerical)
+    logger.info(f"Recuperador local: {search_results['total']} totales, retornando top {len(search_results['results'])} "
+                f"en {(time.perf_counter() - start) * 1000:.2f} ms (generación {local.generation})")
+    return search_results
+
+@traced('lookup')
+def lookup_entities(filters: Dict, top_k: int = TOP_K_RESULTS) -> Optional[Dict]:
+    """
+    Aplicaciones nombradas en la pregunta (filters['entity_names']) con un term directo
+    en metadata.name + los filtros term: sin embedding ni kNN.
     
+    Returns:
+        Mismo formato que search_opensearch, o None si no hay coincidencias o la
+        búsqueda falla (la pregunta sigue por la búsqueda híbrida)
+    """
+    names = filters.get('entity_names') or []
+    if not names:
+        return None
+    start = time.perf_counter()
     try:
-        response = opensearch_client.search(index=OPENSEARCH_INDEX, body=search_body)
+        local = load_local_retriever() if RETRIEVER_MODE == 'local' else None
+        if local is not None:
+            search_results = local.lookup(names, filters, top_k)
+        else:
+            response = get_opensearch_client().search(index=OPENSEARCH_INDEX, body=build_search_body(
+                [{"terms": {"metadata.name": names}}],
+                build_filter_clauses(filters),
+                size=top_k,
+                aggs=build_aggregations(filters, False)
+            ))
+            hits = response['hits']['hits']
+            total = response.get('aggregations', {}).get('total_apps', {}).get('value', response['hits']['total']['value'])
+            search_results = {
+                'total': total,
+                'results': [{'score': hit['_score'], 'text': hit['_source']['text_content'],
+                             'metadata': hit['_source']['metadata']} for hit in hits],
+                'has_more': total > len(hits),
+                'aggregations': response.get('aggregations', {}),
+            }
+    except Exception as e:
+        logger.warning(f"Búsqueda directa por nombre falló, se usa la búsqueda híbrida: {e}")
+        return None
+    
+    lookup_ms = (time.perf_counter() - start) * 1000
+    if not search_results['results']:
+        logger.info(f"Sin resultados directos para {names} con los filtros aplicados")
+        return None
+    search_results['timings'] = {'lookup_ms': lookup_ms}
+    logger.info(f"Búsqueda directa por nombre: {search_results['total']} apps para {names} en {lookup_ms:.1f} ms")
+    return search_results
+
+@traced('search')
+def search_opensearch(query_text: str, query_embedding: List[float], filters: Dict = None,
+                      top_k: int = TOP_K_RESULTS, lexical_future: Optional[Future] = None) -> Dict:
+    """
+    Búsqueda híbrida v6: BM25 + KNN + Exact Term + Aggregations.
+    
+    V6 Cambios:
+        + Term query en metadata.name.keyword (boost 10.0) para exact match
+        + Aggregations (size=0) para queries numéricas
+        + KNN k aumentado a top_k * 3 (45) para mejor cobertura
+    
+    Estrategia de 6 métodos combinados:
+        1. Term exacto en name.keyword (boost 10.0) - SI exact_name detectado
+        2. KNN semántico (k=45) - Encuentra conceptos similares
+        3. BM25 en metadata.name (boost 5.0) - Nombres fuzzy
+        4. BM25 en text_content (boost 2.0) - Descripciones
+        5. Phrase match (boost 3.0) - Frases exactas
+        6. Multi-match (boost 1.5) - Búsqueda en múltiples campos
+    
+    Aggregations:
+        - total_apps: cardinality en id_app (apps únicas, no docs)
+        - by_country: terms agg (si no numérico)
+    
+    Si llega lexical_future (start_lexical_search), los métodos 1 y 3-6 y las
+    aggregations ya están en vuelo: aquí sólo se lanza el KNN y se suman los
+    scores por _id. Con la búsqueda separada, total y by_country salen de las
+    aggregations de la parte léxica: cuentan los docs que cumplen los filtros y
+    alguna cláusula léxica, y los vecinos que sólo trae el kNN (como mucho k)
+    aparecen en results pero no en los conteos. Las queries numéricas, cuya
+    respuesta es el conteo, usan siempre la query combinada de v6 (size=0). Si
+    la parte léxica falló, se vuelve a la query combinada.
+    
+    Con HYBRID_MODE 'rrf' o 'minmax' léxico y kNN (k = HYBRID_KNN_K) se fusionan
+    por rango o por score normalizado (fuse_hits); sin parte léxica en vuelo se
+    piden juntos en un _msearch. 'timings' lleva la latencia de cada recuperador.
+    
+    Los filtros term van también dentro del knn (KNN_FILTER_MODE 'efficient'): con
+    filtros selectivos (un país + 'Muy Crítico') el kNN ya no devuelve vecinos que
+    el bool.filter descarta después.
+    
+    Args:
+        query_text: Texto original de la pregunta
+        query_embedding: Vector embedding de la pregunta
+        filters: Filtros detectados (país, criticidad, exact_name, is_numerical, etc)
+        top_k: Número máximo de resultados
+        lexical_future: Búsqueda léxica ya lanzada (opcional)
+    
+    Returns:
+        Dict con 'total', 'results', 'has_more', 'aggregations', 'timings'
+    """
+    logger.info(f"Búsqueda híbrida v6 - Query: '{query_text[:80]}'")
+    
+    # Extraer flags especiales antes de construir query
+    is_numerical = filters.get('is_numerical', False) if filters else False
+    exact_name = filters.pop('exact_name', None) if filters else None
+    visual_intent = filters.pop('visual_intent', None) if filters else None
+    
+    filter_clauses = build_filter_clauses(filters)
+    if filter_clauses:
+        logger.info(f"Filtros aplicados: {[f['term'] for f in filter_clauses]}")
+    
+    if RETRIEVER_MODE == 'local':
+        local = load_local_retriever()
+        if local is not None:
+            if visual_intent and filters is not None:
+                filters['visual_intent'] = visual_intent
+            return search_local(local, query_embedding, filters, top_k, exact_name, is_numerical)
+    
+    try:
+        response = None
+        timings = {}
+        if lexical_future is not None:
+            try:
+                response, timings['lexical_ms'] = lexical_future.result(timeout=OPENSEARCH_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Búsqueda léxica en paralelo falló, se usa la query combinada: {e}")
+        
+        knn_k = hybrid_knn_k(top_k)
+        vector_body = build_search_body([build_knn_clause(query_embedding, top_k, k=knn_k, filter_clauses=filter_clauses)],
+                                        filter_clauses, size=knn_k)
+        
+        if response is not None and not is_numerical:
+            # Los hits y las aggregations léxicas ya llegaron: sólo falta el kNN
+            try:
+                vector_response, timings['vector_ms'] = timed_search(vector_body)
+                knn_hits = vector_response['hits']['hits']
+            except Exception as e:
+                logger.warning(f"KNN falló, se usan sólo los resultados léxicos: {e}")
+                knn_hits = []
+            hits = fuse_hits(response['hits']['hits'], knn_hits)[:top_k]
+        elif HYBRID_MODE != 'sum' and not is_numerical:
+            # Léxico (con las aggregations) y vectorial como sub-queries independientes en un solo _msearch
+            lexical_body = build_lexical_body(query_text, dict(filters or {}, exact_name=exact_name), top_k)
+            responses, timings['msearch_ms'] = multi_search([lexical_body, vector_body])
+            if 'error' in responses[0]:
+                raise RuntimeError(f"msearch léxico: {responses[0]['error']}")
+            response = responses[0]
+            timings['lexical_ms'] = response.get('took', 0)
+            knn_hits = []
+            if 'error' in responses[1]:
+                logger.warning(f"KNN falló, se usan sólo los resultados léxicos: {responses[1]['error']}")
+            else:
+                knn_hits = responses[1]['hits']['hits']
+                timings['vector_ms'] = responses[1].get('took', 0)
+            hits = fuse_hits(response['hits']['hits'], knn_hits)[:top_k]
+        else:
+            # V6: query combinada; size = 0 para queries numéricas (solo aggregations)
+            search_body = build_search_body(
+                [build_knn_clause(query_embedding, top_k, filter_clauses=filter_clauses)]
+                + build_lexical_clauses(query_text, exact_name),
+                filter_clauses,
+                size=0 if is_numerical else top_k,
+                aggs=build_aggregations(filters, is_numerical)
+            )
+            response, timings['hybrid_ms'] = timed_search(search_body)
+            hits = response['hits']['hits']
+        
+        logger.info(f"Latencia por recuperador ({HYBRID_MODE}): " + ", ".join(f"{k}={v:.1f}" for k, v in timings.items()))
         
         # Parsear resultados
         results = []
         if not is_numerical:  # Solo procesar hits si no es numérico
-            for hit in response['hits']['hits']:
+            for hit in hits:
                 results.append({
                     'score': hit['_score'],
                     'text': hit['_source']['text_content'],
@@ -629,7 +1203,7 @@ def search_opensearch(query_text: str, query_embedding: List[float], filters: Di
             for idx, result in enumerate(results[:3], 1):
                 app_name = result['metadata'].get('name', 'N/A')[:50]
                 score = result['score']
-                logger.info(f"  {idx}. {app_name} (score: {score:.2f})")
+                logger.info(f"  {idx}. {app_name} (score: {score:.4f})")
         
         logger.info(f"Híbrido v6: {agg_total} totales, retornando top {len(results)}")
         
@@ -641,13 +1215,83 @@ def search_opensearch(query_text: str, query_embedding: List[float], filters: Di
             'total': agg_total,  # V6: Usa agg count
             'results': results,
             'has_more': False if is_numerical else agg_total > len(results),
-            'aggregations': response.get('aggregations', {})  # V6: Pasa aggs completas
+            'aggregations': response.get('aggregations', {}),  # V6: Pasa aggs completas
+            'timings': timings
         }
     except Exception as e:
         logger.error(f"Error en búsqueda híbrida v6: {e}")
+        # Hot-standby: el dominio no responde, se sirve desde el snapshot local
+        local = load_local_retriever()
+        if local is not None:
+            logger.warning("OpenSearch no disponible: respondiendo con el recuperador local")
+            if visual_intent and filters is not None:
+                filters['visual_intent'] = visual_intent
+            return search_local(local, query_embedding, filters, top_k, exact_name, is_numerical)
         return {'total': 0, 'results': [], 'has_more': False, 'aggregations': {}}
 
+# ==================== CONTEXTO PARA CLAUDE ====================
+# Columnas de la tabla de contexto: (cabecera, valor a partir de la metadata)
+CONTEXT_COLUMNS = [
+    ('Nombre', lambda m: m.get('name')),
+    ('País', lambda m: m.get('country')),
+    ('Criticidad', lambda m: m.get('critic_name')),
+    ('Score', lambda m: m.get('score') or None),
+    ('Tipo', lambda m: m.get('app_type')),
+    ('Deploy', lambda m: m.get('deploy')),
+    ('Status', lambda m: m.get('status')),
+    ('DRP', lambda m: m.get('drp')),
+    ('Estratégico', lambda m: 'Sí' if m.get('is_strategic') else 'No'),
+    ('Owner', lambda m: m.get('owner')),
+    ('Dominio', lambda m: m.get('service_domain')),
+]
+EMPTY_CONTEXT_VALUES = {'', 'nan', 'n/a', 'none'}
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida de tokens (CHARS_PER_TOKEN caracteres por token)."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+def _context_cell(value: Any) -> str:
+    text = '' if value is None else str(value).strip()
+    return '' if text.lower() in EMPTY_CONTEXT_VALUES else text.replace('|', '/').replace('\n', ' ')
+
+def build_context(results: List[Dict], token_budget: int = CONTEXT_TOKEN_BUDGET, max_apps: int = TOP_K_RESULTS) -> Tuple[str, int]:
+    """
+    Contexto compacto para Claude: tabla separada por '|' con la cabecera una sola vez.
+    
+        - Una fila por id_app (los chunks de la misma app se deduplican; queda el de más score)
+        - Se omiten las columnas sin ningún valor; los vacíos ('N/A', 'nan') quedan en blanco
+        - Se añaden filas, en orden de relevancia, mientras quepan en token_budget
+    
+    Returns:
+        (tabla, número de aplicaciones incluidas)
+    """
+    seen = set()
+    rows = []
+    for result in results:
+        metadata = result['metadata']
+        key = metadata.get('id_app') or metadata.get('name')
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append([_context_cell(get(metadata)) for _, get in CONTEXT_COLUMNS])
+        if len(rows) >= max_apps:
+            break
+    
+    keep = [i for i in range(len(CONTEXT_COLUMNS)) if any(row[i] for row in rows)]
+    header = ' | '.join(CONTEXT_COLUMNS[i][0] for i in keep)
+    lines = [header]
+    used = estimate_tokens(header)
+    for row in rows:
+        line = ' | '.join(row[i] for i in keep)
+        cost = estimate_tokens(line)
+        if len(lines) > 1 and used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    return '\n'.join(lines), len(lines) - 1
+
 # ==================== GENERACIÓN DE RESPUESTA V6 (Soporte Numérico) ====================
+@traced('generation')
 def generate_response(question: str, search_results: Dict, applied_filters: Dict) -> Dict:
     """
     Genera respuesta estructurada con Claude.
@@ -668,6 +1312,45 @@ def generate_response(question: str, search_results: Dict, applied_filters: Dict
     """
     logger.info("Generando respuesta con Claude (v6)...")
     
+    answer, body = build_generation_request(question, search_results, applied_filters)
+    if answer is not None:
+        return answer
+    
+    try:
+        return finalize_generated_answer(invoke_claude_text(body))
+    except Exception as e:
+        logger.error(f"Error generando respuesta: {e}")
+        return generation_error_answer(e)
+
+@traced('generation')
+def generate_response_stream(question: str, search_results: Dict, applied_filters: Dict) -> Iterator[Dict]:
+    """
+    Variante en streaming de generate_response.
+    
+    Emite 'summary' y cada entrada de 'applications' en cuanto Claude las
+    cierra (eventos 'field'/'item') y termina con el evento 'final', que lleva
+    la respuesta completa validada igual que generate_response.
+    """
+    logger.info("Generando respuesta con Claude (v6, streaming)...")
+    
+    answer, body = build_generation_request(question, search_results, applied_filters)
+    if answer is not None:
+        yield {'type': 'final', 'status': 200, 'answer': answer}
+        return
+    
+    try:
+        yield from stream_structured_answer(body, finalize_generated_answer,
+                                            fields=('summary',), arrays=('applications',))
+    except Exception as e:
+        logger.error(f"Error generando respuesta: {e}")
+        yield {'type': 'final', 'status': 200, 'answer': generation_error_answer(e)}
+
+@traced('context')
+def build_generation_request(question: str, search_results: Dict, applied_filters: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Prepara la generación: (respuesta, None) si no hace falta Claude (queries
+    numéricas, sin resultados) o (None, body de Bedrock) en otro caso.
+    """
     # V6: Manejo de queries numéricas (sin resultados detallados)
     is_numerical = applied_filters.get('is_numerical', False)
     if is_numerical:
@@ -700,7 +1383,7 @@ def generate_response(question: str, search_results: Dict, applied_filters: Dict
             "has_more": False,
             "page": 1,
             "page_size": 0
-        })
+        }), None
     
     # Manejo estándar (no numérico)
     if not search_results['results']:
@@ -713,36 +1396,31 @@ def generate_response(question: str, search_results: Dict, applied_filters: Dict
                 "Prueba: 'Muestra tabla de apps en Argentina'"
             ],
             "filters_applied": {k:v for k,v in applied_filters.items() if k not in ['visual_intent', 'is_numerical']}
-        })
-    
-    # Construir contexto para Claude
-    context_parts = []
-    total_results = len(search_results['results'])
-    display_limit = min(total_results, TOP_K_RESULTS)
+        }), None
     
-    for idx, result in enumerate(search_results['results'][:display_limit], 1):
-        metadata = result['metadata']
-        context_parts.append(f"""
-Aplicación {idx}:
-- Nombre: {metadata.get('name', 'N/A')}
-- País: {metadata.get('country', 'N/A')}
-- Criticidad: {metadata.get('critic_name', 'N/A')} (Score: {metadata.get('score', 'N/A')})
-- Tipo: {metadata.get('app_type', 'N/A')}
-- Deploy: {metadata.get('deploy', 'N/A')}
-- Status: {metadata.get('status', 'N/A')}
-- DRP: {metadata.get('drp', 'N/A')}
-- Estratégico: {'Sí' if metadata.get('is_strategic') else 'No'}
-- Owner: {metadata.get('owner', 'N/A')}
-- Dominio: {metadata.get('service_domain', 'N/A')}
-""")
-    
-    context = "\n---\n".join(context_parts)
+    # Construir contexto para Claude (tabla compacta con presupuesto de tokens)
+    context, display_limit = build_context(search_results['results'])
+    logger.info(f"Contexto: {display_limit} apps de {len(search_results['results'])} resultados, "
+                f"~{estimate_tokens(context)} tokens estimados (presupuesto {CONTEXT_TOKEN_BUDGET})")
     
     # Detectar intención visual
     visual_intent = applied_filters.get('visual_intent', {})
     wants_table = visual_intent.get('wants_table', False)
     wants_diagram = visual_intent.get('wants_diagram', False)
     
+    # Las instrucciones de tabla/diagrama sólo se envían si la pregunta los pide
+    visual_sections = ""
+    if wants_table:
+        visual_sections += """**LA PREGUNTA PIDE TABLA**, AÑADE este campo:
+   "html_table": "<table border='1' style='width:100%; border-collapse:collapse;'><thead><tr style='background:#002d72; color:white;'><th>Nombre</th><th>País</th><th>Criticidad</th><th>Deploy</th><th>Estado</th></tr></thead><tbody><tr><td>App1</td><td>Colombia</td><td>Crítico</td><td>AWS</td><td>Activo</td></tr></tbody></table>"
+
+"""
+    if wants_diagram:
+        visual_sections += """**LA PREGUNTA PIDE DIAGRAMA**, AÑADE este campo:
+   "mermaid_diagram": "flowchart TD\\n    A[Query Usuario] --> B[Embedding]\\n    B --> C[OpenSearch Híbrido]\\n    C --> D[Claude Generation]\\n    D --> E[Respuesta]\\n    style A fill:#e3f2fd,stroke:#002d72\\n    style E fill:#c8e6c9,stroke:#388e3c"
+
+"""
+    
     prompt = f"""Human: Eres un asistente experto en arquitectura BBVA.
 
 **INSTRUCCIONES CRÍTICAS:**
@@ -772,19 +1450,13 @@ Aplicación {idx}:
   "page_size": {display_limit}
 }}
 
-**SI LA PREGUNTA PIDE TABLA** (detectado: {wants_table}), AÑADE este campo:
-   "html_table": "<table border='1' style='width:100%; border-collapse:collapse;'><thead><tr style='background:#002d72; color:white;'><th>Nombre</th><th>País</th><th>Criticidad</th><th>Deploy</th><th>Estado</th></tr></thead><tbody><tr><td>App1</td><td>Colombia</td><td>Crítico</td><td>AWS</td><td>Activo</td></tr></tbody></table>"
-
-**SI LA PREGUNTA PIDE DIAGRAMA** (detectado: {wants_diagram}), AÑADE este campo:
-   "mermaid_diagram": "flowchart TD\\n    A[Query Usuario] --> B[Embedding]\\n    B --> C[OpenSearch Híbrido]\\n    C --> D[Claude Generation]\\n    D --> E[Respuesta]\\n    style A fill:#e3f2fd,stroke:#002d72\\n    style E fill:#c8e6c9,stroke:#388e3c"
-
-**IMPORTANTE**: 
+{visual_sections}**IMPORTANTE**: 
 - Si el contexto contiene apps relacionadas aunque no sea el nombre exacto, menciónalas
 - Usa tu criterio para identificar la app más relevante
 - Prioriza calidad sobre cantidad en highlights e insights
 - RESPONDE SOLO CON EL JSON (sin ```json ni texto adicional)
 
-**CONTEXTO DE APLICACIONES:**
+**CONTEXTO DE APLICACIONES** (tabla, columnas separadas por '|'):
 <context>
 {context}
 </context>
@@ -794,59 +1466,188 @@ Aplicación {idx}:
 
 Genera el JSON completo ahora:"""
 
-    body = json.dumps({
+    return None, json.dumps({
         "anthropic_version": "bedrock-2023-05-31",
         "max_tokens": MAX_TOKENS,
         "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
         "temperature": 0.3  # Más determinístico para datos estructurados
     })
+
+@traced('parse')
+def finalize_generated_answer(answer_text: str) -> Dict:
+    """Parsea, sanitiza (XSS) y valida el texto completo de Claude (modo RAG)."""
+    logger.info(f"Respuesta Claude (primeros 300 chars): {answer_text[:300]}")
     
-    try:
-        response = bedrock_runtime.invoke_model(
-            body=body,
-            modelId=BEDROCK_GENERATION_MODEL_ID,
-            accept="application/json",
-            contentType="application/json"
-        )
-        
-        response_body = json.loads(response.get('body').read())
-        answer_text = response_body.get('content', [{}])[0].get('text', '')
-        
-        logger.info(f"Respuesta Claude (primeros 300 chars): {answer_text[:300]}")
-        
-        # Parsing seguro del JSON
-        parsed_json = safe_json_parse(answer_text)
-        
-        if not parsed_json:
-            logger.warning("JSON parsing falló")
-            return validate_response({
-                "answer_type": "parse_error",
-                "message": "La respuesta no pudo ser procesada completamente.",
-                "raw_text": answer_text[:500]
-            })
-        
-        # Sanitizar visuales (XSS protection)
-        if 'html_table' in parsed_json and parsed_json['html_table']:
-            parsed_json['html_table'] = sanitize_html(parsed_json['html_table'])
-            logger.info("HTML table sanitizada")
-        
-        if 'mermaid_diagram' in parsed_json and parsed_json['mermaid_diagram']:
-            if not validate_mermaid(parsed_json['mermaid_diagram']):
-                logger.warning("Mermaid diagram inválido, removiendo")
-                parsed_json['mermaid_diagram'] = None
-            else:
-                logger.info("Mermaid diagram válido")
-        
-        return validate_response(parsed_json)
-        
-    except Exception as e:
-        logger.error(f"Error generando respuesta: {e}")
+    # Parsing seguro del JSON
+    parsed_json = safe_json_parse(answer_text)
+    
+    if not parsed_json:
+        logger.warning("JSON parsing falló")
         return validate_response({
-            "answer_type": "error",
-            "message": f"Error al generar respuesta: {str(e)}"
+            "answer_type": "parse_error",
+            "message": "La respuesta no pudo ser procesada completamente.",
+            "raw_text": answer_text[:500]
         })
+    
+    # Sanitizar visuales (XSS protection)
+    if 'html_table' in parsed_json and parsed_json['html_table']:
+        parsed_json['html_table'] = sanitize_html(parsed_json['html_table'])
+        logger.info("HTML table sanitizada")
+    
+    if 'mermaid_diagram' in parsed_json and parsed_json['mermaid_diagram']:
+        if not validate_mermaid(parsed_json['mermaid_diagram']):
+            logger.warning("Mermaid diagram inválido, removiendo")
+            parsed_json['mermaid_diagram'] = None
+        else:
+            logger.info("Mermaid diagram válido")
+    
+    return validate_response(parsed_json)
+
+def generation_error_answer(error: Exception) -> Dict:
+    """Respuesta de error cuando falla la llamada a Claude."""
+    return validate_response({
+        "answer_type": "error",
+        "message": f"Error al generar respuesta: {str(error)}"
+    })
 
 # ==================== HANDLER PRINCIPAL ====================
+CORS_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS'
+}
+
+def answer_events(question: str, request_id: str, stream: bool = False) -> Iterator[Dict]:
+    """
+    Pipeline de respuesta (routing, filtros, cachés, búsqueda, generación) como
+    secuencia de eventos. El último es siempre {'type': 'final', 'status', 'answer'}.
+    
+    Con stream=True la generación usa invoke_model_with_response_stream y antes
+    del final emite eventos 'field' (summary/message) e 'item' (applications[]).
+    """
+    # ========== ROUTING INTELIGENTE ==========
+    with tracing.span('routing'):
+        use_rag = needs_rag_search(question)
+    if not use_rag:
+        logger.info(f"[{request_id}] → CONVERSACIONAL (sin búsqueda)")
+        tracing.annotate(route='conversational')
+        if stream:
+            yield from generate_conversational_response_stream(question)
+        else:
+            yield {'type': 'final', 'status': 200, 'answer': generate_conversational_response(question)}
+        return
+    
+    # ========== RUTA RAG V6 (Exact + Aggs + Híbrido) ==========
+    logger.info(f"[{request_id}] → RAG v6 (exact + aggs + híbrido)")
+    
+    prefetch_local_retriever()
+    
+    # 1. Extraer filtros (v6: incluye exact_name, is_numerical)
+    filters = extract_filters_from_question(question)
+    
+    # Caché de respuestas: clave con los filtros tal como se extrajeron (search_opensearch los modifica)
+    with tracing.span('answer_cache'):
+        normalized_question = normalize_question(question)
+        cache_filters = json.loads(AnswerCache.filters_key(filters))
+        answer_cache.set_generation(get_index_generation())
+        cached_answer = answer_cache.get(normalized_question, cache_filters)
+    if cached_answer is not None:
+        logger.info(f"[{request_id}] Respuesta servida desde caché (exacta): {answer_cache.stats()}")
+        tracing.annotate(route='answer_cache')
+        yield {'type': 'final', 'status': 200, 'answer': cached_answer}
+        return
+    
+    # 2. La pregunta nombra aplicaciones del diccionario: term directo, sin embedding ni kNN
+    query_embedding = None
+    search_results = None
+    if filters.get('entity_names') and not filters.get('is_numerical'):
+        search_results = lookup_entities(filters)
+        if search_results is not None:
+            filters.pop('exact_name', None)
+            tracing.annotate(route='lookup')
+    
+    if search_results is None:
+        # 3. Parte léxica de la búsqueda (Term + BM25 + Aggs) en paralelo con el embedding
+        lexical_future = start_lexical_search(question, filters)
+    
+        # 4. Crear embedding
+        query_embedding = create_embedding(question)
+        if not query_embedding:
+            logger.error("Falló creación de embedding")
+            if lexical_future is not None:
+                lexical_future.cancel()
+            yield {'type': 'final', 'status': 500, 'answer': validate_response({
+                'answer_type': 'error',
+                'message': 'Error al procesar la pregunta (embedding failed)'
+            })}
+            return
+    
+        with tracing.span('answer_cache'):
+            cached_answer = answer_cache.get_similar(query_embedding, cache_filters)
+        if cached_answer is not None:
+            logger.info(f"[{request_id}] Respuesta servida desde caché (semántica): {answer_cache.stats()}")
+            tracing.annotate(route='semantic_cache')
+            yield {'type': 'final', 'status': 200, 'answer': cached_answer}
+            return
+    
+        # 5. Búsqueda híbrida v6: KNN + fusión con la parte léxica ya en vuelo
+        tracing.annotate(route='rag')
+        search_results = search_opensearch(question, query_embedding, filters, lexical_future=lexical_future)
+        # Latencia de cada recuperador (la léxica corre en otro hilo, fuera de la traza)
+        for name, ms in search_results.get('timings', {}).items():
+            tracing.record(f"search.{name[:-3] if name.endswith('_ms') else name}", ms)
+    
+    # 6. Generar respuesta con Claude (v6: soporte numérico)
+    if stream:
+        final = None
+        for event in generate_response_stream(question, search_results, filters):
+            if event['type'] == 'final':
+                final = event
+            else:
+                yield event
+        structured_answer = final['answer']
+    else:
+        structured_answer = generate_response(question, search_results, filters)
+    
+    # Sólo se cachean respuestas válidas (no errores transitorios)
+    if structured_answer.get('answer_type') in ('success', 'no_results'):
+        answer_cache.set(normalized_question, cache_filters, structured_answer, query_embedding)
+    logger.info(f"[{request_id}] Caché de respuestas: {answer_cache.stats()}")
+    
+    logger.info(f"[{request_id}] Respuesta v6: {structured_answer.get('answer_type')}")
+    tracing.annotate(answer_type=structured_answer.get('answer_type'))
+    logger.info(f"[{request_id}] Caché de embeddings (contenedor): {query_embedding_cache.stats()}")
+    logger.info(f"{'='*60}")
+    
+    yield {'type': 'final', 'status': 200, 'answer': structured_answer}
+
+def log_startup_profile() -> None:
+    """STARTUP_PROFILE=true: perfil de arranque en frío tras la primera invocación del contenedor."""
+    profile = startup.report()
+    if profile:
+        logger.info(json.dumps(profile))
+
+_opensearch_metrics_logged_at = time.monotonic()
+
+def log_opensearch_metrics() -> None:
+    """
+    OPENSEARCH_METRICS=true: cada OPENSEARCH_METRICS_INTERVAL segundos escribe el
+    snapshot del MetricsCollector (una línea JSON) y abre una ventana nueva.
+    """
+    global _opensearch_metrics_logged_at
+    if not OPENSEARCH_METRICS or time.monotonic() - _opensearch_metrics_logged_at < OPENSEARCH_METRICS_INTERVAL:
+        return
+    _opensearch_metrics_logged_at = time.monotonic()
+    snapshot = get_opensearch_metrics().snapshot(reset=True)
+    if snapshot['requests']:
+        logger.info(json.dumps({'opensearch_metrics': snapshot}))
+
+def parse_question(event: Dict) -> str:
+    """Pregunta del body de API Gateway ('' si no viene)."""
+    body = json.loads(event.get('body') or '{}')
+    return body.get('question', '').strip()
+
 def handler(event, context):
     """
     Handler principal de Lambda v6 con exact matching y aggregations.
@@ -857,9 +1658,10 @@ def handler(event, context):
         3. Si conversacional → Claude responde directo
         4. Si RAG:
            a. Extraer filtros (detect exact_name, is_numerical)
-           b. Embedding
-           c. Búsqueda Híbrida v6 (Term + BM25 + KNN + Aggs)
-           d. Generate response (con soporte numérico)
+           b. Lanzar Term + BM25 + Aggs en segundo plano
+           c. Embedding (en paralelo con b)
+           d. KNN y fusión de scores con b
+           e. Generate response (con soporte numérico)
         5. Retornar respuesta estructurada
     
     Args:
@@ -870,37 +1672,25 @@ def handler(event, context):
         HTTP response con JSON estructurado
     """
     request_id = context.aws_request_id if context else "local"
+    tracing.start(request_id)  # QUERY_TRACE=true: spans por etapa y una línea EMF al terminar
     logger.info(f"{'='*60}")
     logger.info(f"[{request_id}] INICIANDO QUERY (v6)")
     logger.info(f"{'='*60}")
     
     try:
         # Parsear body
-        body = json.loads(event.get('body', '{}'))
-        question = body.get('question', '').strip()
+        question = parse_question(event)
+        
+        # Guardar endpoint en S3 (una vez por contenedor, sin bloquear la respuesta)
+        register_endpoint_once()
         
-        # Guardar endpoint en S3
-        endpoint_json = f'endpoints/{ALUMNO_ID}.json'
-        s3.put_object(
-            Bucket=BUCKET,
-            Key=endpoint_json,
-            Body=json.dumps({
-                "nombre-apellido": ALUMNO_ID,
-                "endpoint": API_GATEWAY_ENDPOINT
-            }, indent=2),
-            ContentType='application/json'
-        )
         # Validar input
         if not question:
             logger.warning("Solicitud sin pregunta")
+            tracing.annotate(route='invalid', status=400)
             return {
                 'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type',
-                    'Access-Control-Allow-Methods': 'POST, OPTIONS'
-                },
+                'headers': CORS_HEADERS,
                 'body': json.dumps({
                     'error': 'El campo "question" es requerido'
                 })
@@ -910,63 +1700,23 @@ def handler(event, context):
         question = sanitize_text(question, max_length=500)
         logger.info(f"Pregunta: '{question}'")
         
-        # ========== ROUTING INTELIGENTE ==========
-        if not needs_rag_search(question):
-            logger.info(f"[{request_id}] → CONVERSACIONAL (sin búsqueda)")
-            conversational_response = generate_conversational_response(question)
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type',
-                    'Access-Control-Allow-Methods': 'POST, OPTIONS'
-                },
-                'body': json.dumps(conversational_response, ensure_ascii=False)
-            }
-        
-        # ========== RUTA RAG V6 (Exact + Aggs + Híbrido) ==========
-        logger.info(f"[{request_id}] → RAG v6 (exact + aggs + híbrido)")
+        final = None
+        for final in answer_events(question, request_id):
+            pass
         
-        # 1. Extraer filtros (v6: incluye exact_name, is_numerical)
-        filters = extract_filters_from_question(question)
-        
-        # 2. Crear embedding
-        query_embedding = create_embedding(question)
-        if not query_embedding:
-            logger.error("Falló creación de embedding")
-            return {
-                'statusCode': 500,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(validate_response({
-                    'answer_type': 'error',
-                    'message': 'Error al procesar la pregunta (embedding failed)'
-                }))
-            }
-        
-        # 3. Búsqueda híbrida v6 (Term + BM25 + KNN + Aggs)
-        search_results = search_opensearch(question, query_embedding, filters)
-        
-        # 4. Generar respuesta con Claude (v6: soporte numérico)
-        structured_answer = generate_response(question, search_results, filters)
-        
-        logger.info(f"[{request_id}] Respuesta v6: {structured_answer.get('answer_type')}")
-        logger.info(f"{'='*60}")
+        with tracing.span('serialize'):
+            body = json.dumps(final['answer'], ensure_ascii=False)
+        tracing.annotate(status=final['status'])
         
         return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS'
-            },
-            'body': json.dumps(structured_answer, ensure_ascii=False)
+            'statusCode': final['status'],
+            'headers': tracing.server_timing_headers(CORS_HEADERS),
+            'body': body
         }
         
     except Exception as e:
         logger.error(f"Error inesperado: {e}", exc_info=True)
+        tracing.annotate(status=500)
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -975,5 +1725,65 @@ def handler(event, context):
                 'message': 'Error interno del servidor'
             }))
         }
+    
+    finally:
+        tracing.finish()
+        log_startup_profile()
+        log_opensearch_metrics()
+
+def stream_events(event, context) -> Iterator[bytes]:
+    """
+    Respuesta incremental en NDJSON, un evento JSON por línea, según se genera.
+    
+    Eventos (en orden):
+        {"type": "field", "name": "summary", "value": "..."}
+        {"type": "item", "name": "applications", "index": 0, "value": {...}}
+        {"type": "final", "status": 200, "answer": {...}}   ← siempre el último
+    
+    'final' lleva la misma respuesta validada que devuelve handler. Es un
+    generador: sólo llega incremental al cliente con un host que consuma
+    generadores (benchmarks/offline_pipeline.py --stream mide así el TTFB).
+    En Lambda lo sirve stream_server.py detrás de Lambda Web Adapter
+    (lambda-query-stream, Function URL en modo RESPONSE_STREAM).
+    """
+    request_id = context.aws_request_id if context else "local"
+    tracing.start(request_id)
+    logger.info(f"[{request_id}] INICIANDO QUERY (v6, streaming)")
+    
+    try:
+        question = parse_question(event)
+        register_endpoint_once()
+        
+        if not question:
+            logger.warning("Solicitud sin pregunta")
+            events = iter([{'type': 'final', 'status': 400,
+                            'answer': {'error': 'El campo "question" es requerido'}}])
+        else:
+            question = sanitize_text(question, max_length=500)
+            logger.info(f"Pregunta: '{question}'")
+            events = answer_events(question, request_id, stream=True)
+        
+        for event_ in events:
+            if event_['type'] == 'final':
+                tracing.annotate(status=event_['status'])
+                timing = tracing.server_timing()
+                if timing:
+                    event_['server_timing'] = timing
+            yield (json.dumps(event_, ensure_ascii=False) + '\n').encode('utf-8')
+    
+    except Exception as e:
+        logger.error(f"Error inesperado: {e}", exc_info=True)
+        tracing.annotate(status=500)
+        yield (json.dumps({'type': 'final', 'status': 500, 'answer': validate_response({
+            'answer_type': 'error',
+            'message': 'Error interno del servidor'
+        })}) + '\n').encode('utf-8')
+    
+    finally:
+        tracing.finish()
+        log_startup_profile()
+        log_opensearch_metrics()
+
+startup.ready()
 
 # ==================== FIN DEL CÓDIGO V6 ====================
\ No newline at end of file
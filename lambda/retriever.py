@@ -0,0 +1,186 @@
+"""
+Recuperador local (búsqueda vectorial exacta en memoria)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+El portafolio completo son unos pocos miles de chunks: cabe en una matriz
+float32 contigua. LocalRetriever responde lo mismo que search_opensearch
+(query.py) sin salir del proceso:
+    - pre-filtrado por metadata con índices keyword (valor → filas)
+    - kNN exacto con un producto matricial (mismo orden y escala de score que
+      el space_type del índice: l2 o innerproduct)
+    - total_apps / by_country calculados sobre las filas filtradas
+
+Snapshot (.npz sin pickle), exportado por el indexer a artifacts/:
+    - embeddings: float32 (N x D)
+    - payload: JSON utf-8 con version, generation, space_type, ids, texts y metadata
+"""
+
+import io
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+
+# Campos con índice keyword (los filtros term de query.py + name para exact_name)
+KEYWORD_FIELDS = ('country', 'status', 'critic_name', 'deploy', 'app_type', 'quadrant',
+                  'is_strategic', 'has_drp', 'is_active', 'name')
+
+
+# ==================== SNAPSHOT ====================
+def build_snapshot(ids: List[str], texts: List[str], metadatas: List[Dict],
+                   embeddings: np.ndarray, generation: Optional[str] = None, space_type: str = 'l2') -> bytes:
+    """Serializa el contenido del índice a bytes .npz."""
+    payload = json.dumps({
+        'version': SNAPSHOT_VERSION,
+        'generation': generation,
+        'space_type': space_type,
+        'ids': ids,
+        'texts': texts,
+        'metadata': metadatas,
+    }, ensure_ascii=False).encode('utf-8')
+    buffer = io.BytesIO()
+    np.savez(buffer,
+             embeddings=np.ascontiguousarray(embeddings, dtype=np.float32),
+             payload=np.frombuffer(payload, dtype=np.uint8))
+    return buffer.getvalue()
+
+
+def load_snapshot(data: bytes) -> 'LocalRetriever':
+    """Construye un LocalRetriever desde los bytes de build_snapshot."""
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        embeddings = archive['embeddings']
+        payload = json.loads(archive['payload'].tobytes().decode('utf-8'))
+    if payload.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Versión de snapshot no soportada: {payload.get('version')}")
+    return LocalRetriever(payload['ids'], payload['texts'], payload['metadata'],
+                          embeddings, payload.get('generation'), payload.get('space_type', 'l2'))
+
+
+# ==================== RECUPERADOR ====================
+class LocalRetriever:
+    """Búsqueda exacta sobre una matriz float32 con pre-filtrado por metadata."""
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[Dict],
+                 embeddings: np.ndarray, generation: Optional[str] = None, space_type: str = 'l2'):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.generation = generation
+        self.space_type = space_type
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.norms = np.einsum('ij,ij->i', self.embeddings, self.embeddings)
+        self.id_app = np.array([str(m.get('id_app', '')) for m in metadatas], dtype=object)
+        self.country = np.array([m.get('country') for m in metadatas], dtype=object)
+
+        self.keyword_index: Dict[str, Dict[Any, np.ndarray]] = {}
+        for field in KEYWORD_FIELDS:
+            rows_by_value: Dict[Any, List[int]] = {}
+            for row, metadata in enumerate(metadatas):
+                value = metadata.get(field)
+                if value is not None:
+                    rows_by_value.setdefault(value, []).append(row)
+            self.keyword_index[field] = {value: np.asarray(rows, dtype=np.int64)
+                                         for value, rows in rows_by_value.items()}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _rows(self, field: str, value: Any) -> np.ndarray:
+        return self.keyword_index.get(field, {}).get(value, np.empty(0, dtype=np.int64))
+
+    def filter_rows(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """Filas que cumplen todos los filtros term (None = sin filtros)."""
+        rows = None
+        for field, value in (filters or {}).items():
+            if field not in KEYWORD_FIELDS or field == 'name':
+                continue
+            matched = self._rows(field, value)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+
+    def knn(self, query_embedding: List[float], k: int, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k exacto por distancia l2 (o producto interno) entre las filas indicadas.
+
+        ||x - q||² = ||x||² - 2·x·q + ||q||², así que basta un producto matricial;
+        el score es 1 / (1 + d²) en l2 y 1 + x·q (1 / (1 - x·q) si es negativo)
+        en innerproduct, la misma escala que OpenSearch con faiss.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        matrix, norms = (self.embeddings, self.norms) if rows is None else (self.embeddings[rows], self.norms[rows])
+        if not len(norms):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        products = matrix @ query
+        if self.space_type == 'innerproduct':
+            distances = -products
+        else:
+            distances = norms - 2.0 * products + float(query @ query)
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        selected = top if rows is None else rows[top]
+        if self.space_type == 'innerproduct':
+            best = products[top]
+            return selected, np.where(best >= 0, 1.0 + best, 1.0 / (1.0 - np.minimum(best, 0.0)))
+        return selected, 1.0 / (1.0 + np.maximum(distances[top], 0.0))
+
+    def lookup(self, names: List[str], filters: Optional[Dict] = None, top_k: int = 15) -> Dict:
+        """Filas cuyo name está en names (term directo, sin kNN), con los filtros aplicados."""
+        rows = np.unique(np.concatenate([self._rows('name', name) for name in names] or [np.empty(0, dtype=np.int64)]))
+        scoped = self.filter_rows(filters)
+        if scoped is not None:
+            rows = np.intersect1d(rows, scoped, assume_unique=True)
+        total = len(set(self.id_app[rows])) if len(rows) else 0
+        results = [{'score': 1.0, 'text': self.texts[row], 'metadata': self.metadatas[row]}
+                   for row in rows[:top_k].tolist()]
+        return {
+            'total': total,
+            'results': results,
+            'has_more': total > len(results),
+            'aggregations': {'total_apps': {'value': total}},
+        }
+
+    def search(self, query_embedding: List[float], filters: Optional[Dict] = None, top_k: int = 15,
+               exact_name: Optional[str] = None, is_numerical: bool = False) -> Dict:
+        """
+        Equivalente local de search_opensearch.
+
+        Returns:
+            Dict con 'total', 'results', 'has_more', 'aggregations'
+        """
+        rows = self.filter_rows(filters)
+        scoped = np.arange(len(self.ids)) if rows is None else rows
+        total = len(set(self.id_app[scoped])) if len(scoped) else 0
+
+        aggregations = {'total_apps': {'value': total}}
+        if not is_numerical and filters and 'country' not in filters and len(scoped):
+            values, counts = np.unique(self.country[scoped].astype(str), return_counts=True)
+            order = np.argsort(-counts, kind='stable')[:10]
+            aggregations['by_country'] = {'buckets': [
+                {'key': values[i], 'doc_count': int(counts[i])} for i in order
+            ]}
+
+        if is_numerical:
+            return {'total': total, 'results': [], 'has_more': False, 'aggregations': aggregations}
+
+        selected, scores = self.knn(query_embedding, top_k * 3, rows)
+        scored = {int(row): float(score) for row, score in zip(selected, scores)}
+        if exact_name:
+            # Mismo boost que el term exacto de search_opensearch
+            named = self._rows('name', exact_name)
+            if rows is not None:
+                named = np.intersect1d(named, rows, assume_unique=True)
+            for row in named.tolist():
+                scored[row] = scored.get(row, 0.0) + 10.0
+
+        ranked = sorted(scored.items(), key=lambda item: -item[1])[:top_k]
+        results = [{'score': score, 'text': self.texts[row], 'metadata': self.metadatas[row]}
+                   for row, score in ranked]
+        return {
+            'total': total,
+            'results': results,
+            'has_more': total > len(results),
+            'aggregations': aggregations,
+        }
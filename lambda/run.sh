@@ -0,0 +1,6 @@
+#!/bin/bash
+# Arranque de lambda-query-stream (handler = run.sh): Lambda Web Adapter
+# (AWS_LAMBDA_EXEC_WRAPPER=/opt/bootstrap) ejecuta este script y reenvía cada
+# invocación de la Function URL al servidor de stream_server.py en $PORT
+export PYTHONPATH="/opt/python:${LAMBDA_TASK_ROOT}:${PYTHONPATH}"
+exec python3 "${LAMBDA_TASK_ROOT}/stream_server.py"
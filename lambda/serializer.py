@@ -0,0 +1,263 @@
+"""
+Serializer JSON de los bodies de OpenSearch con embeddings
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+json.dumps escribe cada float de un embedding con repr (hasta 17 dígitos) y es
+la mayor parte del coste de serializar un documento del bulk o una query kNN.
+OpenSearch guarda los knn_vector en float32, y 9 dígitos significativos bastan
+para reproducir exactamente cualquier float32.
+
+VectorJSONSerializer se pasa como serializer= al cliente OpenSearch (indexer.py
+y query.py), así que no depende del opensearchpy instalado (layer/build.sh y
+lambda/build.sh lo reinstalan desde PyPI). Los FloatVector y los ndarray
+float32 de una dimensión se escriben con encode_vector:
+    - json.dumps los recibe por default= y deja en su lugar un marcador
+      aleatorio por llamada (ningún texto del documento puede coincidir)
+    - un único split por el marcador intercala los vectores ya formateados
+      en el orden en que el encoder los pidió
+
+benchmarks/vector_serialization.py compara este camino con el JSONSerializer
+de opensearchpy sobre documentos como los del indexer.
+
+Al deserializar, VectorJSONSerializer.loads acepta además de str los bytes y
+los chunks de una respuesta en streaming (LambdaHttpConnection con
+decode_response / stream_response, ver opensearch_client.py): load_json_stream
+decodifica los hits.hits de search y scroll de uno en uno sin tener nunca el
+cuerpo entero en memoria.
+"""
+
+import codecs
+import json
+import uuid
+from array import array
+from itertools import chain
+from typing import Any, Dict, Iterable, Optional
+
+from opensearchpy import JSONSerializer
+from opensearchpy.compat import string_types
+from opensearchpy.exceptions import SerializationError
+
+VECTOR_FLOAT_FORMAT = '%.9g'  # Precisión float32 (la del knn_vector)
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = ',]}' + _WHITESPACE
+
+
+def encode_vector(values: Any) -> str:
+    """Array JSON de una secuencia de floats (lista, tupla, array o ndarray float32) con precisión float32."""
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    encoded = '[' + ','.join(map(VECTOR_FLOAT_FORMAT.__mod__, array('f', values))) + ']'
+    if 'n' in encoded:  # %g escribe nan / inf, que no son JSON válido
+        raise ValueError('Out of range float values are not JSON compliant')
+    return encoded
+
+
+class FloatVector:
+    """
+    Embedding que VectorJSONSerializer escribe con encode_vector. La forma
+    codificada se calcula una vez y se reutiliza (reintentos, msearch).
+    """
+
+    __slots__ = ('values', '_encoded')
+
+    def __init__(self, values: Any):
+        self.values = values
+        self._encoded: Optional[str] = None
+
+    @property
+    def encoded(self) -> str:
+        if self._encoded is None:
+            self._encoded = encode_vector(self.values)
+        return self._encoded
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __repr__(self) -> str:
+        return f'FloatVector(<{len(self.values)} values>)'
+
+
+def vector_json(value: Any) -> Optional[str]:
+    """JSON de un FloatVector o de un ndarray float32 de una dimensión; None para el resto."""
+    if isinstance(value, FloatVector):
+        return value.encoded
+    # Sin importar numpy: query.py no lo carga si la pregunta no llega al kNN
+    if type(value).__name__ == 'ndarray' and str(value.dtype) == 'float32' and value.ndim == 1:
+        return encode_vector(value)
+    return None
+
+
+class _JSONStreamReader:
+    """
+    Lector JSON incremental sobre chunks de bytes UTF-8. Sólo guarda en memoria
+    la parte sin leer del chunk actual (más un valor partido entre chunks).
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')('surrogatepass')
+        self._decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, wanted: int = 1) -> bool:
+        """Añade al menos wanted caracteres más; False al final de la entrada."""
+        parts = [self.buffer[self.pos:]]
+        read = 0
+        for chunk in self._chunks:
+            text = self._utf8.decode(chunk)
+            parts.append(text)
+            read += len(text)
+            if read >= wanted:
+                break
+        else:
+            parts.append(self._utf8.decode(b'', final=True))
+            self.eof = True
+        self.buffer = ''.join(parts)
+        self.pos = 0
+        return read > 0
+
+    def peek(self) -> str:
+        """Siguiente carácter que no es espacio, sin consumirlo ('' al final)."""
+        while True:
+            buffer, pos = self.buffer, self.pos
+            end = len(buffer)
+            while pos < end and buffer[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < end:
+                return buffer[pos]
+            if self.eof or not self._fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f'Expecting {char!r} at stream offset {self.pos}')
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Siguiente valor JSON completo."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+                # Crece geométricamente para no reparsear un valor grande en cada chunk
+                self._fill(max(len(self.buffer) - self.pos, 1))
+                continue
+            if not self.eof and not isinstance(value, (dict, list, str)):
+                # Un número cortado por el chunk ('1.' o '2e') se decodifica como
+                # otro más corto: sólo vale si le sigue un delimitador
+                if end == len(self.buffer) or self.buffer[end] not in _DELIMITERS:
+                    self._fill()
+                    continue
+            self.pos = end
+            return value
+
+    def object(self, members: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Objeto JSON. members asocia claves a (carácter de apertura, lector): un
+        miembro cuyo valor empieza por ese carácter se lee con su lector en vez
+        de decodificarse de una pieza.
+        """
+        self.expect('{')
+        result: Dict[str, Any] = {}
+        if self.peek() == '}':
+            self.pos += 1
+            return result
+        while True:
+            key = self.value()
+            self.expect(':')
+            opening, reader = members.get(key, ('', None))
+            if reader is not None and self.peek() == opening:
+                result[key] = reader()
+            else:
+                result[key] = self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return result
+            if char != ',':
+                raise ValueError(f"Expecting ',' or '}}' at stream offset {self.pos}")
+
+    def array(self) -> list:
+        """Array JSON, un elemento cada vez."""
+        self.expect('[')
+        items: list = []
+        if self.peek() == ']':
+            self.pos += 1
+            return items
+        while True:
+            items.append(self.value())
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return items
+            if char != ',':
+                raise ValueError(f"Expecting ',' or ']' at stream offset {self.pos}")
+
+
+def load_json_stream(chunks: Iterable[bytes]) -> Any:
+    """
+    Respuesta JSON decodificada desde chunks de bytes UTF-8 (un cuerpo HTTP en
+    streaming) sin tener nunca el documento entero como bytes o str. El
+    resultado es idéntico a json.loads sobre los chunks unidos; los hits.hits
+    de search y scroll se decodifican de uno en uno, así que el pico de memoria
+    queda cerca del tamaño del resultado.
+    """
+    reader = _JSONStreamReader(chunks)
+    if reader.peek() == '{':
+        hits = {'hits': ('[', reader.array)}
+        data = reader.object({'hits': ('{', lambda: reader.object(hits))})
+    else:
+        data = reader.value()
+    if reader.peek():
+        raise ValueError(f'Extra data at stream offset {reader.pos}')
+    return data
+
+
+class VectorJSONSerializer(JSONSerializer):
+    """
+    JSONSerializer de opensearchpy con los vectores escritos por encode_vector
+    en una sola pasada, que deserializa también bytes y respuestas en streaming.
+    """
+
+    def loads(self, s: Any) -> Any:
+        try:
+            if isinstance(s, (str, bytes, bytearray)):
+                return json.loads(s)  # json decodifica los bytes UTF-8 por sí mismo
+            return load_json_stream(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data: Any) -> Any:
+        if isinstance(data, string_types):  # Cuerpos ya serializados (str o bytes)
+            return data
+
+        vectors = []
+        marker = uuid.uuid4().hex
+
+        def default(value: Any) -> Any:
+            encoded = vector_json(value)
+            if encoded is None:
+                return self.default(value)
+            vectors.append(encoded)
+            return marker
+
+        try:
+            serialized = json.dumps(data, default=default, ensure_ascii=False, separators=(',', ':'))
+        except (ValueError, TypeError) as e:
+            raise SerializationError(data, e)
+        if not vectors:
+            return serialized
+        parts = serialized.split(f'"{marker}"')
+        if len(parts) != len(vectors) + 1:
+            raise SerializationError(data, ValueError('vector marker found in the document'))
+        return ''.join(chain.from_iterable(zip(parts, vectors))) + parts[-1]
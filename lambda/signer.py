@@ -0,0 +1,193 @@
+"""
+Firma SigV4 cacheada de las requests a OpenSearch
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+El AWSV4Signer de opensearchpy importa botocore.auth, congela las
+credenciales, construye un AWSRequest y deriva la clave de firma en cada
+request, y hashea el payload dos veces (canonical request y cabecera
+X-Amz-Content-SHA256). En las cargas bulk es varios % de la CPU del cliente.
+
+CachedSigV4Auth (el http_auth de opensearch_client.create_client) firma con
+CachedSigV4Signer, que produce las mismas cabeceras que botocore reutilizando
+lo que no cambia entre requests:
+    - credenciales congeladas durante credentials_ttl segundos, nunca más
+      allá de su expiración (botocore las refresca minutos antes)
+    - clave de firma del día, región y servicio
+    - host, URI y query string canónicos de cada URL (lru_cache)
+    - un único hash del payload; los cuerpos fichero se leen por bloques de 1 MiB
+
+benchmarks/sigv4_signing.py verifica que las cabeceras son idénticas a las de
+botocore y mide la firma por request.
+"""
+
+import hashlib
+import hmac
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import quote, urlencode, urlsplit
+
+from opensearchpy import AWSV4SignerAuth
+from opensearchpy.helpers.signer import AWSV4Signer
+
+EMPTY_SHA256_HASH = hashlib.sha256(b'').hexdigest()
+PAYLOAD_BUFFER = 1024 * 1024
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+def _trim(value: str) -> str:
+    return ' '.join(value.split())
+
+
+def _remove_dot_segments(path: str) -> str:
+    """RFC 3986 5.2.4, colapsando además las barras consecutivas como exige AWS."""
+    output = []
+    for segment in path.split('/'):
+        if segment and segment != '.':
+            if segment == '..':
+                if output:
+                    output.pop()
+            else:
+                output.append(segment)
+    first = '/' if path[0] == '/' else ''
+    last = '/' if path[-1] == '/' and output else ''
+    return first + '/'.join(output) + last
+
+
+@lru_cache(maxsize=1024)
+def canonical_target(url: str, host_header: Optional[str]) -> Tuple[str, str, str]:
+    """Host, URI y query string canónicos de la URL que reconstruye AWSV4Signer._fetch_url (como botocore)."""
+    parts = urlsplit(AWSV4Signer._fetch_url(url, {'host': host_header} if host_header else None))
+
+    host = parts.hostname or ''
+    if ':' in host:
+        host = f'[{host}]'
+    if parts.port is not None and parts.port != {'http': 80, 'https': 443}.get(parts.scheme):
+        host = f'{host}:{parts.port}'
+
+    path = quote(_remove_dot_segments(parts.path) if parts.path else '/', safe='/~')
+
+    query = ''
+    if parts.query:
+        pairs = sorted(pair.partition('=')[::2] for pair in parts.query.split('&'))
+        query = '&'.join(f'{key}={value}' for key, value in pairs)
+    return _trim(host), path, query
+
+
+def payload_hash(body: Any) -> str:
+    """SHA-256 hex del cuerpo en una pasada; los cuerpos fichero se leen por bloques y se rebobinan."""
+    if body is None or body == b'' or body == '':
+        return EMPTY_SHA256_HASH
+    if hasattr(body, 'seek'):
+        position = body.tell()
+        checksum = hashlib.sha256()
+        for chunk in iter(lambda: body.read(PAYLOAD_BUFFER), b''):
+            checksum.update(chunk)
+        body.seek(position)
+        return checksum.hexdigest()
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    elif isinstance(body, dict):
+        body = urlencode(list(body.items()), doseq=True).encode('utf-8')
+    return hashlib.sha256(body).hexdigest()
+
+
+class CachedSigV4Signer(AWSV4Signer):
+    """AWSV4Signer con credenciales, clave de firma, timestamp y URL canónica cacheados."""
+
+    def __init__(self, credentials: Any, region: str, service: str = 'es', credentials_ttl: float = 60):
+        super().__init__(credentials, region, service)
+        self.credentials_ttl = credentials_ttl
+        self._lock = threading.Lock()
+        self._frozen: Any = None
+        self._frozen_until = 0.0
+        self._signing_key: Tuple[str, str, bytes] = ('', '', b'')
+        self._timestamp: Tuple[int, str] = (0, '')
+
+    def sign(self, method: str, url: str, body: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Cabeceras X-Amz-Date, X-Amz-Security-Token, Authorization y X-Amz-Content-SHA256 de la request."""
+        credentials = self._frozen_credentials()
+        timestamp = self._current_timestamp()
+        date = timestamp[:8]
+
+        host_header = next((value for key, value in (headers or {}).items() if key.lower() == 'host'), None)
+        host, path, query = canonical_target(url, host_header)
+        digest = payload_hash(body)
+
+        token = credentials.token
+        if token:
+            signed_headers = 'host;x-amz-date;x-amz-security-token'
+            canonical_headers = f'host:{host}\nx-amz-date:{timestamp}\nx-amz-security-token:{_trim(token)}\n'
+        else:
+            signed_headers = 'host;x-amz-date'
+            canonical_headers = f'host:{host}\nx-amz-date:{timestamp}\n'
+        canonical_request = f'{method.upper()}\n{path}\n{query}\n{canonical_headers}\n{signed_headers}\n{digest}'
+
+        scope = f'{date}/{self.region}/{self.service}/aws4_request'
+        string_to_sign = (f'AWS4-HMAC-SHA256\n{timestamp}\n{scope}\n'
+                          + hashlib.sha256(canonical_request.encode('utf-8')).hexdigest())
+        signature = hmac.new(self._signing_key_for(credentials.secret_key, date),
+                             string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+        signed = {'X-Amz-Date': timestamp}
+        if token:
+            signed['X-Amz-Security-Token'] = token
+        signed['Authorization'] = (f'AWS4-HMAC-SHA256 Credential={credentials.access_key}/{scope}, '
+                                   f'SignedHeaders={signed_headers}, Signature={signature}')
+        signed['X-Amz-Content-SHA256'] = digest
+        return signed
+
+    def _frozen_credentials(self) -> Any:
+        """
+        Credenciales que no cambian durante la firma (get_frozen_credentials:
+        las propiedades de las refrescables pueden refrescarse entre access_key
+        y secret_key). La copia se reutiliza credentials_ttl segundos, acotados
+        a lo que falte para la expiración.
+        """
+        now = time.monotonic()
+        if self._frozen is not None and now < self._frozen_until:
+            return self._frozen
+        freeze = getattr(self.credentials, 'get_frozen_credentials', None)
+        if not callable(freeze):
+            return self.credentials
+        with self._lock:
+            if self._frozen is None or now >= self._frozen_until:
+                self._frozen = freeze()
+                ttl = self.credentials_ttl
+                expiry = getattr(self.credentials, '_expiry_time', None)
+                if expiry is not None and hasattr(expiry, 'timestamp'):
+                    ttl = min(ttl, max(expiry.timestamp() - time.time(), 0.0))
+                self._frozen_until = now + ttl
+            return self._frozen
+
+    def _current_timestamp(self) -> str:
+        """Timestamp SigV4 (YYYYMMDD'T'HHMMSS'Z'), formateado una vez por segundo."""
+        second = int(time.time())
+        cached_second, timestamp = self._timestamp
+        if cached_second != second:
+            timestamp = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(second))
+            self._timestamp = (second, timestamp)
+        return timestamp
+
+    def _signing_key_for(self, secret_key: str, date: str) -> bytes:
+        """Clave de firma derivada del secreto para el día, la región y el servicio."""
+        cached_secret, cached_date, key = self._signing_key
+        if cached_secret != secret_key or cached_date != date:
+            key = _hmac(f'AWS4{secret_key}'.encode('utf-8'), date)
+            key = _hmac(key, self.region)
+            key = _hmac(key, self.service)
+            key = _hmac(key, 'aws4_request')
+            self._signing_key = (secret_key, date, key)
+        return key
+
+
+class CachedSigV4Auth(AWSV4SignerAuth):
+    """AWSV4SignerAuth de opensearchpy (auth de requests) que firma con CachedSigV4Signer."""
+
+    def __init__(self, credentials: Any, region: str, service: str = 'es', credentials_ttl: float = 60):
+        super().__init__(credentials, region, service)
+        self.signer = CachedSigV4Signer(credentials, region, service, credentials_ttl)
@@ -0,0 +1,159 @@
+"""
+Perfil de arranque en frío (STARTUP_PROFILE)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Con STARTUP_PROFILE=true, install() (primera línea de cada Lambda) registra:
+    - import: tiempo acumulado de import de cada módulo vigilado
+      (STARTUP_PROFILE_MODULES), incluidas sus dependencias, como -X importtime
+    - init: tiempo de construcción de cada cliente (timed('client:...'))
+    - ready_ms: desde install() hasta ready() (final del import del Lambda)
+    - total_ms: desde install() hasta report() (final de la primera invocación)
+report() devuelve el perfil (una sola vez) para que el Lambda lo escriba en su log.
+
+Sin la variable, install() no hace nada y timed() es un contexto vacío.
+
+lazy_client convierte una factoría en un getter memoizado: los clientes AWS se
+construyen en su primer uso, no al importar el Lambda.
+
+Uso local (imprime el perfil de cada módulo en un proceso nuevo):
+    STARTUP_PROFILE=true python lambda/startup.py query indexer
+"""
+
+import functools
+import importlib.abc
+import importlib.util
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+STARTUP_PROFILE = os.environ.get('STARTUP_PROFILE', 'false').lower() == 'true'
+STARTUP_PROFILE_MODULES = os.environ.get(
+    'STARTUP_PROFILE_MODULES',
+    'boto3,botocore,s3transfer,opensearchpy,requests,urllib3,charset_normalizer,certifi,numpy,pandas'
+).split(',')
+
+_profile = {'module': None, 'started_at': None, 'ready_ms': None, 'import_ms': {}, 'init_ms': {}, 'reported': False}
+_lock = threading.Lock()
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Delegado que mide exec_module del loader original."""
+
+    def __init__(self, name: str, loader):
+        self.name = name
+        self.loader = loader
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            _profile['import_ms'][self.name] = (time.perf_counter() - start) * 1000
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Finder que envuelve el loader de los módulos vigilados (sólo paquetes de primer nivel)."""
+
+    def __init__(self, names):
+        self.names = set(names)
+        self._resolving = set()
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in self.names or fullname in self._resolving:
+            return None
+        self._resolving.add(fullname)
+        try:
+            spec = importlib.util.find_spec(fullname)
+        finally:
+            self._resolving.discard(fullname)
+        if spec is not None and spec.loader is not None:
+            spec.loader = _TimedLoader(fullname, spec.loader)
+        return spec
+
+
+def lazy_client(factory: Callable) -> Callable:
+    """
+    Memoiza una factoría de clientes: se construye en la primera llamada (no en el
+    import), una sola vez por contenedor aunque la pidan varios hilos a la vez.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    with timed(f"client:{factory.__name__}"):
+                        instance.append(factory())
+        return instance[0]
+
+    get.reset = instance.clear
+    return get
+
+
+def install(module: str) -> None:
+    """Empieza a medir el arranque de `module` (no-op sin STARTUP_PROFILE)."""
+    if not STARTUP_PROFILE or _profile['started_at'] is not None:
+        return
+    _profile.update(module=module, started_at=time.perf_counter())
+    watched = [name for name in STARTUP_PROFILE_MODULES if name and name not in sys.modules]
+    sys.meta_path.insert(0, _ImportTimer(watched))
+
+
+def ready() -> None:
+    """Marca el final del import del Lambda (última línea del módulo)."""
+    if STARTUP_PROFILE and _profile['started_at'] is not None and _profile['ready_ms'] is None:
+        _profile['ready_ms'] = (time.perf_counter() - _profile['started_at']) * 1000
+
+
+@contextmanager
+def timed(phase: str):
+    """Mide una fase de inicialización (construcción de clientes, cargas, ...)."""
+    if not STARTUP_PROFILE:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _profile['init_ms'][phase] = (time.perf_counter() - start) * 1000
+
+
+def report() -> Optional[Dict]:
+    """Perfil de arranque (sólo la primera vez; None si está desactivado o ya se reportó)."""
+    if not STARTUP_PROFILE or _profile['started_at'] is None:
+        return None
+    with _lock:
+        if _profile['reported']:
+            return None
+        _profile['reported'] = True
+    return {
+        'startup_profile': _profile['module'],
+        'ready_ms': round(_profile['ready_ms'], 1) if _profile['ready_ms'] is not None else None,
+        'total_ms': round((time.perf_counter() - _profile['started_at']) * 1000, 1),
+        'import_ms': {name: round(ms, 1) for name, ms in _profile['import_ms'].items()},
+        'init_ms': {name: round(ms, 1) for name, ms in _profile['init_ms'].items()},
+        'not_loaded': [name for name in STARTUP_PROFILE_MODULES if name and name not in sys.modules],
+    }
+
+
+if __name__ == '__main__':
+    import subprocess
+
+    for name in sys.argv[1:] or ['query']:
+        code = f"import json, startup, {name}; print(json.dumps(startup.report()))"
+        env = dict(os.environ, STARTUP_PROFILE='true')
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        print(result.stdout.strip().splitlines()[-1] if result.stdout.strip() else result.stderr.strip())
@@ -0,0 +1,73 @@
+"""
+Servidor HTTP de la respuesta en streaming (query.stream_events)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+El runtime Python gestionado no hace response streaming. La función
+lambda-query-stream (alumno/lambdaquery.tf) lo consigue con Lambda Web Adapter:
+el layer arranca este servidor (run.sh), le reenvía cada invocación de la
+Function URL (invoke_mode RESPONSE_STREAM) como request HTTP y pasa al cliente
+cada fragmento según se escribe.
+
+    POST /   body {"question": "..."} → NDJSON con transfer-encoding chunked,
+             una línea por evento de stream_events en cuanto se genera
+    GET  /   readiness check del adaptador
+
+CORS lo resuelve la configuración de la Function URL. El código HTTP sale del
+primer evento si ya es el 'final' (p.ej. 400 sin pregunta); si no, 200 y el
+'status' del evento 'final'.
+
+Uso local:
+    PORT=8080 python lambda/stream_server.py
+    curl -N -d '{"question": "¿Qué aplicaciones críticas hay en Perú?"}' localhost:8080/
+"""
+
+import itertools
+import json
+import os
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import query
+
+PORT = int(os.environ.get('PORT', '8080'))  # Lambda Web Adapter: AWS_LWA_PORT / PORT
+
+
+def lambda_context(headers) -> SimpleNamespace:
+    """aws_request_id de la invocación (cabecera x-amzn-lambda-context del adaptador)."""
+    try:
+        request_id = json.loads(headers.get('x-amzn-lambda-context') or '{}').get('request_id')
+    except ValueError:
+        request_id = None
+    return SimpleNamespace(aws_request_id=request_id or str(uuid.uuid4()))
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Necesario para transfer-encoding chunked
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        lines = query.stream_events({'body': body.decode('utf-8')}, lambda_context(self.headers))
+        first = next(lines)
+        event = json.loads(first)
+        self.send_response(event['status'] if event['type'] == 'final' else 200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for line in itertools.chain([first], lines):
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass  # query.py ya registra cada request en CloudWatch
+
+
+if __name__ == '__main__':
+    ThreadingHTTPServer(('127.0.0.1', PORT), StreamHandler).serve_forever()
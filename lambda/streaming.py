@@ -0,0 +1,125 @@
+"""
+Emisión incremental de JSON
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Claude genera la respuesta estructurada como un único objeto JSON. Con
+invoke_model_with_response_stream el texto llega en fragmentos; este módulo
+reconoce, sin esperar al cierre del objeto, cuándo un campo de primer nivel
+(p.ej. 'summary') o un elemento de un array de primer nivel (p.ej. cada
+entrada de 'applications') ya está completo, y lo emite como evento.
+
+Eventos:
+    {'type': 'field', 'name': 'summary', 'value': '...'}
+    {'type': 'item', 'name': 'applications', 'index': 0, 'value': {...}}
+
+El texto completo queda en .text para el parseo final (safe_json_parse).
+Se ignora cualquier ruido antes de la primera '{' (```json, frases, etc).
+"""
+
+import json
+from typing import Dict, Iterable, List, Optional
+
+
+# ==================== PARSER INCREMENTAL ====================
+class IncrementalJSONEmitter:
+    """Escáner de caracteres que emite campos/elementos del objeto raíz al completarse."""
+
+    def __init__(self, fields: Iterable[str] = ('summary',), arrays: Iterable[str] = ('applications',)):
+        self.fields = set(fields)
+        self.arrays = set(arrays)
+        self.text = ''
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._expect_key = True
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+        self._array_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+
+    def feed(self, delta: str) -> List[Dict]:
+        """Añade un fragmento de texto y devuelve los eventos que completa."""
+        self.text += delta
+        events = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            c = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key and self._key_start is not None:
+                        self._key = self._loads(text[self._key_start:i + 1])
+                        self._key_start = None
+                continue
+
+            if not self._started:
+                if c == '{':
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._depth == 1 and not self._expect_key and self._value_start is None and not c.isspace():
+                self._value_start = i
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = i
+            elif c in '{[':
+                self._depth += 1
+                if c == '[' and self._depth == 2 and self._key in self.arrays:
+                    self._array_key = self._key
+                    self._item_index = 0
+                elif c == '{' and self._depth == 3 and self._array_key is not None:
+                    self._item_start = i
+            elif c in '}]':
+                self._depth -= 1
+                if self._depth == 2 and c == '}' and self._item_start is not None:
+                    item = self._loads(text[self._item_start:i + 1])
+                    if item is not None:
+                        events.append({'type': 'item', 'name': self._array_key,
+                                       'index': self._item_index, 'value': item})
+                    self._item_index += 1
+                    self._item_start = None
+                elif self._depth == 1 and c == ']':
+                    self._array_key = None
+                elif self._depth == 0:
+                    self._end_value(text, i, events)
+                    self.done = True
+            elif self._depth == 1 and c == ',':
+                self._end_value(text, i, events)
+            elif self._depth == 1 and c == ':':
+                self._expect_key = False
+                self._value_start = None
+
+        self._pos = len(text)
+        return events
+
+    def _end_value(self, text: str, end: int, events: List[Dict]) -> None:
+        """Cierra el par clave/valor de primer nivel en curso."""
+        if self._key in self.fields and self._value_start is not None:
+            value = self._loads(text[self._value_start:end])
+            if value is not None:
+                events.append({'type': 'field', 'name': self._key, 'value': value})
+        self._expect_key = True
+        self._key = None
+        self._value_start = None
+
+    @staticmethod
+    def _loads(fragment: str):
+        try:
+            return json.loads(fragment)
+        except ValueError:
+            return None
@@ -0,0 +1,222 @@
+"""
+Trazas por etapa de cada invocación (QUERY_TRACE)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+Con QUERY_TRACE=true el handler abre una traza por invocación (start) y cada
+etapa se mide con span('nombre') o @traced('nombre'). Los spans se anidan:
+un span abierto dentro de 'generation' se registra como 'generation.bedrock'.
+Las latencias que ya se miden en otro hilo (timings de search_opensearch) se
+añaden con record().
+
+Al terminar, finish() escribe UNA línea JSON en formato EMF (CloudWatch
+Embedded Metric Format): cada span es una métrica en milisegundos con la
+dimensión Route, sin llamadas a la API de CloudWatch. Con
+QUERY_TRACE_SERVER_TIMING=true la respuesta lleva además la cabecera
+Server-Timing ('filters;dur=0.1, embedding;dur=31.2, ...'); en streaming, el
+campo server_timing del evento 'final'. En streaming los spans de generadores
+incluyen el tiempo que el consumidor tarda en enviar cada evento.
+
+Sin la variable, start() devuelve None y span() / @traced cuestan una lectura
+de ContextVar: no hace falta quitar la instrumentación.
+
+Percentiles por span a partir de los logs (una línea EMF por invocación):
+    python lambda/tracing.py < logs.txt
+"""
+
+import functools
+import inspect
+import json
+import os
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+QUERY_TRACE = os.environ.get('QUERY_TRACE', 'false').lower() == 'true'
+QUERY_TRACE_SERVER_TIMING = os.environ.get('QUERY_TRACE_SERVER_TIMING', 'false').lower() == 'true'
+QUERY_TRACE_NAMESPACE = os.environ.get('QUERY_TRACE_NAMESPACE', 'RagQuery')
+
+_current: ContextVar[Optional['Trace']] = ContextVar('trace', default=None)
+_NULL_SPAN = nullcontext()
+
+
+class Trace:
+    """Spans (ms acumulados por ruta) y propiedades de una invocación."""
+
+    __slots__ = ('request_id', 'started', 'spans', 'stack', 'properties')
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.stack = []
+        self.properties: Dict[str, str] = {}
+
+    def add(self, name: str, ms: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera Server-Timing (spans + total hasta ahora)."""
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.spans.items()]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ', '.join(entries)
+
+    def emf(self) -> Dict:
+        """Registro EMF: una métrica por span más 'total', con dimensión Route."""
+        metrics = {name: round(ms, 2) for name, ms in self.spans.items()}
+        metrics['total'] = round(self.elapsed_ms(), 2)
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': QUERY_TRACE_NAMESPACE,
+                    'Dimensions': [['Route']],
+                    'Metrics': [{'Name': name, 'Unit': 'Milliseconds'} for name in metrics],
+                }],
+            },
+            'Route': self.properties.get('route', 'unknown'),
+            'RequestId': self.request_id,
+            **{key: value for key, value in self.properties.items() if key != 'route'},
+            **metrics,
+        }
+
+
+class _Span:
+    """Contexto de un span sobre la traza activa."""
+
+    __slots__ = ('trace', 'name', 'path', 'start')
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        stack = self.trace.stack
+        self.path = f"{stack[-1]}.{self.name}" if stack else self.name
+        stack.append(self.path)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.path, (time.perf_counter() - self.start) * 1000)
+        stack = self.trace.stack
+        # Generadores intercalados (streaming) pueden cerrar fuera de orden
+        if stack and stack[-1] == self.path:
+            stack.pop()
+        elif self.path in stack:
+            stack.remove(self.path)
+        return False
+
+
+def start(request_id: str) -> Optional[Trace]:
+    """Abre la traza de la invocación en curso (None si QUERY_TRACE está desactivado)."""
+    if not QUERY_TRACE:
+        return None
+    trace = Trace(request_id)
+    _current.set(trace)
+    return trace
+
+
+def span(name: str):
+    """Mide un bloque: `with span('embedding'): ...` (no-op sin traza activa)."""
+    trace = _current.get()
+    return _NULL_SPAN if trace is None else _Span(trace, name)
+
+
+def traced(name: str) -> Callable:
+    """Decorador equivalente a span(name) sobre toda la función (también generadores)."""
+    def decorator(fn: Callable) -> Callable:
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator(*args, **kwargs):
+                with span(name):
+                    yield from fn(*args, **kwargs)
+            return generator
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name: str, ms: float) -> None:
+    """Añade una duración medida fuera del span (p.ej. en otro hilo) bajo el span actual."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(f"{trace.stack[-1]}.{name}" if trace.stack else name, ms)
+
+
+def annotate(**properties) -> None:
+    """Propiedades de la invocación (route, status, answer_type...) para el registro EMF."""
+    trace = _current.get()
+    if trace is not None:
+        trace.properties.update({key: str(value) for key, value in properties.items()})
+
+
+def server_timing() -> Optional[str]:
+    """Server-Timing de la traza activa (None salvo con QUERY_TRACE_SERVER_TIMING)."""
+    trace = _current.get()
+    if trace is None or not QUERY_TRACE_SERVER_TIMING:
+        return None
+    return trace.server_timing()
+
+
+def server_timing_headers(headers: Dict) -> Dict:
+    """headers + Server-Timing si QUERY_TRACE_SERVER_TIMING está activo (si no, los mismos headers)."""
+    value = server_timing()
+    if value is None:
+        return headers
+    return dict(headers, **{'Server-Timing': value, 'Timing-Allow-Origin': '*'})
+
+
+def finish() -> Optional[Dict]:
+    """
+    Cierra la traza activa y escribe su línea EMF en stdout.
+
+    Se usa print y no logger: el formato de logging de Lambda antepone nivel,
+    fecha y request id, y CloudWatch sólo extrae métricas de líneas que son
+    exactamente un objeto JSON.
+    """
+    trace = _current.get()
+    if trace is None:
+        return None
+    _current.set(None)
+    record_ = trace.emf()
+    print(json.dumps(record_, ensure_ascii=False, separators=(',', ':')), flush=True)
+    return record_
+
+
+def summarize(lines) -> Dict[str, Dict[str, float]]:
+    """p50/p95/p99 y media por span a partir de líneas de log (ignora las que no son EMF)."""
+    samples: Dict[str, list] = {}
+    for line in lines:
+        line = line.strip()
+        if not line.startswith('{') or '"_aws"' not in line:
+            continue
+        record_ = json.loads(line)
+        for metric in record_['_aws']['CloudWatchMetrics'][0]['Metrics']:
+            samples.setdefault(metric['Name'], []).append(float(record_[metric['Name']]))
+
+    def percentile(values, q):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+    return {name: {'n': len(values), 'mean': sum(values) / len(values),
+                   'p50': percentile(values, 50), 'p95': percentile(values, 95), 'p99': percentile(values, 99)}
+            for name, values in samples.items()}
+
+
+if __name__ == '__main__':
+    import sys
+
+    stats = summarize(sys.stdin)
+    print(f"{'span':<28} {'n':>6} {'media ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, s in sorted(stats.items(), key=lambda item: -item[1]['p99']):
+        print(f"{name:<28} {s['n']:>6} {s['mean']:>9.1f} {s['p50']:>8.1f} {s['p95']:>8.1f} {s['p99']:>8.1f}")
@@ -0,0 +1,137 @@
+"""
+Codificación de los vectores del índice kNN
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+KNN_VECTOR_ENCODING elige cómo guarda faiss cada embedding. La memoria nativa
+del plugin kNN por vector y réplica es ~1.1 · (bytes del vector + 8 · m):
+    - float: float32, 4 bytes por dimensión (6 KB con 1536 dims)
+    - fp16:  cuantización escalar de faiss (encoder sq fp16), 2 bytes por
+             dimensión; el cliente sigue enviando floats. OpenSearch 2.13+
+    - byte:  knn_vector con data_type byte, 1 byte por dimensión; el cliente
+             envía enteros round(x · KNN_BYTE_SCALE) recortados a [-128, 127].
+             OpenSearch 2.17+ (antes data_type byte sólo existía con lucene)
+
+El dominio (shared/opensearch.tf) va en OpenSearch 2.17; en un clúster más
+antiguo la creación del índice con 'fp16' o 'byte' falla con un error de mapping.
+
+Con EMBEDDING_NORMALIZE los vectores se llevan a norma 1 antes de indexar y de
+buscar, y el espacio por defecto pasa a innerproduct (mismo orden que l2 y que
+el coseno sobre vectores unitarios).
+
+indexer.py y query.py deben usar la misma configuración. El mapping no cambia
+sobre un índice existente: cambiarla exige una generación nueva (INDEX_MODE
+bluegreen). benchmarks/vector_quantization.py mide el recall de cada
+codificación sobre nuestros embeddings.
+"""
+
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+VECTOR_ENCODINGS = ('float', 'fp16', 'byte')
+SPACE_TYPES = ('l2', 'innerproduct')
+BYTE_MIN, BYTE_MAX = -128, 127
+BYTES_PER_DIMENSION = {'float': 4, 'fp16': 2, 'byte': 1}
+
+
+def check_encoding(encoding: str, space_type: str) -> None:
+    """Falla pronto (al importar el Lambda) con una configuración no soportada."""
+    if encoding not in VECTOR_ENCODINGS:
+        raise ValueError(f"KNN_VECTOR_ENCODING no soportado: {encoding} (usar {', '.join(VECTOR_ENCODINGS)})")
+    if space_type not in SPACE_TYPES:
+        raise ValueError(f"KNN_SPACE_TYPE no soportado: {space_type} (usar {', '.join(SPACE_TYPES)})")
+
+
+def knn_vector_mapping(dimension: int, encoding: str = 'float', space_type: str = 'l2',
+                       m: int = 16, ef_construction: int = 100, ef_search: int = 100) -> Dict:
+    """Mapping del campo knn_vector (faiss HNSW) para la codificación indicada."""
+    parameters = {"m": m, "ef_construction": ef_construction, "ef_search": ef_search}
+    if encoding == 'fp16':
+        # Los embeddings están muy dentro del rango de fp16: no hace falta recortar
+        parameters["encoder"] = {"name": "sq", "parameters": {"type": "fp16", "clip": False}}
+    mapping = {
+        "type": "knn_vector",
+        "dimension": dimension,
+        "method": {
+            "name": "hnsw",
+            "space_type": space_type,
+            "engine": "faiss",
+            "parameters": parameters
+        }
+    }
+    if encoding == 'byte':
+        mapping["data_type"] = "byte"
+    return mapping
+
+
+def mapping_encoding(mapping: Dict) -> Tuple[str, str]:
+    """(encoding, space_type) de un knn_vector existente (inversa de knn_vector_mapping)."""
+    method = mapping.get("method", {})
+    encoder = method.get("parameters", {}).get("encoder", {})
+    if mapping.get("data_type") == "byte":
+        encoding = 'byte'
+    elif encoder.get("name") == "sq" and encoder.get("parameters", {}).get("type", "fp16") == "fp16":
+        encoding = 'fp16'
+    else:
+        encoding = 'float'
+    return encoding, method.get("space_type", "l2")
+
+
+def normalize(vector: Union[Sequence[float], np.ndarray]) -> np.ndarray:
+    """Vector (o matriz, por filas) float32 de norma 1; los vectores nulos se dejan como están."""
+    values = np.asarray(vector, dtype=np.float32)
+    norms = np.linalg.norm(values, axis=-1, keepdims=True)
+    return values / np.where(norms > 0, norms, 1.0)
+
+
+def quantize(vector: Union[Sequence[float], np.ndarray], scale: float) -> np.ndarray:
+    """Enteros int8 round(x · scale), recortados al rango de data_type byte."""
+    values = np.rint(np.asarray(vector, dtype=np.float32) * scale)
+    return np.clip(values, BYTE_MIN, BYTE_MAX).astype(np.int8)
+
+
+def dequantize(values: Union[Sequence[int], np.ndarray], scale: float) -> np.ndarray:
+    """Inversa aproximada de quantize (para el snapshot del recuperador local)."""
+    return np.asarray(values, dtype=np.float32) / scale
+
+
+def prepare_vector(vector: Union[Sequence[float], np.ndarray], encoding: str = 'float',
+                   normalized: bool = False, byte_scale: float = 1.0) -> Union[np.ndarray, List[int]]:
+    """
+    Embedding tal como lo espera el mapping.
+
+    Returns:
+        ndarray float32 (float / fp16; envolver en serializer.FloatVector) o lista de
+        enteros (byte)
+    """
+    values = normalize(vector) if normalized else np.asarray(vector, dtype=np.float32)
+    if encoding == 'byte':
+        return quantize(values, byte_scale).tolist()
+    return values
+
+
+def knn_score(values: np.ndarray, space_type: str) -> np.ndarray:
+    """Score de faiss en OpenSearch a partir del producto interno (innerproduct) o de la distancia l2²."""
+    values = np.asarray(values, dtype=np.float64)
+    if space_type == 'innerproduct':
+        return np.where(values >= 0, 1.0 + values, 1.0 / (1.0 - np.minimum(values, 0.0)))
+    return 1.0 / (1.0 + values)
+
+
+def byte_score_boost(space_type: str, byte_scale: float) -> float:
+    """
+    boost del knn con data_type byte para llevar su score a la escala float.
+
+    innerproduct: el producto de enteros es byte_scale² veces el de floats y el
+    score 1 + ip crece igual, así que 1 / byte_scale² recupera las diferencias
+    entre documentos (se pierde el +1, común a todos los hits kNN). l2: el score
+    es 1 / (1 + byte_scale² · d²) y ningún factor constante lo corrige (dividir
+    lo hunde aún más), así que no se aplica boost.
+    """
+    return 1.0 / byte_scale ** 2 if space_type == 'innerproduct' else 1.0
+
+
+def native_memory_bytes(vectors: int, dimension: int, encoding: str = 'float', m: int = 16, replicas: int = 0) -> int:
+    """Estimación de memoria nativa del grafo HNSW de faiss (fórmula de la documentación de OpenSearch)."""
+    per_vector = 1.1 * (BYTES_PER_DIMENSION[encoding] * dimension + 8 * m)
+    return int(per_vector * vectors * (replicas + 1))
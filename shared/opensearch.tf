@@ -11,7 +11,9 @@ data "aws_caller_identity" "current" {}
 # OpenSearch Domain
 resource "aws_opensearch_domain" "shared" {
   domain_name    = var.project_name
-  engine_version = "OpenSearch_2.11"
+  # 2.17+: KNN_VECTOR_ENCODING 'byte' (faiss data_type byte) lo exige; 'fp16' (encoder sq), 2.13+.
+  # Subir de versión es un upgrade in situ del dominio
+  engine_version = "OpenSearch_2.17"
 
   cluster_config {
     instance_type          = var.opensearch_instance_type